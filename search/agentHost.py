@@ -0,0 +1,304 @@
+"""
+Runs tag agents in worker processes, so that an agent that crashes, hangs
+or leaks cannot take the game down with it.
+
+A HostedAgent stands in for the real agent in the game process.  The real
+agent lives in a worker process started on the first game.  The layout,
+which never changes during a game, is put once into a
+multiprocessing.shared_memory block that every worker on that layout reads.
+After that, each ply only sends the few fields of a tag state that change
+(positions, directions, the IT flag, cooldown, counters and scores, packed
+with struct), and the worker rebuilds a TagGameState from them.  The
+worker answers with the action and the time the agent spent, so the
+HostedAgent can tell the cost of the round trip apart from the agent's
+thinking.
+
+If no answer arrives in time (the game's MoveBudget, or timeout seconds
+without one), the worker is killed and TimeoutFunctionException is raised,
+which Game.run with catchExceptions treats as a timeout.  The next game
+starts a fresh worker.
+
+> python runTag.py -q -n 20 -l mediumClassic --hostAgents
+"""
+import atexit
+import multiprocessing
+import os
+import select
+import struct
+import time
+import traceback
+from multiprocessing import shared_memory
+from game import Configuration, MoveBudget
+from tagEnv import ACTIONS
+from util import TimeoutFunctionException
+import util
+
+# Messages from the game to a worker start with one of these bytes
+START, PLY, STATS, STOP = b'S', b'P', b'T', b'Q'
+# and answers start with OK or ERROR
+OK, ERROR = b'K', b'E'
+
+# Pacman x, y, direction; ghost x, y, direction, scared timer; IT flag,
+# cooldown, tags, moves; score, Pacman's and the phantom's points; the
+# agent that moved last; the move deadline (time.monotonic(), which all
+# processes share) and the agent's remaining time for the game.
+_PLY = struct.Struct('<2db2dbi?h2i3db2d')
+# Index into ACTIONS and the seconds the agent took
+_ACTION = struct.Struct('<bd')
+_LENGTH = struct.Struct('<I')
+
+class Channel:
+    """
+    One end of a multiprocessing.Pipe carrying length-prefixed messages.  On
+    POSIX systems it reads and writes the pipe's file descriptor directly,
+    which takes a third of the time of Connection.send_bytes, poll and
+    recv_bytes for the small messages sent every ply.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.fd = None
+        if os.name == 'posix' and hasattr(select, 'poll'):
+            self.fd = connection.fileno()
+            self.poller = select.poll()
+            self.poller.register(self.fd, select.POLLIN)
+        self.pending = b''
+
+    def send(self, message):
+        if self.fd == None:
+            self.connection.send_bytes(message)
+            return
+        data = _LENGTH.pack(len(message)) + message
+        while len(data) > 0:
+            data = data[os.write(self.fd, data):]
+
+    def receive(self, timeout=None):
+        """
+        Returns the next message, or None if none arrives within timeout
+        seconds.  Raises EOFError once the other end is closed.
+        """
+        if self.fd == None:
+            if timeout != None and not self.connection.poll(timeout):
+                return None
+            return self.connection.recv_bytes()
+        if timeout != None:
+            deadline = time.monotonic() + timeout
+        while True:
+            if len(self.pending) >= _LENGTH.size:
+                end = _LENGTH.size + _LENGTH.unpack(self.pending[:_LENGTH.size])[0]
+                if len(self.pending) >= end:
+                    message, self.pending = self.pending[_LENGTH.size:end], self.pending[end:]
+                    return message
+            if timeout != None:
+                wait = deadline - time.monotonic()
+                if wait <= 0 or len(self.poller.poll(wait * 1000)) == 0:
+                    return None
+            chunk = os.read(self.fd, 65536)
+            if len(chunk) == 0:
+                raise EOFError()
+            self.pending += chunk
+
+    def close(self):
+        self.connection.close()
+
+_LAYOUTS = {}
+
+def shareLayout(layout):
+    """
+    Returns the name of a shared memory block holding layout's text,
+    creating it the first time the layout is hosted.
+    """
+    key = layout.getFingerprint()
+    if key not in _LAYOUTS:
+        text = '\n'.join(layout.layoutText).encode('utf-8')
+        block = shared_memory.SharedMemory(create=True, size=_LENGTH.size + len(text))
+        block.buf[:_LENGTH.size] = _LENGTH.pack(len(text))
+        block.buf[_LENGTH.size:_LENGTH.size + len(text)] = text
+        _LAYOUTS[key] = block
+    return _LAYOUTS[key].name
+
+def readSharedLayout(name):
+    "Builds a Layout from the shared memory block called name."
+    import layout
+    # Workers share the game process's resource tracker, so attaching here
+    # does not make the block outlive (or die with) this worker
+    block = shared_memory.SharedMemory(name)
+    try:
+        length, = _LENGTH.unpack(bytes(block.buf[:_LENGTH.size]))
+        text = bytes(block.buf[_LENGTH.size:_LENGTH.size + length]).decode('utf-8')
+    finally:
+        block.close()
+    return layout.Layout(text.split('\n'))
+
+@atexit.register
+def releaseLayouts():
+    for block in _LAYOUTS.values():
+        block.close()
+        block.unlink()
+    _LAYOUTS.clear()
+
+def packPly(state, budget):
+    data = state.data
+    pacman, ghost = data.agentStates[0], data.agentStates[1]
+    (pacmanX, pacmanY), (ghostX, ghostY) = pacman.configuration.pos, ghost.configuration.pos
+    deadline, remaining = (budget.deadline, budget.remainingTime) if budget != None else (-1.0, -1.0)
+    return PLY + _PLY.pack(pacmanX, pacmanY, ACTIONS.index(pacman.configuration.direction),
+                           ghostX, ghostY, ACTIONS.index(ghost.configuration.direction), ghost.scaredTimer,
+                           data.pacman_is_it, data.tag_cooldown, data.tag_count, data.move_count,
+                           data.score, data.pacman_score, data.phantom_score,
+                           -1 if data._agentMoved == None else data._agentMoved, deadline, remaining)
+
+def unpackPly(template, message):
+    """
+    Returns (state, budget): a copy of the initial state template moved to
+    the ply packed in message, and the MoveBudget that came with it.
+    """
+    from tagGame import TagGameState
+    (pacmanX, pacmanY, pacmanDirection, ghostX, ghostY, ghostDirection, scaredTimer, pacmanIsIt, cooldown,
+     tags, moves, score, pacmanScore, phantomScore, agentMoved, deadline, remaining) = _PLY.unpack(message)
+    state = TagGameState(template)
+    data = state.data
+    data.agentStates[0].configuration = Configuration((pacmanX, pacmanY), ACTIONS[pacmanDirection])
+    data.agentStates[1].configuration = Configuration((ghostX, ghostY), ACTIONS[ghostDirection])
+    data.agentStates[1].scaredTimer = scaredTimer
+    data.pacman_is_it, data.tag_cooldown, data.tag_count, data.move_count = pacmanIsIt, cooldown, tags, moves
+    data.score, data.pacman_score, data.phantom_score = score, pacmanScore, phantomScore
+    data._agentMoved = None if agentMoved < 0 else agentMoved
+    budget = None
+    if deadline >= 0:
+        budget = MoveBudget(deadline - time.monotonic(), remaining)
+    return state, budget
+
+def hostAgent(connection, agentType, index, agentArgs, mute):
+    "The main loop of a worker process: plays agentType for the game process."
+    from runTag import loadTagAgent
+    from tagGame import TagGameState
+    if mute:
+        util.mutePrint()
+    channel = Channel(connection)
+    agent, template = None, None
+    while True:
+        try:
+            message = channel.receive()
+        except EOFError:
+            break
+        kind, body = message[:1], message[1:]
+        try:
+            if kind == PLY:
+                state, budget = unpackPly(template, body)
+                if budget != None and hasattr(agent, 'setMoveBudget'):
+                    agent.setMoveBudget(budget)
+                start = time.perf_counter()
+                action = agent.getAction(state)
+                channel.send(OK + _ACTION.pack(ACTIONS.index(action), time.perf_counter() - start))
+            elif kind == START:
+                if agent == None:
+                    agent = loadTagAgent(agentType, index, agentArgs)
+                template = TagGameState()
+                template.initialize(readSharedLayout(body.decode()), 1)
+                if hasattr(agent, 'registerInitialState'):
+                    agent.registerInitialState(template.deepCopy())
+                channel.send(OK)
+            elif kind == STATS:
+                stats = agent.getSearchStats() if hasattr(agent, 'getSearchStats') else ''
+                channel.send(OK + stats.encode())
+            elif kind == STOP:
+                break
+        except Exception:
+            channel.send(ERROR + traceback.format_exc().encode())
+
+class HostedAgent:
+    """
+    Plays agentType (a class in tagAgents or ghostAgents, built with the
+    comma separated agentArgs) in a worker process.  A move that takes more
+    than its MoveBudget, or timeout seconds when the game gives none, kills
+    the worker.  With mute, the worker's output is thrown away.
+    """
+    def __init__(self, agentType, index=0, agentArgs=None, timeout=30, mute=False):
+        self.agentType = agentType
+        self.index = index
+        self.agentArgs = agentArgs
+        self.timeout = float(timeout)
+        self.mute = mute
+        self.process = None
+        self.channel = None
+        self.budget = None
+        self.moves = 0
+        self.roundTripTime = 0.0
+        self.agentTime = 0.0
+        self.restarts = 0
+
+    def startWorker(self):
+        connection, workerConnection = multiprocessing.Pipe()
+        self.channel = Channel(connection)
+        self.process = multiprocessing.Process(target=hostAgent, daemon=True,
+            args=(workerConnection, self.agentType, self.index, self.agentArgs, self.mute))
+        self.process.start()
+        workerConnection.close()
+        self.restarts += 1
+
+    def killWorker(self):
+        if self.process != None:
+            self.process.kill()
+            self.process.join()
+            self.channel.close()
+        self.process, self.channel = None, None
+
+    def close(self):
+        "Stops the worker process; call it when no more games will be played."
+        if self.process != None and self.process.is_alive():
+            self.channel.send(STOP)
+            self.process.join(1)
+        self.killWorker()
+
+    def request(self, message, timeout):
+        """
+        Sends message to the worker and returns its answer, killing the
+        worker if none comes within timeout seconds (or if anything, such
+        as the game's own timeout, interrupts the wait).
+        """
+        if self.process == None:
+            raise Exception('The worker of hosted agent %d has been stopped' % self.index)
+        try:
+            self.channel.send(message)
+            answer = self.channel.receive(timeout)
+            if answer == None:
+                raise TimeoutFunctionException()
+        except BaseException:
+            self.killWorker()
+            raise
+        if answer[:1] == ERROR:
+            raise Exception('Hosted agent %s (%d) failed:\n%s' % (self.agentType, self.index, answer[1:].decode()))
+        return answer[1:]
+
+    def registerInitialState(self, state):
+        # Share the layout first: workers must inherit the resource tracker
+        # that owns the block, or the first to exit would unlink it
+        name = shareLayout(state.data.layout)
+        if self.process == None or not self.process.is_alive():
+            self.killWorker()
+            self.startWorker()
+        self.request(START + name.encode(), self.timeout)
+
+    def setMoveBudget(self, budget):
+        self.budget = budget
+
+    def getAction(self, state):
+        budget, self.budget = self.budget, None
+        start = time.perf_counter()
+        answer = self.request(packPly(state, budget), budget.timeLeft() if budget != None else self.timeout)
+        self.roundTripTime += time.perf_counter() - start
+        action, agentTime = _ACTION.unpack(answer)
+        self.agentTime += agentTime
+        self.moves += 1
+        return ACTIONS[action]
+
+    def getSearchStats(self):
+        "The hosting overhead per move, followed by the hosted agent's own stats."
+        overhead = (self.roundTripTime - self.agentTime) / max(self.moves, 1)
+        stats = 'Hosted %s %d: %d moves, %.1f us per move in IPC (%d worker starts)' % \
+            (self.agentType, self.index, self.moves, overhead * 1e6, self.restarts)
+        if self.process != None and self.process.is_alive():
+            remote = self.request(STATS, self.timeout).decode()
+            if remote:
+                stats += '\n  ' + remote
+        return stats
@@ -0,0 +1,255 @@
+"""
+Compares two tag agents with a sequential probability ratio test (SPRT),
+stopping as soon as the games played are conclusive instead of after a
+fixed number.
+
+Games are played in pairs: both candidates take the same role against the
+same opponent from the same random seed, and the pair goes to whichever
+candidate finished with the larger points margin (a tie if equal).  The
+seed is the global random module's (random.seed); agents with generators
+of their own must seed them from it, as MCTSTagAgent does when a game
+starts, and agents that search until a deadline still play differently
+from run to run as timings vary.  The
+SPRT weighs H1 "A wins a decisive pair with probability 0.5 + delta"
+against H0 "... 0.5 - delta" and stops once the log-likelihood ratio
+leaves (log(beta / (1 - alpha)), log((1 - beta) / alpha)).  At the end it
+reports how many pairs a fixed-size test with the same error rates would
+have needed.
+
+> python compareAgents.py -l mediumClassic -a SmartTagGhostAgent -b TagGhostAgent -w 4
+"""
+import math
+import multiprocessing
+import random
+import sys
+import time
+from statistics import NormalDist
+from tagGame import TagGameRules
+import runTag
+import textDisplay
+import util
+
+class SPRT:
+    """
+    Sequential test of "A is better than B" on decisive pairs.  Ties carry
+    no information and are only counted.
+    """
+    def __init__(self, delta=0.1, alpha=0.05, beta=0.05):
+        if not 0 < delta < 0.5:
+            raise Exception('delta must be between 0 and 0.5, not %s' % delta)
+        self.p0, self.p1 = 0.5 - delta, 0.5 + delta
+        self.alpha, self.beta = alpha, beta
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.llr = 0.0
+        self.wins = self.losses = self.ties = 0
+
+    def update(self, outcome):
+        "Adds one pair: 1 if A won it, -1 if B did, 0 for a tie."
+        if outcome > 0:
+            self.wins += 1
+            self.llr += math.log(self.p1 / self.p0)
+        elif outcome < 0:
+            self.losses += 1
+            self.llr += math.log((1 - self.p1) / (1 - self.p0))
+        else:
+            self.ties += 1
+
+    def getDecision(self):
+        "'A' or 'B' once the test has picked the better agent, else None."
+        if self.llr >= self.upper:
+            return 'A'
+        if self.llr <= self.lower:
+            return 'B'
+        return None
+
+    def getWinRate(self):
+        "A's share of the decisive pairs and its 95% (Wilson) interval."
+        n = self.wins + self.losses
+        if n == 0:
+            return 0.5, 0.0, 1.0
+        p, z = self.wins / float(n), 1.96
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return p, center - spread, center + spread
+
+    def getFixedSampleSize(self):
+        """
+        Decisive pairs a fixed-size one-sided test of p0 against p1 needs
+        for the same alpha and beta.
+        """
+        normal = NormalDist()
+        za, zb = normal.inv_cdf(1 - self.alpha), normal.inv_cdf(1 - self.beta)
+        spread = za * math.sqrt(self.p0 * (1 - self.p0)) + zb * math.sqrt(self.p1 * (1 - self.p1))
+        return int(math.ceil((spread / (self.p1 - self.p0)) ** 2))
+
+class RunningMean:
+    "Mean and standard error of a stream of numbers (Welford's method)."
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.squares = 0.0
+
+    def add(self, value):
+        self.count += 1
+        change = value - self.mean
+        self.mean += change / self.count
+        self.squares += change * (value - self.mean)
+
+    def getStandardError(self):
+        if self.count < 2:
+            return float('inf')
+        return math.sqrt(self.squares / (self.count - 1) / self.count)
+
+_MATCH = None
+
+def setUpMatch(layoutName, role, opponent, opponentArgs, candidates, maxTags, maxMoves):
+    """
+    Builds the layout, rules and agents of one process once, so that every
+    pair it plays reuses them (and their caches), like runTag.runTagGames.
+    """
+    global _MATCH
+    layoutObj = runTag.loadLayout(layoutName)
+    candidateIndex = 0 if role == 'pacman' else 1
+    util.mutePrint()
+    try:
+        opponentAgent = runTag.loadTagAgent(opponent, 1 - candidateIndex, opponentArgs)
+        agents = [runTag.loadTagAgent(name, candidateIndex, args) for name, args in candidates]
+    finally:
+        util.unmutePrint()
+    _MATCH = {'layout': layoutObj, 'index': candidateIndex, 'opponent': opponentAgent, 'candidates': agents,
+              'rules': TagGameRules(maxTags=maxTags, maxMoves=maxMoves), 'display': textDisplay.NullGraphics()}
+
+def playPair(seed):
+    """
+    Plays both candidates from seed (random.seed before each game) and
+    returns ([margin of A, margin of B], [A won, B won], plies), margins
+    being the candidate's points minus its opponent's.
+    """
+    match = _MATCH
+    margins, wins, plies = [], [], 0
+    for candidate in match['candidates']:
+        if match['index'] == 0:
+            pacmanAgent, ghostAgent = candidate, match['opponent']
+        else:
+            pacmanAgent, ghostAgent = match['opponent'], candidate
+        random.seed(seed)
+        game = match['rules'].newGame(match['layout'], pacmanAgent, [ghostAgent], match['display'], quiet=True)
+        game.muteAgents = True
+        util.mutePrint()
+        try:
+            game.run()
+        finally:
+            util.unmutePrint()
+        data = game.state.data
+        margin = data.pacman_score - data.phantom_score
+        margins.append(margin if match['index'] == 0 else -margin)
+        wins.append(getattr(game, 'winner', None) == ('PACMAN' if match['index'] == 0 else 'PHANTOM'))
+        plies += data.move_count
+    return margins, wins, plies
+
+def compare(layoutName, candidates, role='ghost', opponent=None, opponentArgs=None, workers=1,
+            maxPairs=2000, delta=0.1, alpha=0.05, beta=0.05, maxTags=10, maxMoves=1000, seed=0,
+            reportEvery=0):
+    """
+    Plays pairs of games (seeds seed, seed + 1, ...) until the SPRT decides
+    or maxPairs have been played, and returns (test, scoreDifference,
+    pairsPlayed, candidateWins, seconds, plies).  Results are consumed in seed
+    order, so a run is reproducible whatever the number of workers.
+    """
+    if opponent == None:
+        opponent = 'TagPacmanAgent' if role == 'ghost' else 'TagGhostAgent'
+    matchArgs = (layoutName, role, opponent, opponentArgs, candidates, maxTags, maxMoves)
+    test, difference = SPRT(delta, alpha, beta), RunningMean()
+    candidateWins, played, plies = [0, 0], 0, 0
+    startTime = time.time()
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, setUpMatch, matchArgs)
+        results = pool.imap(playPair, range(seed, seed + maxPairs))
+    else:
+        setUpMatch(*matchArgs)
+        results = (playPair(s) for s in range(seed, seed + maxPairs))
+    try:
+        for margins, wins, pairPlies in results:
+            played += 1
+            plies += pairPlies
+            test.update((margins[0] > margins[1]) - (margins[0] < margins[1]))
+            difference.add(margins[0] - margins[1])
+            candidateWins = [total + won for total, won in zip(candidateWins, wins)]
+            if reportEvery > 0 and played % reportEvery == 0:
+                rate, low, high = test.getWinRate()
+                print('%5d pairs: A %d, B %d, ties %d | A wins %.3f [%.3f, %.3f] | margin A-B %.1f +- %.1f | LLR %.2f in (%.2f, %.2f)' %
+                      (played, test.wins, test.losses, test.ties, rate, low, high, difference.mean,
+                       difference.getStandardError(), test.llr, test.lower, test.upper))
+            if test.getDecision() != None:
+                break
+    finally:
+        if pool != None:
+            pool.terminate()
+    return test, difference, played, candidateWins, time.time() - startTime, plies
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python compareAgents.py -a AGENT_A -b AGENT_B [options]')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the LAYOUT to play on [Default: %default]')
+    parser.add_option('-a', '--agentA', dest='agentA', help='the first candidate TYPE')
+    parser.add_option('-b', '--agentB', dest='agentB', help='the second candidate TYPE')
+    parser.add_option('--argsA', dest='argsA', help='comma separated arguments for agent A')
+    parser.add_option('--argsB', dest='argsB', help='comma separated arguments for agent B')
+    parser.add_option('-r', '--role', dest='role', type='choice', choices=['ghost', 'pacman'], default='ghost',
+                      help='the side both candidates play [Default: %default]')
+    parser.add_option('-o', '--opponent', dest='opponent', default=None,
+                      help='the agent TYPE they play against [Default: TagPacmanAgent or TagGhostAgent]')
+    parser.add_option('--opponentArgs', dest='opponentArgs', help='comma separated arguments for the opponent')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=1,
+                      help='processes playing games [Default: %default]')
+    parser.add_option('-n', '--maxPairs', dest='maxPairs', type='int', default=2000,
+                      help='stop after this many pairs even if undecided [Default: %default]')
+    parser.add_option('-d', '--delta', dest='delta', type='float', default=0.1,
+                      help='H0/H1 win rates of decisive pairs are 0.5 -/+ delta [Default: %default]')
+    parser.add_option('--alpha', dest='alpha', type='float', default=0.05,
+                      help='chance of wrongly picking A [Default: %default]')
+    parser.add_option('--beta', dest='beta', type='float', default=0.05,
+                      help='chance of wrongly picking B [Default: %default]')
+    parser.add_option('--maxTags', dest='maxTags', type='int', default=10,
+                      help='maximum tags per game [Default: %default]')
+    parser.add_option('--maxMoves', dest='maxMoves', type='int', default=1000,
+                      help='maximum moves per game [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='seed of the first pair [Default: %default]')
+    parser.add_option('--report', dest='report', type='int', default=10,
+                      help='print the running estimates every REPORT pairs (0 for never) [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    if options.agentA == None or options.agentB == None:
+        raise Exception('Give both candidates with -a and -b')
+    return options
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    candidates = [(options.agentA, options.argsA), (options.agentB, options.argsB)]
+    test, difference, played, wins, seconds, plies = compare(
+        options.layout, candidates, options.role, options.opponent, options.opponentArgs, options.workers,
+        options.maxPairs, options.delta, options.alpha, options.beta, options.maxTags, options.maxMoves,
+        options.seed, options.report)
+    decision = test.getDecision()
+    rate, low, high = test.getWinRate()
+    print('\n=== Comparison ===')
+    print('A: %s, B: %s (%s side, %d pairs in %.1fs, %.0f plies/sec)' %
+          (options.agentA, options.agentB, options.role, played, seconds, plies / max(seconds, 1e-9)))
+    print('Game wins:      A %d/%d, B %d/%d' % (wins[0], played, wins[1], played))
+    print('Decisive pairs: A %d, B %d, ties %d; A wins %.3f [%.3f, %.3f]' % (test.wins, test.losses, test.ties, rate, low, high))
+    print('Margin A - B:   %.1f +- %.1f points per game' % (difference.mean, difference.getStandardError()))
+    if decision == None:
+        print('Undecided after %d pairs (LLR %.2f in (%.2f, %.2f))' % (played, test.llr, test.lower, test.upper))
+    else:
+        fixedDecisive = test.getFixedSampleSize()
+        decisiveShare = (test.wins + test.losses) / float(played)
+        fixedPairs = int(math.ceil(fixedDecisive / max(decisiveShare, 1e-9)))
+        print('%s is better (LLR %.2f, alpha %.2f, beta %.2f, delta %.2f)' %
+              (options.agentA if decision == 'A' else options.agentB, test.llr, options.alpha, options.beta, options.delta))
+        print('A fixed-size test needs %d decisive pairs (about %d pairs here); saved %d pairs (%.0f%%)' %
+              (fixedDecisive, fixedPairs, max(0, fixedPairs - played), 100.0 * max(0, fixedPairs - played) / fixedPairs))
@@ -0,0 +1,126 @@
+"""
+Corridor skipping: the plies of a tag game in which neither player has a
+choice are played several at a time, without asking the agents or building
+the states in between.
+
+Most plies of a tag game are both players walking down corridors.  An agent
+that follows corridors (followsCorridors, such as TagPacmanAgent and
+TagGhostAgent with corridors=1) never stops or turns back where it has
+another move, and its getAction plays that only move without touching its
+own state or the random numbers.  Asking it adds nothing there.  When both
+agents follow corridors, a FastGame with a CorridorSkipper advances the
+game by a macro-step of k plies whenever
+
+  - both players' forced moves last k plies (TagModel.getCorridorLength),
+  - no tag can happen in them: the players never come within TAG_DISTANCE
+    once the cooldown is over (inside it a tag is ignored anyway), and
+  - neither the move limit nor the winning score is reached,
+
+and agents are asked again from the ply after it, which the rules play as
+usual.  Games then end exactly as they do played ply by ply: the moves,
+scores and final states are the same, only agent timings and decision
+cache statistics change (tests/test_corridors.py checks this).
+
+> python runTag.py -q -n 200 -l mediumClassic --skipCorridors -p TagPacmanAgent --pacmanArgs corridors=1 -g TagGhostAgent --ghostArgs corridors=1
+"""
+from game import Actions
+from pacman import PacmanRules, GhostRules, TIME_PENALTY
+from tagGame import TagGameRules, TagGameState, TAG
+import gameLog
+import tagModel
+
+SPEEDS = [PacmanRules.PACMAN_SPEED, GhostRules.GHOST_SPEED]
+
+class CorridorSkipper:
+    "Plays the forced plies of tag games on one layout in macro-steps (set it as a FastGame's skipper)."
+    def __init__(self, layout):
+        self.model = tagModel.getModel(layout)
+        self.steps = 0
+        self.plies = 0
+
+    def canSkip(self, game):
+        """
+        Whether game's plies can be skipped: both agents follow corridors and
+        take turns, and nothing needs the states in between (the rules are
+        quiet, with no recorder, and the game's log, if any, only keeps
+        actions).
+        """
+        return (len(game.agents) == 2 and all(getattr(agent, 'followsCorridors', False) for agent in game.agents) and
+                game.scheduler == None and game.rules.quiet and getattr(game.rules, 'recorder', None) == None and
+                not isinstance(game.log, gameLog.GameLog))
+
+    def getMacroStep(self, state, agentIndex, maxMoves):
+        """
+        How many plies from agentIndex's move on no agent has a choice in,
+        within the move limit.  Tags and the winning score can cut them short.
+        """
+        model, data = self.model, state.data
+        configuration = data.agentStates[agentIndex].configuration
+        run = model.getCorridorLength(model.cellIndex[configuration.pos], configuration.direction)
+        if run == 0:
+            return 0
+        configuration = data.agentStates[1 - agentIndex].configuration
+        otherRun = model.getCorridorLength(model.cellIndex[configuration.pos], configuration.direction)
+        # Plies alternate, starting with agentIndex's
+        return min(2 * run, 2 * otherRun + 1, maxMoves - data.move_count - 1)
+
+    def skip(self, game, agentIndex):
+        """
+        Plays a macro-step on game from agentIndex's move on, if there is
+        one, and returns the index of the agent to move next.
+        """
+        state = game.state
+        plies = self.getMacroStep(state, agentIndex, game.rules.maxMoves)
+        if plies < 1:
+            return agentIndex
+        model, data = self.model, state.data
+        configurations = [agentState.configuration for agentState in data.agentStates]
+        cells = [model.cellIndex[configuration.pos] for configuration in configurations]
+        score, pacmanIsIt, cooldown = data.score, data.pacman_is_it, data.tag_cooldown
+        pacmanScore, phantomScore = data.pacman_score, data.phantom_score
+        moveHistory, log = game.moveHistory, game.log
+        played = 0
+        for ply in range(plies):
+            mover = (agentIndex + ply) % 2
+            configuration = configurations[mover]
+            action = model.getForcedMove(cells[mover], configuration.direction)
+            moved = configuration.generateSuccessor(Actions.directionToVector(action, SPEEDS[mover]))
+            positions = [configurations[0].pos, configurations[1].pos]
+            positions[mover] = moved.pos
+            # Plies with a tag or a win are left to the rules
+            step = TagGameRules.tagStep(positions[0], positions[1], pacmanIsIt, cooldown, pacmanScore, phantomScore)
+            if step[0] == TAG or TagGameRules.getScoreWinner(step[3], step[4]) != None:
+                break
+            event, pacmanIsIt, cooldown, pacmanScore, phantomScore = step
+            configurations[mover] = moved
+            cells[mover] = model.moves[cells[mover]][action]
+            if mover == 0:
+                score += -TIME_PENALTY
+            moveHistory.append((mover, action))
+            if log != None:
+                log.record(mover, action)
+            played += 1
+        if played == 0:
+            return agentIndex
+
+        successor = TagGameState(state)
+        newData = successor.data
+        for agentState, configuration in zip(newData.agentStates, configurations):
+            agentState.configuration = configuration
+        newData.agentStates[1].scaredTimer = TagGameRules.getScaredTimer(pacmanIsIt)
+        newData.move_count += played
+        newData.tag_cooldown = cooldown
+        newData.pacman_score, newData.phantom_score = pacmanScore, phantomScore
+        newData.score = score
+        lastMover = (agentIndex + played - 1) % 2
+        newData._agentMoved = lastMover
+        newData.scoreChange = -TIME_PENALTY if lastMover == 0 else 0
+        game.state = successor
+        game.display.update(newData)
+        self.steps += 1
+        self.plies += played
+        return (lastMover + 1) % 2
+
+    def getStats(self):
+        return 'Corridors: %d plies skipped in %d macro-steps (%.1f plies each)' % \
+            (self.plies, self.steps, self.plies / float(max(self.steps, 1)))
@@ -0,0 +1,126 @@
+"""
+Flow fields: one breadth-first search from a target serves every agent
+chasing it.
+
+A FlowField holds the maze distance from its target to every cell.  An
+agent anywhere on the map reads its best move in O(1) by comparing the
+distances of the cells its legal moves lead to, so any number of ghosts can
+chase the same Pacman for the price of a single search per tick.
+
+When the target takes one step, no distance changes by more than one.  The
+field then adds one to every distance at once, through a shared offset,
+and repairs only the cells that got closer with a search from the new
+target cell that stops wherever the old distance plus one is still right.
+Fields are shared through getFlowField, keyed by layout and target name.
+"""
+from game import Actions
+import tagModel
+
+INFINITY = float('inf')
+
+class FlowField:
+    """
+    Maze distances to a moving target on one layout.  The true distance of
+    cell c is self.stored[c] + self.offset.
+    """
+    def __init__(self, layout):
+        self.model = tagModel.getModel(layout)
+        self.target = None
+        self.stored = [INFINITY] * self.model.numCells
+        self.offset = 0
+        self.fullSearches = 0
+        self.incrementalUpdates = 0
+        self.cellsUpdated = 0
+
+    def setTarget(self, position):
+        """
+        Points the field at the cell nearest position.  Calling it again for
+        the same cell is free, so every agent reading the field may call it.
+        """
+        cell = self.model.cellOf(position)
+        if cell == self.target:
+            return
+        if self.target != None and cell in self.model.neighbors[self.target]:
+            self.moveTarget(cell)
+        else:
+            self.search(cell)
+
+    def search(self, cell):
+        "Recomputes the whole field from scratch for a target at cell."
+        stored = [INFINITY] * self.model.numCells
+        stored[cell] = 0
+        frontier = [cell]
+        neighbors = self.model.neighbors
+        for current in frontier:
+            nextDistance = stored[current] + 1
+            for neighbor in neighbors[current]:
+                if stored[neighbor] == INFINITY:
+                    stored[neighbor] = nextDistance
+                    frontier.append(neighbor)
+        self.stored = stored
+        self.offset = 0
+        self.target = cell
+        self.fullSearches += 1
+        self.cellsUpdated += len(frontier)
+
+    def moveTarget(self, cell):
+        """
+        Updates the field for a target that stepped to the adjacent cell.
+        Every old distance plus one is an upper bound on the new one; the
+        cells that do better are exactly those reached from the new target
+        through other cells that do better.
+        """
+        self.offset += 1
+        stored, offset = self.stored, self.offset
+        neighbors = self.model.neighbors
+        stored[cell] = -offset
+        frontier = [cell]
+        for current in frontier:
+            nextDistance = stored[current] + offset + 1
+            for neighbor in neighbors[current]:
+                if nextDistance < stored[neighbor] + offset:
+                    stored[neighbor] = nextDistance - offset
+                    frontier.append(neighbor)
+        self.target = cell
+        self.incrementalUpdates += 1
+        self.cellsUpdated += len(frontier)
+
+    def getDistance(self, position):
+        "Maze distance from position (rounded to a cell) to the target."
+        return self.stored[self.model.cellOf(position)] + self.offset
+
+    def getActionDistances(self, position, actions):
+        """
+        Returns the target distance after each action from position.  Off-grid
+        positions (slow ghosts) count the cell a whole step away.
+        """
+        stored, offset, model = self.stored, self.offset, self.model
+        x, y = position
+        distances = []
+        for action in actions:
+            dx, dy = Actions.directionToVector(action)
+            cell = model.cellIndex.get((int(x + dx + 0.5), int(y + dy + 0.5)))
+            distances.append(INFINITY if cell == None else stored[cell] + offset)
+        return distances
+
+    def getAction(self, position, actions):
+        "The first of actions that gets closest to the target."
+        distances = self.getActionDistances(position, actions)
+        return actions[distances.index(min(distances))]
+
+    def getStats(self):
+        updates = self.fullSearches + self.incrementalUpdates
+        return 'Flow field: %d full searches, %d incremental updates, %.1f cells per update' % \
+            (self.fullSearches, self.incrementalUpdates, self.cellsUpdated / float(max(1, updates)))
+
+_FIELDS = {}
+
+def getFlowField(layout, name='pacman'):
+    """
+    Returns the flow field called name on layout, shared by every agent in
+    the process that asks for the same one.
+    """
+    key = (layout.getFingerprint(), name)
+    if key not in _FIELDS:
+        _FIELDS[key] = FlowField(layout)
+    return _FIELDS[key]
@@ -24,6 +24,8 @@ from util import *
 import time, os
 import traceback
 import sys
+import heapq
+from fractions import Fraction
 
 #######################
 # Parts worth reading #
@@ -35,6 +37,9 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+    def setMoveBudget(self, budget): # receives a MoveBudget before each getAction
+    def startPondering(self, state): # may think in the background; returns True if it does
+    def stopPondering(self): # must stop thinking before its next getAction
     """
     def __init__(self, index=0):
         self.index = index
@@ -212,8 +217,9 @@ class Grid:
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
+        # Skips __init__, which would build a grid only to throw it away
+        g = Grid.__new__(Grid)
+        g.__dict__.update(self.__dict__)
         return g
 
     def count(self, item =True ):
@@ -504,6 +510,160 @@ class GameStateData:
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
 
+class MoveBudget:
+    """
+    The time an agent has for its next move, handed to agents that define
+    setMoveBudget(budget) just before each call to getAction.
+
+    moveTime is what is left of the per-move limit (the move timeout, or the
+    warning time if that is shorter), remainingTime what is left of the
+    agent's total time for the game, and deadline the time.monotonic() value
+    by which the move should be returned.
+    """
+    def __init__(self, moveTime, remainingTime, startTime=None):
+        if startTime == None: startTime = time.monotonic()
+        self.moveTime = moveTime
+        self.remainingTime = remainingTime
+        self.deadline = startTime + max(0, min(moveTime, remainingTime))
+
+    def timeLeft(self):
+        "Seconds until the deadline (never negative)."
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def __str__(self):
+        return 'MoveBudget(move %.3fs, total %.3fs, %.3fs left)' % (self.moveTime, self.remainingTime, self.timeLeft())
+
+class SpilledMoveHistory:
+    """
+    A moveHistory for very long games.  The last memoryMoves to
+    2 * memoryMoves moves stay in a list; older ones are appended to a file,
+    one byte per move: the agent's index times len(ACTIONS) plus the
+    action's index in ACTIONS.  The file is a temporary one unless path is
+    given, which must not exist yet (so games never overwrite each other's
+    histories).  Indexing (with slices), len() and iteration work as on a
+    list, reading spilled moves back from the file.
+
+    Game.run closes the history when the game ends, releasing the file.
+    The moves spilled to a temporary file are gone from then on; those
+    spilled to path can still be read.
+    """
+    ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+
+    def __init__(self, memoryMoves=4096, path=None):
+        self.memoryMoves = memoryMoves
+        self.path = path
+        self.file = None  # Opened on the first spill, so short games need no file
+        self.closed = False
+        self.spilled = 0
+        self.recent = []
+
+    def append(self, move):
+        self.recent.append(move)
+        if len(self.recent) >= 2 * self.memoryMoves:
+            actions = SpilledMoveHistory.ACTIONS
+            if self.file == None:
+                if self.closed:
+                    raise ValueError('Moves added to a closed move history')
+                import tempfile
+                self.file = open(self.path, 'xb+') if self.path != None else tempfile.TemporaryFile()
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(bytes([agentIndex * len(actions) + actions.index(action)
+                                   for agentIndex, action in self.recent[:self.memoryMoves]]))
+            self.spilled += self.memoryMoves
+            del self.recent[:self.memoryMoves]
+
+    def decode(self, code):
+        return code // len(SpilledMoveHistory.ACTIONS), SpilledMoveHistory.ACTIONS[code % len(SpilledMoveHistory.ACTIONS)]
+
+    def readSpilled(self, start, count):
+        "The codes of count spilled moves from start on."
+        if self.file != None:
+            self.file.seek(start)
+            return self.file.read(count)
+        if self.path == None:
+            raise ValueError('The spilled moves of a closed move history without a path are gone')
+        f = open(self.path, 'rb')
+        try:
+            f.seek(start)
+            return f.read(count)
+        finally:
+            f.close()
+
+    def __len__(self):
+        return self.spilled + len(self.recent)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('move history index out of range')
+        if index >= self.spilled:
+            return self.recent[index - self.spilled]
+        return self.decode(self.readSpilled(index, 1)[0])
+
+    def __iter__(self):
+        for start in range(0, self.spilled, 65536):
+            for code in self.readSpilled(start, min(65536, self.spilled - start)):
+                yield self.decode(code)
+        for move in self.recent[:]:
+            yield move
+
+    def close(self):
+        self.closed = True
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+class SpeedScheduler:
+    """
+    Decides who moves next by speed instead of in strict turns.  An event
+    queue holds the time at which each agent acts next; an agent of speed s
+    acts every 1 / s time units, so a slower agent simply acts less often
+    and every move still goes a whole cell.  getSpeed(state, agentIndex)
+    gives an agent's speed (a positive number of moves per time unit) after
+    each of its moves, so speeds can depend on the state, such as on who is
+    IT in tag.  Times are exact fractions and ties go to the agents in turn
+    order from the starting agent, so agents of equal speed alternate just
+    like Game's round robin.
+
+    Classic Pacman's scared ghosts are not scheduled this way: they still
+    move every turn with half-length vectors (GhostRules), since their
+    scared timer counts their moves and moving them half as often would
+    keep them scared twice as long.
+    """
+    def __init__(self, getSpeed):
+        self.getSpeed = getSpeed
+        self.periods = {}
+        self.time = 0
+
+    def start(self, state, numAgents, startingIndex=0):
+        "Schedules every agent at time 0; returns the index of the agent to move first."
+        self.time = Fraction(0)
+        self.queue = [(self.time, (agentIndex - startingIndex) % numAgents, agentIndex) for agentIndex in range(numAgents)]
+        heapq.heapify(self.queue)
+        return self.queue[0][2]
+
+    def next(self, state, agentIndex):
+        """
+        Schedules agentIndex, which just moved to reach state, for its next
+        move; returns the index of the agent to move next.
+        """
+        actTime, turn, index = heapq.heappop(self.queue)
+        speed = self.getSpeed(state, agentIndex)
+        period = self.periods.get(speed)
+        if period == None:
+            if speed <= 0:
+                raise Exception('Agent %d has speed %s; speeds must be positive' % (agentIndex, speed))
+            period = self.periods[speed] = 1 / Fraction(speed).limit_denominator(1000)
+        heapq.heappush(self.queue, (actTime + period, turn, index))
+        self.time = self.queue[0][0]
+        return self.queue[0][2]
+
 try:
     import boinc
     _BOINC_ENABLED = True
@@ -525,8 +685,12 @@ class Game:
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
         self.moveHistory = []
+        self.log = None  # e.g. a gameLog.GameLog, given every ply once it is processed
+        self.scheduler = None  # e.g. a SpeedScheduler; without one the agents take turns
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
+        self.totalPonderTimes = [0 for agent in agents]
+        self.ponderStartTimes = [None for agent in agents]
         self.agentTimeout = False
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
@@ -544,9 +708,56 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
+    def getMoveBudget(self, agentIndex, timeUsed=0):
+        "The MoveBudget for agentIndex's next move, timeUsed seconds into it."
+        moveTime = min(self.rules.getMoveTimeout(agentIndex), self.rules.getMoveWarningTime(agentIndex)) - timeUsed
+        remainingTime = self.rules.getMaxTotalTime(agentIndex) - self.totalAgentTimes[agentIndex] - timeUsed
+        return MoveBudget(moveTime, remainingTime)
+
+    def _callPondering(self, agentIndex, function, *args):
+        """
+        Calls an agent's startPondering or stopPondering, muted.  With
+        catchExceptions an exception crashes the game (check agentCrashed)
+        and the call returns None.
+        """
+        self.mute(agentIndex)
+        try:
+            return function(*args)
+        except Exception as data:
+            if not self.catchExceptions: raise
+            self._agentCrash(agentIndex)
+            return None
+        finally:
+            self.unmute()
+
+    def _startPondering(self, agentIndex):
+        agent = self.agents[agentIndex]
+        if 'startPondering' not in dir(agent): return
+        if self._callPondering(agentIndex, agent.startPondering, self.state.deepCopy()):
+            self.ponderStartTimes[agentIndex] = time.time()
+
+    def _stopPondering(self, agentIndex):
+        if self.ponderStartTimes[agentIndex] == None: return
+        try:
+            self._callPondering(agentIndex, self.agents[agentIndex].stopPondering)
+        finally:
+            self.totalPonderTimes[agentIndex] += time.time() - self.ponderStartTimes[agentIndex]
+            self.ponderStartTimes[agentIndex] = None
+
     OLD_STDOUT = None
     OLD_STDERR = None
 
+    def limitMemory(self, memoryMoves=4096, outputChars=65536, historyPath=None):
+        """
+        Bounds the memory of a very long game; call it before run().
+        moveHistory keeps its last memoryMoves moves in memory and spills
+        the rest to historyPath (a new file for each game) or a temporary
+        file, until the game ends (see SpilledMoveHistory), and the output of
+        each muted agent keeps only its last outputChars characters.
+        """
+        self.moveHistory = SpilledMoveHistory(memoryMoves, historyPath)
+        self.agentOutput = [RingBufferOutput(outputChars) for agent in self.agents]
+
     def mute(self, agentIndex):
         if not self.muteAgents: return
         global OLD_STDOUT, OLD_STDERR
@@ -568,6 +779,17 @@ class Game:
         """
         Main control loop for game play.
         """
+        try:
+            self._run()
+        finally:
+            self._closeHistory()
+
+    def _closeHistory( self ):
+        "Releases the file of a SpilledMoveHistory (see limitMemory)."
+        if hasattr(self.moveHistory, 'close'):
+            self.moveHistory.close()
+
+    def _run( self ):
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -587,7 +809,7 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
@@ -610,18 +832,22 @@ class Game:
 
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
+        if self.scheduler != None:
+            agentIndex = self.scheduler.start(self.state, numAgents, agentIndex)
 
         while not self.gameOver:
             # Fetch the next agent
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            self._stopPondering(agentIndex)
+            if self.agentCrashed: return
             # Generate an observation of the state
             if 'observationFunction' in dir( agent ):
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
                             observation = timed_func(self.state.deepCopy())
@@ -642,49 +868,53 @@ class Game:
             # Solicit an action
             action = None
             self.mute(agentIndex)
-            if self.catchExceptions:
-                try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+            try:
+                if self.catchExceptions:
                     try:
-                        start_time = time.time()
-                        if skip_action:
-                            raise TimeoutFunctionException()
-                        action = timed_func( observation )
-                    except TimeoutFunctionException:
-                        print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
-                        self.agentTimeout = True
-                        self._agentCrash(agentIndex, quiet=True)
-                        self.unmute()
-                        return
+                        if 'setMoveBudget' in dir( agent ):
+                            agent.setMoveBudget(self.getMoveBudget(agentIndex, move_time))
+                        timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time)
+                        try:
+                            start_time = time.time()
+                            if skip_action:
+                                raise TimeoutFunctionException()
+                            action = timed_func( observation )
+                        except TimeoutFunctionException:
+                            print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
+                            self.agentTimeout = True
+                            self._agentCrash(agentIndex, quiet=True)
+                            return
 
-                    move_time += time.time() - start_time
+                        move_time += time.time() - start_time
 
-                    if move_time > self.rules.getMoveWarningTime(agentIndex):
-                        self.totalAgentTimeWarnings[agentIndex] += 1
-                        print("Agent %d took too long to make a move! This is warning %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
-                        if self.totalAgentTimeWarnings[agentIndex] > self.rules.getMaxTimeWarnings(agentIndex):
-                            print("Agent %d exceeded the maximum number of warnings: %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
+                        if move_time > self.rules.getMoveWarningTime(agentIndex):
+                            self.totalAgentTimeWarnings[agentIndex] += 1
+                            print("Agent %d took too long to make a move! This is warning %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
+                            if self.totalAgentTimeWarnings[agentIndex] > self.rules.getMaxTimeWarnings(agentIndex):
+                                print("Agent %d exceeded the maximum number of warnings: %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
+                                self.agentTimeout = True
+                                self._agentCrash(agentIndex, quiet=True)
+                                return
+
+                        self.totalAgentTimes[agentIndex] += move_time
+                        #print("Agent: %d, time: %f, total: %f" % (agentIndex, move_time, self.totalAgentTimes[agentIndex]))
+                        if self.totalAgentTimes[agentIndex] > self.rules.getMaxTotalTime(agentIndex):
+                            print("Agent %d ran out of time! (time: %1.2f)" % (agentIndex, self.totalAgentTimes[agentIndex]), file=sys.stderr)
                             self.agentTimeout = True
                             self._agentCrash(agentIndex, quiet=True)
-                            self.unmute()
                             return
-
-                    self.totalAgentTimes[agentIndex] += move_time
-                    #print("Agent: %d, time: %f, total: %f" % (agentIndex, move_time, self.totalAgentTimes[agentIndex]))
-                    if self.totalAgentTimes[agentIndex] > self.rules.getMaxTotalTime(agentIndex):
-                        print("Agent %d ran out of time! (time: %1.2f)" % (agentIndex, self.totalAgentTimes[agentIndex]), file=sys.stderr)
-                        self.agentTimeout = True
-                        self._agentCrash(agentIndex, quiet=True)
-                        self.unmute()
+                    except Exception as data:
+                        self._agentCrash(agentIndex)
                         return
-                    self.unmute()
-                except Exception as data:
-                    self._agentCrash(agentIndex)
-                    self.unmute()
-                    return
-            else:
-                action = agent.getAction(observation)
-            self.unmute()
+                else:
+                    if 'setMoveBudget' in dir( agent ):
+                        agent.setMoveBudget(self.getMoveBudget(agentIndex, move_time))
+                    start_time = time.time()
+                    action = agent.getAction(observation)
+                    self.totalAgentTimes[agentIndex] += time.time() - start_time
+            finally:
+                # Crashes and exceptions too give the output back
+                self.unmute()
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
@@ -706,14 +936,27 @@ class Game:
 
             # Allow for game specific conditions (winning, losing, etc.)
             self.rules.process(self.state, self)
+            if self.log != None:
+                self.log.record(agentIndex, action, self.state)
+            # Let the agent think on while the others move
+            if not self.gameOver:
+                self._startPondering(agentIndex)
+                if self.agentCrashed: return
             # Track progress
             if agentIndex == numAgents + 1: self.numMoves += 1
             # Next agent
-            agentIndex = ( agentIndex + 1 ) % numAgents
+            if self.scheduler != None:
+                agentIndex = self.scheduler.next(self.state, agentIndex)
+            else:
+                agentIndex = ( agentIndex + 1 ) % numAgents
 
             if _BOINC_ENABLED:
                 boinc.set_fraction_done(self.getProgress())
 
+        for agentIndex in range(len(self.agents)):
+            self._stopPondering(agentIndex)
+        if self.agentCrashed: return
+
         # inform a learning agent of the game result
         for agentIndex, agent in enumerate(self.agents):
             if "final" in dir( agent ) :
@@ -727,3 +970,111 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+_DISCARDED_OUTPUT = WritableNull()
+
+class FastGame(Game):
+    """
+    A Game for trusted, in-process agents, such as quiet batch runs of the
+    agents in this directory.  What each agent can do (observationFunction,
+    setMoveBudget, pondering, final) is looked up once per game, and the
+    loop drops what only protects against untrusted agents: there are no
+    timeouts or signal handlers, exceptions propagate, getAction gets the
+    live state instead of a copy (agents must not change it), and
+    muteAgents discards what agents print to stdout and stderr instead of
+    keeping it in agentOutput.  Rules, display updates, moveHistory and the
+    log are as in Game.  A skipper (such as corridors.CorridorSkipper) may play the plies
+    no agent has a choice in several at a time.
+    """
+
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+        if catchExceptions:
+            raise Exception('FastGame does not catch agent exceptions or time agents out; use Game')
+        Game.__init__(self, agents, display, rules, startingIndex, muteAgents, False)
+        self.skipper = None
+
+    def run( self ):
+        """
+        Main control loop for game play.
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+        try:
+            self._play()
+        finally:
+            self._closeHistory()
+        self.display.finish()
+
+    def _callAgent( self, function, *args ):
+        "Calls one of an agent's methods, with its output discarded if muteAgents is set."
+        if not self.muteAgents:
+            return function(*args)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = _DISCARDED_OUTPUT
+        try:
+            return function(*args)
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def _play( self ):
+        agents = self.agents
+        for i in range(len(agents)):
+            if not agents[i]:
+                print("Agent %d failed to load" % i, file=sys.stderr)
+                self._agentCrash(i, quiet=True)
+                return
+            if hasattr(agents[i], 'registerInitialState'):
+                self._callAgent(agents[i].registerInitialState, self.state.deepCopy())
+
+        getActions = [agent.getAction for agent in agents]
+        observers = [getattr(agent, 'observationFunction', None) for agent in agents]
+        budgets = [getattr(agent, 'setMoveBudget', None) for agent in agents]
+        ponders = [hasattr(agent, 'startPondering') for agent in agents]
+        moveHistory, display, rules, times = self.moveHistory, self.display, self.rules, self.totalAgentTimes
+        log = self.log
+        callAgent = self._callAgent
+        clock = time.perf_counter
+        agentIndex = self.startingIndex
+        numAgents = len(agents)
+        scheduler = self.scheduler
+        if scheduler != None:
+            agentIndex = scheduler.start(self.state, numAgents, agentIndex)
+        skipper = self.skipper
+        if skipper != None and not skipper.canSkip(self):
+            skipper = None
+
+        while not self.gameOver:
+            if skipper != None:
+                agentIndex = skipper.skip(self, agentIndex)
+            if ponders[agentIndex]:
+                self._stopPondering(agentIndex)
+            observation = self.state
+            if observers[agentIndex] != None:
+                observation = callAgent(observers[agentIndex], self.state.deepCopy())
+            if budgets[agentIndex] != None:
+                callAgent(budgets[agentIndex], self.getMoveBudget(agentIndex))
+            start = clock()
+            action = callAgent(getActions[agentIndex], observation)
+            times[agentIndex] += clock() - start
+
+            moveHistory.append( (agentIndex, action) )
+            self.state = self.state.generateSuccessor( agentIndex, action )
+            display.update( self.state.data )
+            rules.process(self.state, self)
+            if log != None:
+                log.record(agentIndex, action, self.state)
+            if ponders[agentIndex] and not self.gameOver:
+                self._startPondering(agentIndex)
+            if scheduler != None:
+                agentIndex = scheduler.next(self.state, agentIndex)
+            else:
+                agentIndex = ( agentIndex + 1 ) % numAgents
+
+            if _BOINC_ENABLED:
+                boinc.set_fraction_done(self.getProgress())
+
+        for agentIndex in range(numAgents):
+            self._stopPondering(agentIndex)
+        for agent in agents:
+            if hasattr(agent, 'final'):
+                self._callAgent(agent.final, self.state)
@@ -0,0 +1,139 @@
+"""
+Game logs: a game stored as its actions plus a snapshot of the state every
+snapshotEvery plies.  Any ply can then be reached by taking the nearest
+snapshot before it and replaying at most snapshotEvery - 1 actions, rather
+than replaying the game from the start like pacman.replayGame.
+
+A Game with a log (game.log = GameLog(rules, game.state)) adds each ply to
+it as it is played.  Snapshots are the game's own states.  Once a ply is
+over the game never changes them again, and consecutive states share
+their food grid and layout until one is modified, so a snapshot costs
+little more than its agent states.  pacman.py -r and runTag.py -r save the
+logs of the games they play, and --replay can start from any ply:
+
+> python runTag.py -q -n 5 -l mediumClassic -r
+> python runTag.py -l mediumClassic --replay recorded-tag-game-1-... --replayStart 300
+"""
+import array
+import copy
+import importlib
+import os
+import pickle
+import sys
+from game import Directions
+
+# Actions are stored as indices into this list
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+SNAPSHOT_EVERY = 100
+
+class ReplayGame:
+    "What rules.process needs of a game while a log is replayed."
+    def __init__(self):
+        self.gameOver = False
+
+class GameLog:
+    """
+    The plies of one game.  rules are the game's rules (a quiet copy
+    without recorder is kept for replays) and initialState the state
+    before the first ply.
+    """
+    def __init__(self, rules, initialState, snapshotEvery=SNAPSHOT_EVERY):
+        self.rules = copy.copy(rules)
+        self.rules.quiet = True
+        if hasattr(self.rules, 'recorder'):
+            self.rules.recorder = None
+        self.snapshotEvery = snapshotEvery
+        self.agents = array.array('b')
+        self.actions = array.array('b')
+        # snapshots[i] is the state after i * snapshotEvery plies
+        self.snapshots = [initialState]
+
+    @staticmethod
+    def fromHistory(rules, initialState, moveHistory, snapshotEvery=SNAPSHOT_EVERY):
+        "Builds the log of a game from its moveHistory by replaying it once."
+        log = GameLog(rules, initialState, snapshotEvery)
+        state, game = initialState, ReplayGame()
+        for agentIndex, action in moveHistory:
+            state = state.generateSuccessor(agentIndex, action)
+            log.rules.process(state, game)
+            log.record(agentIndex, action, state)
+        return log
+
+    def record(self, agentIndex, action, state):
+        "Adds a ply: agentIndex played action, leading to state (after rules.process)."
+        self.agents.append(agentIndex)
+        self.actions.append(ACTIONS.index(action))
+        if len(self.actions) % self.snapshotEvery == 0:
+            self.snapshots.append(state)
+
+    def __len__(self):
+        return len(self.actions)
+
+    def getMove(self, ply):
+        "The (agentIndex, action) of the ply-th move (counting from 0)."
+        return self.agents[ply], ACTIONS[self.actions[ply]]
+
+    def getMoveHistory(self):
+        return [self.getMove(ply) for ply in range(len(self))]
+
+    def step(self, state, ply, game=None):
+        "Plays the ply-th move on state, which must be the state before it."
+        state = state.generateSuccessor(self.agents[ply], ACTIONS[self.actions[ply]])
+        self.rules.process(state, game or ReplayGame())
+        return state
+
+    def seek(self, ply):
+        """
+        The state after the first ply moves (the initial state for 0).
+        States come from the log itself or from replaying it, so treat them
+        as read-only.
+        """
+        if not 0 <= ply <= len(self):
+            raise IndexError('Ply %d is outside a game of %d plies' % (ply, len(self)))
+        snapshot = ply // self.snapshotEvery
+        state, game = self.snapshots[snapshot], ReplayGame()
+        for move in range(snapshot * self.snapshotEvery, ply):
+            state = self.step(state, move, game)
+        return state
+
+    def iterStates(self, start=0, end=None):
+        "Yields the states after plies start, start + 1, ..., end (default: the last)."
+        end = len(self) if end == None else end
+        state, game = self.seek(start), ReplayGame()
+        yield state
+        for ply in range(start, end):
+            state = self.step(state, ply, game)
+            yield state
+
+    def save(self, path):
+        f = open(path, 'wb')
+        try: LogPickler(f).dump(self)
+        finally: f.close()
+
+def findClass(moduleName, name):
+    return getattr(importlib.import_module(moduleName), name)
+
+class LogPickler(pickle.Pickler):
+    """
+    Pickles the classes of a script run as __main__ (such as pacman.py's
+    GameState) under the script's module name, so that other programs can
+    load the log too.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ == '__main__':
+            script = os.path.splitext(os.path.basename(sys.modules['__main__'].__file__))[0]
+            return findClass, (script, obj.__qualname__)
+        return NotImplemented
+
+def loadLog(path):
+    f = open(path, 'rb')
+    try: return pickle.load(f)
+    finally: f.close()
+
+def replayLog(log, display, start=0):
+    "Shows a logged game on display from ply start to the end."
+    states = log.iterStates(start)
+    display.initialize(next(states).data)
+    for state in states:
+        display.update(state.data)
+    display.finish()
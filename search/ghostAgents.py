@@ -18,6 +18,7 @@ from game import Directions
 import random
 from util import manhattanDistance
 import util
+import flowField
 
 class GhostAgent( Agent ):
     def __init__( self, index ):
@@ -59,12 +60,8 @@ class DirectionalGhost( GhostAgent ):
         speed = 1
         if isScared: speed = 0.5
 
-        actionVectors = [Actions.directionToVector( a, speed ) for a in legalActions]
-        newPositions = [( pos[0]+a[0], pos[1]+a[1] ) for a in actionVectors]
-        pacmanPosition = state.getPacmanPosition()
-
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+        distancesToPacman = self.getDistancesToPacman( state, pos, legalActions, speed )
         if isScared:
             bestScore = max( distancesToPacman )
             bestProb = self.prob_scaredFlee
@@ -79,3 +76,22 @@ class DirectionalGhost( GhostAgent ):
         for a in legalActions: dist[a] += ( 1-bestProb ) / len(legalActions)
         dist.normalize()
         return dist
+
+    def getDistancesToPacman( self, state, pos, legalActions, speed ):
+        "Manhattan distance to Pacman after each legal action."
+        actionVectors = [Actions.directionToVector( a, speed ) for a in legalActions]
+        newPositions = [( pos[0]+a[0], pos[1]+a[1] ) for a in actionVectors]
+        pacmanPosition = state.getPacmanPosition()
+        return [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+
+class FlowFieldGhost( DirectionalGhost ):
+    """
+    A DirectionalGhost that measures maze distance instead of Manhattan
+    distance, read from a flow field towards Pacman that all the ghosts in
+    the process share.  Works in tag too, where the ghost is scared
+    whenever Pacman is IT.
+    """
+    def getDistancesToPacman( self, state, pos, legalActions, speed ):
+        field = flowField.getFlowField( state.data.layout )
+        field.setTarget( state.getPacmanPosition() )
+        return field.getActionDistances( pos, legalActions )
@@ -16,6 +16,7 @@ from util import manhattanDistance
 from game import Grid
 import os
 import random
+import hashlib
 from functools import reduce
 
 VISIBILITY_MATRIX_CACHE = {}
@@ -41,6 +42,16 @@ class Layout:
     def getNumGhosts(self):
         return self.numGhosts
 
+    def getFingerprint(self):
+        """
+        Returns a short string identifying the layout's text, so caches can be
+        shared between Layout objects (and games) built from the same map.
+        """
+        if not hasattr(self, '_fingerprint'):
+            text = '\n'.join(self.layoutText)
+            self._fingerprint = hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+        return self._fingerprint
+
     def initializeVisibilityMatrix(self):
         global VISIBILITY_MATRIX_CACHE
         if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
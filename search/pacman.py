@@ -40,7 +40,7 @@ To play your first game, type 'python pacman.py' from the command line.
 The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 from game import GameStateData
-from game import Game
+from game import Game, FastGame
 from game import Directions
 from game import Actions
 from util import nearestPoint
@@ -71,8 +71,11 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # static variable keeps track of which states have had getLegalActions called.
+    # Hashing every successor into it is slow and keeps every state alive, so
+    # it is only filled while trackExplored is set, and newGame empties it.
     explored = set()
+    trackExplored = False
     def getAndResetExplored():
         tmp = GameState.explored.copy()
         GameState.explored = set()
@@ -120,8 +123,9 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.trackExplored:
+            GameState.explored.add(self)
+            GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -271,11 +275,12 @@ class ClassicGameRules:
     def __init__(self, timeout=30):
         self.timeout = timeout
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False, fast=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
+        GameState.explored = set()
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = (FastGame if fast else Game)(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -512,7 +517,11 @@ def readCommand( argv ):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A replay file (or pickled recording) to replay', default=None)
+    parser.add_option('--replayGame', dest='replayGame', type='int',
+                      help=default('Which game of the replay file to show'), default=1)
+    parser.add_option('--replayStart', dest='replayStart', type='int',
+                      help=default('The ply a replay starts from'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -521,8 +530,10 @@ def readCommand( argv ):
                       help=default('Time to delay between frames; <0 means keyboard'), default=0.1)
     parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
                       help='Turns on exception handling and timeouts during games', default=False)
-    parser.add_option('--timeout', dest='timeout', type='int',
+    parser.add_option('--timeout', dest='timeout', type='float',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--fastGame', action='store_true', dest='fastGame',
+                      help='Play with the lean game loop for trusted agents (no timeouts, exceptions propagate)', default=False)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -570,16 +581,16 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['fastGame'] = options.fastGame
+    if options.fastGame and options.catchExceptions:
+        raise Exception('--fastGame cannot be combined with --catchExceptions')
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print('Replaying recorded game %s.' % options.gameToReplay)
-        import pickle
-        f = open(options.gameToReplay, 'rb')
-        try: recorded = pickle.load(f)
-        finally: f.close()
-        recorded['display'] = args['display']
-        replayGame(**recorded)
+        import gameLog, replayFile
+        log = replayFile.loadGameLog(options.gameToReplay, options.replayGame)
+        gameLog.replayLog(log, args['display'], options.replayStart)
         sys.exit(0)
 
     return args
@@ -625,34 +636,43 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, fastGame=False ):
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
-
-    for i in range( numGames ):
-        beQuiet = i < numTraining
-        if beQuiet:
-                # Suppress output and graphics
-            import textDisplay
-            gameDisplay = textDisplay.NullGraphics()
-            rules.quiet = True
-        else:
-            gameDisplay = display
-            rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
-        if not beQuiet: games.append(game)
-
+    recorder = None
+    if record:
+        import time, replayFile
+        fname = 'recorded-games-' + '-'.join([str(t) for t in time.localtime()[1:6]]) + '.rpl'
+        recorder = replayFile.ReplayWriter(fname)
+
+    try:
+        for i in range( numGames ):
+            beQuiet = i < numTraining
+            if beQuiet:
+                    # Suppress output and graphics
+                import textDisplay
+                gameDisplay = textDisplay.NullGraphics()
+                rules.quiet = True
+            else:
+                gameDisplay = display
+                rules.quiet = False
+            game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, fastGame)
+            if record:
+                recorder.startGame('classic', layout, len(game.agents), rules={'timeout': timeout},
+                                   agents=[agent.__class__.__name__ for agent in game.agents])
+                game.log = recorder
+            game.run()
+            if not beQuiet: games.append(game)
+
+            if record:
+                recorder.endGame(game.state, game.agentCrashed)
+    finally:
+        # A game that raised is kept in the recording, cut short
         if record:
-            import time, pickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = open(fname, 'wb')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            pickle.dump(components, f)
-            f.close()
+            recorder.close()
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
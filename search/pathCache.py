@@ -0,0 +1,93 @@
+"""
+A process-wide cache of shortest paths, shared by every game played on the
+same layout.  Paths are keyed by (layout fingerprint, start, goal), so a
+tournament of many games on one map only searches each path once.
+"""
+import shelve
+import util
+
+class PathCache:
+    """
+    Bounded cache of shortest paths between maze positions.
+
+    Entries are evicted in least-recently-used order once maxSize paths are
+    held in memory.  If spillFile is given, evicted paths are written to a
+    shelve database at that location and read back on a later miss, so the
+    cache can outgrow memory (and outlive the process).
+    """
+    def __init__(self, maxSize=100000, spillFile=None):
+        self.spill = None
+        if spillFile != None:
+            self.spill = shelve.open(spillFile)
+        self.paths = util.LRUCache(maxSize, onEvict=self._spillPath)
+        self.hits = 0
+        self.spillHits = 0
+        self.misses = 0
+
+    def _key(self, layout, start, goal):
+        return (layout.getFingerprint(), tuple(start), tuple(goal))
+
+    def _spillPath(self, key, path):
+        if self.spill != None:
+            self.spill[repr(key)] = path
+
+    def getPath(self, layout, start, goal):
+        """
+        Returns the cached list of actions from start to goal on layout, or
+        None if the path has not been computed yet.
+        """
+        key = self._key(layout, start, goal)
+        path = self.paths.get(key)
+        if path != None:
+            self.hits += 1
+            return list(path)
+        if self.spill != None and repr(key) in self.spill:
+            path = self.spill[repr(key)]
+            self.paths.put(key, path)
+            self.spillHits += 1
+            return list(path)
+        self.misses += 1
+        return None
+
+    def putPath(self, layout, start, goal, path):
+        "Stores the list of actions leading from start to goal on layout."
+        self.paths.put(self._key(layout, start, goal), tuple(path))
+
+    def findPath(self, layout, start, goal, searchFunction):
+        """
+        Returns the path from start to goal, calling searchFunction() to
+        compute (and cache) it on a miss.
+        """
+        path = self.getPath(layout, start, goal)
+        if path == None:
+            path = searchFunction()
+            if path == None: return None
+            self.putPath(layout, start, goal, path)
+        return path
+
+    def hitRate(self):
+        lookups = self.hits + self.spillHits + self.misses
+        if lookups == 0: return 0.0
+        return (self.hits + self.spillHits) / float(lookups)
+
+    def getStats(self):
+        "Returns a short human readable summary of the cache's performance."
+        return 'Path cache: %d paths, %d hits, %d disk hits, %d misses (hit rate %.2f)' % \
+            (len(self.paths), self.hits, self.spillHits, self.misses, self.hitRate())
+
+    def clear(self):
+        self.paths.clear()
+        self.hits = self.spillHits = self.misses = 0
+        if self.spill != None:
+            self.spill.clear()
+
+    def close(self):
+        "Writes every cached path to the disk store, if any, and closes it."
+        if self.spill != None:
+            for key, path in self.paths.entries.items():
+                self.spill[repr(key)] = path
+            self.spill.close()
+            self.spill = None
+
+# The cache shared by mazeDistance and the tag agents in this process
+PATH_CACHE = PathCache()
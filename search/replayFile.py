@@ -0,0 +1,319 @@
+"""
+Replay files: recorded games in a compact, versioned binary format, in place
+of pickling the Layout object and moveHistory of every game.
+
+A file is MAGIC and a version byte followed by records, each a kind byte,
+a 4-byte length and a payload:
+
+  LAYOUT   a layout's fingerprint and text, written once per file however
+           many games are played on it
+  GAME     a JSON header: the kind of game ('classic' or 'tag'), the
+           layout fingerprint, the number of agents, the seed, the rules'
+           settings and the agents
+  ACTIONS  a block of up to BLOCK_ACTIONS actions packed 3 bits each (an
+           index into ACTIONS); agents move in turn, so whose move it was
+           needs no bits at all
+  RESULT   the game's JSON footer: plies, score, winner, points, crashes
+
+ReplayWriter streams a batch of games to one file, writing a block
+whenever BLOCK_ACTIONS actions have accumulated; it is given to a game as
+its log (game.log), so it records plies as they are played.  readGames
+reads a file back one game at a time; a game cut short (say, by a crash)
+comes back without its result.  Old pickled recordings ({'layout',
+'actions'} from pacman.py, and gameLog.GameLog pickles) can be converted:
+
+> python runTag.py -q -n 100 -l mediumClassic -r
+> python replayFile.py recorded-tag-games-....rpl
+> python replayFile.py -o converted.rpl recorded-game-1-... recorded-game-2-...
+"""
+import json
+import struct
+import sys
+from gameLog import ACTIONS, GameLog, SNAPSHOT_EVERY, loadLog
+import layout
+
+MAGIC = b'PACRPL'
+VERSION = 1
+BLOCK_ACTIONS = 4096
+
+LAYOUT, GAME, ACTIONS_BLOCK, RESULT = b'L', b'G', b'A', b'R'
+_RECORD = struct.Struct('<cI')
+_COUNT = struct.Struct('<I')
+_FINGERPRINT_BYTES = 16
+
+def packActions(actions):
+    "Packs a list of action indices 3 bits each, 8 actions to every 3 bytes."
+    packed = bytearray()
+    for start in range(0, len(actions), 8):
+        group = 0
+        for shift, action in enumerate(actions[start:start + 8]):
+            group |= action << (3 * shift)
+        packed += group.to_bytes(3, 'little')
+    return bytes(packed)
+
+def unpackActions(packed, count):
+    actions = []
+    for start in range(0, len(packed), 3):
+        group = int.from_bytes(packed[start:start + 3], 'little')
+        actions.extend((group >> (3 * shift)) & 7 for shift in range(8))
+    return actions[:count]
+
+def getResults(state, plies, crashed=False):
+    "The footer of a game that ended in state after plies moves."
+    results = {'plies': plies, 'score': state.getScore(), 'win': state.isWin(), 'lose': state.isLose(),
+               'crashed': crashed}
+    data = state.data
+    if hasattr(data, 'pacman_is_it'):
+        from tagGame import TagGameRules
+        results.update({'winner': TagGameRules.getWinner(data), 'pacmanPoints': data.pacman_score,
+                        'phantomPoints': data.phantom_score, 'tags': data.tag_count})
+    return results
+
+class ReplayWriter:
+    """
+    Streams games to the replay file at path.  For each game call
+    startGame, give the writer to the game as its log (or call record for
+    each ply) and call endGame once it is over; close() when done.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + bytes([VERSION]))
+        self.layouts = set()
+        self.games = 0
+        self.plies = 0
+        self.actions = None
+
+    def writeRecord(self, kind, payload):
+        self.file.write(_RECORD.pack(kind, len(payload)) + payload)
+
+    def startGame(self, kind, layoutObj, numAgents, seed=None, rules=None, agents=None, startingIndex=0):
+        """
+        Starts a game of kind 'classic' or 'tag' on layoutObj.  rules are the
+        keyword arguments that rebuild the game's rules, agents a list of
+        names; both, like the seed, are only stored.
+        """
+        if self.actions != None:
+            raise Exception('The game before this one was never ended')
+        fingerprint = layoutObj.getFingerprint()
+        if fingerprint not in self.layouts:
+            self.layouts.add(fingerprint)
+            self.writeRecord(LAYOUT, fingerprint.encode() + '\n'.join(layoutObj.layoutText).encode('utf-8'))
+        header = {'kind': kind, 'layout': fingerprint, 'numAgents': numAgents, 'startingIndex': startingIndex,
+                  'seed': seed, 'rules': rules or {}, 'agents': agents or []}
+        self.writeRecord(GAME, json.dumps(header).encode())
+        self.numAgents, self.nextAgent = numAgents, startingIndex
+        self.actions = []
+        self.gamePlies = 0
+
+    def record(self, agentIndex, action, state=None):
+        "Adds a ply; the signature of gameLog.GameLog.record, so a Game can log to the writer."
+        if agentIndex != self.nextAgent:
+            raise Exception('Agent %d moved out of turn (agent %d was to move)' % (agentIndex, self.nextAgent))
+        self.nextAgent = (agentIndex + 1) % self.numAgents
+        self.actions.append(ACTIONS.index(action))
+        self.gamePlies += 1
+        if len(self.actions) >= BLOCK_ACTIONS:
+            self.writeActions()
+
+    def writeActions(self):
+        if len(self.actions) > 0:
+            self.writeRecord(ACTIONS_BLOCK, _COUNT.pack(len(self.actions)) + packActions(self.actions))
+            self.actions = []
+
+    def endGame(self, state, crashed=False, results=None):
+        """
+        Ends the game, whose final state is state.  results replace the
+        footer built from state, for games copied from other recordings.
+        """
+        self.writeActions()
+        if results == None:
+            results = getResults(state, self.gamePlies, crashed)
+        self.writeRecord(RESULT, json.dumps(results).encode())
+        self.file.flush()
+        self.actions = None
+        self.games += 1
+        self.plies += self.gamePlies
+
+    def close(self):
+        "Closes the file.  The plies of a game that was never ended are kept, and it reads back cut short."
+        if self.actions != None:
+            self.writeActions()
+            self.actions = None
+        self.file.close()
+
+    def getStats(self):
+        return 'Replays: %d games, %d plies in %s' % (self.games, self.plies, self.path)
+
+class RecordedGame:
+    "A game read back from a replay file."
+    def __init__(self, header, layoutText, actions, results):
+        self.header = header
+        self.layoutText = layoutText
+        self.actions = actions
+        self.results = results
+
+    def getLayout(self):
+        "A new Layout of the game's layout."
+        return layout.Layout(self.layoutText.split('\n'))
+
+    def getMoveHistory(self):
+        numAgents, first = self.header['numAgents'], self.header['startingIndex']
+        return [((first + ply) % numAgents, ACTIONS[action]) for ply, action in enumerate(self.actions)]
+
+    def getRulesAndState(self, layoutObj=None):
+        """
+        New rules and initial state for replaying the game, on layoutObj if
+        given (the game's layout, say parsed once for many games) or else on
+        a new Layout.
+        """
+        if layoutObj == None:
+            layoutObj = self.getLayout()
+        if self.header['kind'] == 'tag':
+            from tagGame import TagGameRules, TagGameState
+            rules, state = TagGameRules(**self.header['rules']), TagGameState()
+            state.initialize(layoutObj, 1)
+        else:
+            from pacman import ClassicGameRules, GameState
+            rules, state = ClassicGameRules(**self.header['rules']), GameState()
+            state.initialize(layoutObj, self.header['numAgents'] - 1)
+        rules.quiet = True
+        return rules, state
+
+    def toGameLog(self, snapshotEvery=SNAPSHOT_EVERY):
+        "A gameLog.GameLog of the game, for seeking to any ply."
+        rules, state = self.getRulesAndState()
+        return GameLog.fromHistory(rules, state, self.getMoveHistory(), snapshotEvery)
+
+def readRecord(f):
+    "Returns (kind, payload), or (None, None) at the end of the file or a cut-off record."
+    head = f.read(_RECORD.size)
+    if len(head) < _RECORD.size:
+        return None, None
+    kind, length = _RECORD.unpack(head)
+    payload = f.read(length)
+    if len(payload) < length:
+        return None, None
+    return kind, payload
+
+def readGames(path):
+    "Yields the RecordedGames of the replay file at path, one at a time."
+    f = open(path, 'rb')
+    try:
+        start = f.read(len(MAGIC) + 1)
+        if start[:len(MAGIC)] != MAGIC:
+            raise Exception('%s is not a replay file' % path)
+        if start[len(MAGIC)] > VERSION:
+            raise Exception('%s has replay format version %d; this reader knows up to %d' % (path, start[len(MAGIC)], VERSION))
+        layouts, header, actions = {}, None, []
+        while True:
+            kind, payload = readRecord(f)
+            if kind == None:
+                break
+            if kind == LAYOUT:
+                layouts[payload[:_FINGERPRINT_BYTES].decode()] = payload[_FINGERPRINT_BYTES:].decode('utf-8')
+            elif kind == GAME:
+                if header != None:
+                    yield RecordedGame(header, layouts[header['layout']], actions, None)
+                header, actions = json.loads(payload.decode()), []
+            elif kind == ACTIONS_BLOCK:
+                count, = _COUNT.unpack_from(payload)
+                actions.extend(unpackActions(payload[_COUNT.size:], count))
+            elif kind == RESULT:
+                yield RecordedGame(header, layouts[header['layout']], actions, json.loads(payload.decode()))
+                header, actions = None, []
+            # Records of unknown kinds are skipped, so later versions can add some
+        if header != None:
+            yield RecordedGame(header, layouts[header['layout']], actions, None)
+    finally:
+        f.close()
+
+def isReplayFile(path):
+    f = open(path, 'rb')
+    try: return f.read(len(MAGIC)) == MAGIC
+    finally: f.close()
+
+def loadGameLog(path, game=1):
+    """
+    The gameLog.GameLog of a recording: the game-th game of a replay file,
+    or a pickled GameLog or old {'layout', 'actions'} recording.
+    """
+    if isReplayFile(path):
+        for number, recorded in enumerate(readGames(path)):
+            if number + 1 == game:
+                return recorded.toGameLog()
+        raise Exception('%s has fewer than %d games' % (path, game))
+    recorded = loadLog(path)
+    if isinstance(recorded, GameLog):
+        return recorded
+    return convertRecording(recorded, path).toGameLog()
+
+def convertPickle(path):
+    return convertRecording(loadLog(path), path)
+
+def convertRecording(recorded, path):
+    """
+    Turns an unpickled recording from path, a gameLog.GameLog or pacman.py's
+    old {'layout': Layout, 'actions': moveHistory}, into a RecordedGame.
+    """
+    if isinstance(recorded, GameLog):
+        rules, state = recorded.rules, recorded.snapshots[0]
+        moveHistory = recorded.getMoveHistory()
+        kind = 'tag' if hasattr(state.data, 'pacman_is_it') else 'classic'
+        numAgents = len(state.data.agentStates)
+        settings = {'maxTags': rules.maxTags, 'maxMoves': rules.maxMoves} if kind == 'tag' else {}
+    else:
+        from pacman import ClassicGameRules, GameState
+        rules, state, moveHistory, kind, settings = ClassicGameRules(), GameState(), recorded['actions'], 'classic', {}
+        numAgents = 1 + max([agentIndex for agentIndex, action in moveHistory] + [0])
+        state.initialize(recorded['layout'], numAgents - 1)
+    layoutObj = state.data.layout
+    header = {'kind': kind, 'layout': layoutObj.getFingerprint(), 'numAgents': numAgents, 'startingIndex': 0,
+              'seed': None, 'rules': settings, 'agents': []}
+    for ply, (agentIndex, action) in enumerate(moveHistory):
+        if agentIndex != ply % numAgents:
+            raise Exception('%s: agent %d moved out of turn at ply %d' % (path, agentIndex, ply))
+    log = GameLog.fromHistory(rules, state, moveHistory)
+    results = getResults(log.seek(len(log)), len(log))
+    return RecordedGame(header, '\n'.join(layoutObj.layoutText), [ACTIONS.index(action) for agentIndex, action in moveHistory], results)
+
+def writeRecordedGame(writer, recorded):
+    "Copies a RecordedGame into a ReplayWriter."
+    header = recorded.header
+    writer.startGame(header['kind'], recorded.getLayout(), header['numAgents'], header['seed'], header['rules'],
+                     header['agents'], header['startingIndex'])
+    for agentIndex, action in recorded.getMoveHistory():
+        writer.record(agentIndex, action)
+    writer.endGame(None, results=recorded.results)
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python replayFile.py REPLAY_FILE | python replayFile.py -o OUT.rpl PICKLED_RECORDINGS...')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='convert the pickled recordings given into this replay file')
+    options, paths = parser.parse_args(argv)
+    if len(paths) == 0:
+        raise Exception('Give a replay file, or -o and the recordings to convert')
+    return options, paths
+
+if __name__ == '__main__':
+    options, paths = readCommand(sys.argv[1:])
+    if options.output != None:
+        writer = ReplayWriter(options.output)
+        for path in paths:
+            writeRecordedGame(writer, convertPickle(path))
+        writer.close()
+        print(writer.getStats())
+    else:
+        for path in paths:
+            for number, recorded in enumerate(readGames(path)):
+                header, results = recorded.header, recorded.results
+                line = 'Game %d: %s, %d agents, %d plies, seed %s' % (number + 1, header['kind'], header['numAgents'],
+                                                                     len(recorded.actions), header['seed'])
+                if results == None:
+                    line += ', cut short'
+                elif 'winner' in results:
+                    line += ', winner %s (%.0f to %.0f)' % (results['winner'], results['pacmanPoints'], results['phantomPoints'])
+                else:
+                    line += ', score %d (%s)' % (results['score'], 'win' if results['win'] else 'loss' if results['lose'] else 'no result')
+                print(line)
@@ -0,0 +1,227 @@
+"""
+Headless replays: statistics recomputed from recorded games instead of from
+new games, so a metric can be added or changed without running any agent.
+
+Every game of the replay files given (or of the *.rpl files in a
+directory) is played again from its actions through ClassicGameRules or
+TagGameRules, with no display, across a process pool.  Each replay
+reports the game's tags, the plies each side spent IT, its score curve
+(the scores every curveEvery plies) and a digest of every state it went
+through.  A replay is deterministic if it ends where the recording did:
+same plies, the game over exactly at the last one (unless an agent
+crashed) and the same results footer.  Digests can be saved and checked
+against a later run, which catches rule changes that alter old games.
+
+> python runTag.py -q -n 200 -l mediumClassic -r -s 1
+> python replayStats.py -w 4 . --saveDigests digests.json
+> python replayStats.py -w 4 . --checkDigests digests.json
+"""
+import glob
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from gameLog import ReplayGame
+import replayFile
+
+CURVE_EVERY = 50
+
+_LAYOUTS = {}
+
+def getLayout(recorded):
+    """
+    The layout of a recorded game, parsed once per process for each
+    fingerprint.  Replays only read it, so it is shared by all of them.
+    """
+    fingerprint = recorded.header['layout']
+    if fingerprint not in _LAYOUTS:
+        _LAYOUTS[fingerprint] = recorded.getLayout()
+    return _LAYOUTS[fingerprint]
+
+def listRecordings(paths):
+    "The recordings at paths: files as given, and the *.rpl files of directories."
+    recordings = []
+    for path in paths:
+        if os.path.isdir(path):
+            recordings.extend(sorted(glob.glob(os.path.join(path, '*.rpl'))))
+        else:
+            recordings.append(path)
+    return recordings
+
+def iterRecordedGames(paths):
+    "Yields (name, RecordedGame) for every game of the recordings at paths."
+    for path in listRecordings(paths):
+        if replayFile.isReplayFile(path):
+            for number, recorded in enumerate(replayFile.readGames(path)):
+                yield '%s#%d' % (path, number + 1), recorded
+        else:
+            yield path, replayFile.convertPickle(path)
+
+def getDigestFields(data):
+    "What a state digest covers: agent positions and directions, and the scores."
+    fields = [data.score] + [agentState.configuration.pos + (agentState.configuration.direction,)
+                             for agentState in data.agentStates if agentState.configuration != None]
+    if hasattr(data, 'pacman_is_it'):
+        fields += [data.pacman_is_it, data.tag_count, data.tag_cooldown, data.pacman_score, data.phantom_score]
+    return fields
+
+def replayStats(job):
+    """
+    Replays one recorded game and returns its statistics.  job is (name,
+    RecordedGame, curveEvery).
+    """
+    name, recorded, curveEvery = job
+    rules, state = recorded.getRulesAndState(getLayout(recorded))
+    game = ReplayGame()
+    history = recorded.getMoveHistory()
+    tag = recorded.header['kind'] == 'tag'
+    digest = hashlib.sha1()
+    itPlies = [0, 0]
+    curve = []
+    endedAt = None
+    for ply, (agentIndex, action) in enumerate(history):
+        if game.gameOver:
+            break
+        state = state.generateSuccessor(agentIndex, action)
+        rules.process(state, game)
+        data = state.data
+        digest.update(repr(getDigestFields(data)).encode())
+        if tag:
+            itPlies[0 if data.pacman_is_it else 1] += 1
+        if (ply + 1) % curveEvery == 0:
+            curve.append((data.pacman_score, data.phantom_score) if tag else (data.score,))
+        if game.gameOver:
+            endedAt = ply + 1
+    results = replayFile.getResults(state, len(history), recorded.results != None and recorded.results['crashed'])
+    problems = []
+    if recorded.results == None:
+        problems.append('the recording was cut short')
+    else:
+        crashed = recorded.results['crashed']
+        if endedAt != None and endedAt < len(history):
+            problems.append('the game ended at ply %d of %d' % (endedAt, len(history)))
+        elif endedAt == None and not crashed:
+            problems.append('the game did not end after its %d plies' % len(history))
+        for key in recorded.results:
+            if not sameResult(recorded.results[key], results.get(key)):
+                problems.append('%s is %r, recorded as %r' % (key, results.get(key), recorded.results[key]))
+    return {'name': name, 'kind': recorded.header['kind'], 'plies': len(history), 'results': results,
+            'tags': results.get('tags', 0), 'itPlies': itPlies, 'curve': curve,
+            'digest': digest.hexdigest()[:16], 'problems': problems}
+
+def sameResult(recorded, replayed):
+    if isinstance(recorded, float) and isinstance(replayed, float):
+        return math.isclose(recorded, replayed, rel_tol=1e-9, abs_tol=1e-9)
+    return recorded == replayed
+
+class ReplaySummary:
+    "Aggregates the statistics of many replays, whose curves have a point every curveEvery plies."
+    def __init__(self, curveEvery=CURVE_EVERY):
+        self.curveEvery = curveEvery
+        self.games = []
+
+    def add(self, stats):
+        self.games.append(stats)
+
+    def getCurve(self, kind):
+        "The mean score curve of the games of kind, with the number of games still going at each point."
+        points = {}
+        for stats in self.games:
+            if stats['kind'] == kind:
+                for index, scores in enumerate(stats['curve']):
+                    points.setdefault(index, []).append(scores)
+        curve = []
+        for index in sorted(points):
+            scores = points[index]
+            curve.append(((index + 1) * self.curveEvery, len(scores), [sum(column) / len(scores) for column in zip(*scores)]))
+        return curve
+
+    def printSummary(self, seconds):
+        plies = sum(stats['plies'] for stats in self.games)
+        print('Replayed %d games, %d plies in %.1fs (%.0f plies/sec)' % (len(self.games), plies, seconds, plies / max(seconds, 1e-9)))
+        tagGames = [stats for stats in self.games if stats['kind'] == 'tag']
+        if len(tagGames) > 0:
+            winners = [stats['results']['winner'] for stats in tagGames]
+            itPlies = [sum(stats['itPlies'][side] for stats in tagGames) for side in range(2)]
+            print('Tag:       %d games; Pacman wins %d, phantom wins %d, no winner %d' %
+                  (len(tagGames), winners.count('PACMAN'), winners.count('PHANTOM'), winners.count(None)))
+            print('           %.2f tags and %.1f plies per game; Pacman IT %.1f%% of plies, the ghost %.1f%%' %
+                  (sum(stats['tags'] for stats in tagGames) / float(len(tagGames)),
+                   sum(stats['plies'] for stats in tagGames) / float(len(tagGames)),
+                   100.0 * itPlies[0] / max(sum(itPlies), 1), 100.0 * itPlies[1] / max(sum(itPlies), 1)))
+            for ply, count, (pacmanPoints, phantomPoints) in self.getCurve('tag'):
+                print('           ply %5d: Pacman %6.1f, phantom %6.1f points (%d games)' % (ply, pacmanPoints, phantomPoints, count))
+        classicGames = [stats for stats in self.games if stats['kind'] == 'classic']
+        if len(classicGames) > 0:
+            wins = [stats['results']['win'] for stats in classicGames].count(True)
+            print('Classic:   %d games; %d wins, average score %.1f' %
+                  (len(classicGames), wins, sum(stats['results']['score'] for stats in classicGames) / float(len(classicGames))))
+            for ply, count, (score,) in self.getCurve('classic'):
+                print('           ply %5d: score %7.1f (%d games)' % (ply, score, count))
+        failed = [stats for stats in self.games if len(stats['problems']) > 0]
+        print('Determinism: %d of %d replays reproduce their recordings' % (len(self.games) - len(failed), len(self.games)))
+        for stats in failed:
+            print('  %s: %s' % (stats['name'], '; '.join(stats['problems'])))
+
+    def getDigests(self):
+        return dict((stats['name'], stats['digest']) for stats in self.games)
+
+    def checkDigests(self, digests):
+        "Prints the games whose states differ from those of digests; returns how many do."
+        changed = [name for name, digest in sorted(self.getDigests().items()) if name in digests and digests[name] != digest]
+        missing = [name for name in digests if name not in self.getDigests()]
+        print('Digests:   %d games checked, %d changed, %d not replayed' % (len(digests) - len(missing), len(changed), len(missing)))
+        for name in changed:
+            print('  %s replays differently than before' % name)
+        return len(changed)
+
+def replayAll(paths, workers=1, curveEvery=CURVE_EVERY):
+    "Replays every game of the recordings at paths; returns (ReplaySummary, seconds)."
+    summary = ReplaySummary(curveEvery)
+    jobs = ((name, recorded, curveEvery) for name, recorded in iterRecordedGames(paths))
+    startTime = time.time()
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for stats in pool.imap(replayStats, jobs, chunksize=8):
+                summary.add(stats)
+        finally:
+            pool.terminate()
+    else:
+        for job in jobs:
+            summary.add(replayStats(job))
+    return summary, time.time() - startTime
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python replayStats.py [options] RECORDINGS_OR_DIRECTORIES...')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=multiprocessing.cpu_count(),
+                      help='processes replaying games [Default: %default]')
+    parser.add_option('--curveEvery', dest='curveEvery', type='int', default=CURVE_EVERY,
+                      help='plies between the points of the score curves [Default: %default]')
+    parser.add_option('--saveDigests', dest='saveDigests', default=None,
+                      help='write the state digest of every game to this JSON file')
+    parser.add_option('--checkDigests', dest='checkDigests', default=None,
+                      help='compare the state digests with those saved in this JSON file')
+    options, paths = parser.parse_args(argv)
+    if len(paths) == 0:
+        raise Exception('Give the recordings, or directories of replay files, to replay')
+    return options, paths
+
+if __name__ == '__main__':
+    options, paths = readCommand(sys.argv[1:])
+    summary, seconds = replayAll(paths, options.workers, options.curveEvery)
+    summary.printSummary(seconds)
+    failures = len([stats for stats in summary.games if len(stats['problems']) > 0])
+    if options.checkDigests != None:
+        f = open(options.checkDigests)
+        try: failures += summary.checkDigests(json.load(f))
+        finally: f.close()
+    if options.saveDigests != None:
+        f = open(options.saveDigests, 'w')
+        try: json.dump(summary.getDigests(), f, indent=1, sort_keys=True)
+        finally: f.close()
+    sys.exit(1 if failures > 0 else 0)
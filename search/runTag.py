@@ -1,8 +1,19 @@
 from tagGame import TagGameRules, TagGameState
 from tagAgents import TagPacmanAgent, TagGhostAgent, KeyboardTagPacmanAgent, SmartTagGhostAgent
 from game import Game
+from pacman import parseAgentArgs
+import tagAgents
+import ghostAgents
+import agentHost
+import corridors
+import gameLog
 import layout
+import pathCache
+import replayFile
+import trajectoryLog
+import random
 import sys
+import time
 from optparse import OptionParser
 
 def default(str):
@@ -19,6 +30,26 @@ def readCommand(argv):
                     - starts a tag game on a different map
                 (4) python runTag.py --maxTags 20
                     - game ends after 20 tags
+                (5) python runTag.py -q -n 50 --smartGhost
+                    - plays 50 quiet games and prints a summary
+                (6) python runTag.py -g AlphaBetaTagAgent --ghostArgs timeLimit=0.1
+                    - the ghost plays with alpha-beta search
+                (7) python runTag.py -g MCTSTagAgent --ghostArgs timeLimit=0 --timeout 2
+                    - the ghost searches for as long as each 2 second move allows
+                (8) python runTag.py -p AlphaBetaTagAgent --pacmanArgs ponder=1
+                    - Pacman keeps searching while the ghost moves
+                (9) python runTag.py -q -n 100 -l mediumClassic --trajectoryDir trajectories
+                    - logs every ply of 100 games to shards in trajectories/
+                (10) python runTag.py -q -n 20 -l mediumClassic -c --moveTimeout 0.05 -g AlphaBetaTagAgent --ghostArgs timeLimit=0
+                    - the ghost searches for 50 ms a move and crashes if it runs over
+                (11) python runTag.py -q -n 20 -l mediumClassic --hostAgents
+                    - each agent plays in its own worker process
+                (12) python runTag.py -l mediumClassic --replay recorded-tag-games-....rpl --replayStart 300
+                    - shows the first game recorded with -r from its 300th ply on
+                (13) python runTag.py -q -n 200 -l mediumClassic --skipCorridors -p TagPacmanAgent --pacmanArgs corridors=1 -g TagGhostAgent --ghostArgs corridors=1
+                    - plays the moves down corridors several at a time
+                (14) python runTag.py -l mediumClassic --itSpeed 1 --runnerSpeed 0.5
+                    - whoever is IT moves twice for every move of the other
     """
     parser = OptionParser(usageStr)
     
@@ -43,15 +74,71 @@ def readCommand(argv):
     parser.add_option('--maxMoves', dest='maxMoves', type='int',
                       help=default('Maximum number of moves before game ends'),
                       default=1000)
-    parser.add_option('--timeout', dest='timeout', type='int',
+    parser.add_option('--itSpeed', dest='itSpeed', type='float',
+                      help=default('Moves per time unit of the player who is IT'), default=1.0)
+    parser.add_option('--runnerSpeed', dest='runnerSpeed', type='float',
+                      help=default('Moves per time unit of the player who is not IT'), default=1.0)
+    parser.add_option('--timeout', dest='timeout', type='float',
                       help=default('Maximum time for agent computation'),
                       default=30)
+    parser.add_option('--moveTimeout', dest='moveTimeout', type='float',
+                      help='Maximum time in seconds (fractions allowed) for a single move [Default: the timeout]',
+                      default=None)
+    parser.add_option('-c', '--catchExceptions', action='store_true', dest='catchExceptions',
+                      help='Enforce the timeouts and treat agent errors as crashes', default=False)
     parser.add_option('--smartGhost', action='store_true', dest='smartGhost',
                       help='Use smart A* pathfinding ghost (much better at chasing!)', default=False)
+    parser.add_option('-p', '--pacman', dest='pacman',
+                      help='the agent TYPE in the tagAgents module to use for Pacman', metavar='TYPE', default=None)
+    parser.add_option('-g', '--ghost', dest='ghost',
+                      help='the agent TYPE in the tagAgents module to use for the ghost', metavar='TYPE', default=None)
+    parser.add_option('--pacmanArgs', dest='pacmanArgs',
+                      help='Comma separated values sent to the Pacman agent. e.g. "opt1=val1,opt2,opt3=val3"')
+    parser.add_option('--ghostArgs', dest='ghostArgs',
+                      help='Comma separated values sent to the ghost agent. e.g. "opt1=val1,opt2,opt3=val3"')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int',
+                      help=default('the number of GAMES to play; more than one runs a quiet batch'),
+                      metavar='GAMES', default=1)
+    parser.add_option('--pathCacheSize', dest='pathCacheSize', type='int',
+                      help=default('Maximum number of shortest paths kept in memory across games'),
+                      default=100000)
+    parser.add_option('--pathCacheFile', dest='pathCacheFile',
+                      help='Spill evicted shortest paths to this on-disk store', default=None)
+    parser.add_option('--fastGame', action='store_true', dest='fastGame',
+                      help='Play batches with the lean game loop for trusted agents (no timeouts)', default=False)
+    parser.add_option('--skipCorridors', action='store_true', dest='skipCorridors',
+                      help='Play the plies of a batch in which no agent has a choice several at a time (implies --fastGame)',
+                      default=False)
+    parser.add_option('--hostAgents', action='store_true', dest='hostAgents',
+                      help='Run each agent in its own worker process', default=False)
+    parser.add_option('-r', '--recordActions', action='store_true', dest='record',
+                      help='Writes the games to a replay file (named by the time they were played)', default=False)
+    parser.add_option('--replay', dest='gameToReplay',
+                      help='A replay file (or pickled game log) to replay', default=None)
+    parser.add_option('--replayGame', dest='replayGame', type='int',
+                      help=default('Which game of the replay file to show'), default=1)
+    parser.add_option('--replayStart', dest='replayStart', type='int',
+                      help=default('The ply a replay starts from'), default=0)
+    parser.add_option('-s', '--seed', dest='seed', type='int',
+                      help='Seeds game i of a run with SEED + i, so recorded games can be played again', default=None)
+    parser.add_option('--boundedMemory', action='store_true', dest='boundedMemory',
+                      help='Spill move histories to disk and keep only the end of muted agent output, for very long games',
+                      default=False)
+    parser.add_option('--trajectoryDir', dest='trajectoryDir',
+                      help='Log every ply of a batch run to trajectory shards in this directory', default=None)
+    parser.add_option('--shardSize', dest='shardSize', type='float',
+                      help=default('Start a new trajectory shard after this many megabytes'),
+                      default=64)
                       
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
         raise Exception('Command line input not understood: ' + str(otherjunk))
+    if (options.fastGame or options.skipCorridors) and options.catchExceptions:
+        raise Exception('--fastGame and --skipCorridors cannot be combined with --catchExceptions')
+    if options.record and options.itSpeed != options.runnerSpeed:
+        raise Exception('Replay files store plies in turn order, so games with --itSpeed and --runnerSpeed cannot be recorded')
+    if options.itSpeed <= 0 or options.runnerSpeed <= 0:
+        raise Exception('Speeds must be positive')
     
     return options
 
@@ -64,13 +151,22 @@ def loadLayout(layoutName):
         print(f"Layout '{layoutName}' not found. Using mediumMaze instead.")
         return layoutModule.getLayout('mediumMaze')
 
-def runTagGame(options):
-  
-    # Load the layout
-    layoutObj = loadLayout(options.layout)
-    
-    # Create agents
-    if options.keyboard:
+def loadTagAgent(agentType, index, agentArgs):
+    for module in [tagAgents, ghostAgents]:
+        if hasattr(module, agentType):
+            return getattr(module, agentType)(index, **parseAgentArgs(agentArgs))
+    raise Exception('The agent ' + agentType + ' is not specified in tagAgents.py or ghostAgents.py.')
+
+def createAgents(options):
+    """
+    Returns the (pacman, ghost) agents selected on the command line.
+    """
+    if options.hostAgents:
+        return createHostedAgents(options)
+    if options.pacman != None:
+        pacmanAgent = loadTagAgent(options.pacman, 0, options.pacmanArgs)
+        print(f"Using {options.pacman} for Pacman.")
+    elif options.keyboard:
         pacmanAgent = KeyboardTagPacmanAgent(0)
         print("\n=== KEYBOARD CONTROLS ===")
         print("W/Up Arrow    - Move North")
@@ -86,14 +182,33 @@ def runTagGame(options):
         print("==================\n")
     
     # Choose ghost agent based on options
-    if options.smartGhost:
+    if options.ghost != None:
+        ghostAgent = loadTagAgent(options.ghost, 1, options.ghostArgs)
+        print(f"Using {options.ghost} for the ghost.")
+    elif options.smartGhost:
         ghostAgent = SmartTagGhostAgent(1)
         print("Using SMART Ghost with A* pathfinding!")
     else:
         ghostAgent = TagGhostAgent(1)
         print("Using standard Ghost agent.")
-    
-    # Create display
+    return pacmanAgent, ghostAgent
+
+def createHostedAgents(options):
+    """
+    Returns (pacman, ghost) stand-ins for the agents selected on the command
+    line, each playing in its own worker process.
+    """
+    if options.keyboard:
+        raise Exception('The keyboard agent cannot be hosted in a worker process')
+    pacmanType = options.pacman or 'TagPacmanAgent'
+    ghostType = options.ghost or ('SmartTagGhostAgent' if options.smartGhost else 'TagGhostAgent')
+    timeout = options.moveTimeout or options.timeout
+    mute = options.numGames > 1
+    print(f"Hosting {pacmanType} (Pacman) and {ghostType} (ghost) in worker processes.")
+    return (agentHost.HostedAgent(pacmanType, 0, options.pacmanArgs, timeout, mute),
+            agentHost.HostedAgent(ghostType, 1, options.ghostArgs, timeout, mute))
+
+def createDisplay(options):
     if options.quietGraphics:
         import textDisplay
         display = textDisplay.NullGraphics()
@@ -104,12 +219,60 @@ def runTagGame(options):
     else:
         import graphicsDisplay
         display = graphicsDisplay.PacmanGraphics(options.zoom, frameTime=options.frameTime)
+    return display
+
+def configurePathCache(options):
+    if options.pathCacheFile != None or options.pathCacheSize != pathCache.PATH_CACHE.paths.maxSize:
+        pathCache.PATH_CACHE = pathCache.PathCache(options.pathCacheSize, options.pathCacheFile)
+
+def createRecorder(options):
+    "A replay file for the games about to be played, if options.record is set."
+    if not options.record:
+        return None
+    fname = 'recorded-tag-games-' + '-'.join([str(t) for t in time.localtime()[1:6]]) + '.rpl'
+    return replayFile.ReplayWriter(fname)
+
+def startGame(game, layoutObj, rules, recorder, options, number):
+    """
+    Seeds the game's randomness when options.seed is set, bounds its memory
+    with options.boundedMemory and starts its record in the recorder, if
+    there is one.
+    """
+    if options.boundedMemory:
+        game.limitMemory()
+    seed = None
+    if options.seed != None:
+        seed = options.seed + number
+        random.seed(seed)
+    if recorder != None:
+        recorder.startGame('tag', layoutObj, len(game.agents), seed, {'maxTags': rules.maxTags, 'maxMoves': rules.maxMoves},
+                           [agent.__class__.__name__ for agent in game.agents])
+        game.log = recorder
+
+def endGame(game, recorder):
+    if recorder != None:
+        recorder.endGame(game.state, game.agentCrashed)
+
+def runTagGame(options):
+  
+    # Load the layout
+    layoutObj = loadLayout(options.layout)
+    
+    # Create agents
+    pacmanAgent, ghostAgent = createAgents(options)
+    
+    # Create display
+    display = createDisplay(options)
     
     # Create game rules
-    rules = TagGameRules(timeout=options.timeout, maxTags=options.maxTags, maxMoves=options.maxMoves)
+    rules = TagGameRules(timeout=options.timeout, maxTags=options.maxTags, maxMoves=options.maxMoves,
+                         moveTimeout=options.moveTimeout, itSpeed=options.itSpeed, runnerSpeed=options.runnerSpeed)
     
     # Create and run the game
-    game = rules.newGame(layoutObj, pacmanAgent, [ghostAgent], display, quiet=False, catchExceptions=False)
+    game = rules.newGame(layoutObj, pacmanAgent, [ghostAgent], display, quiet=False,
+                         catchExceptions=options.catchExceptions)
+    recorder = createRecorder(options)
+    startGame(game, layoutObj, rules, recorder, options, 0)
     
     print(f"\n{'='*60}")
     print(f"{'TAG GAME - START!':^60}")
@@ -124,7 +287,15 @@ def runTagGame(options):
     print(f"  * IT chases, the other runs!")
     print(f"{'='*60}\n")
     
-    game.run()
+    try:
+        game.run()
+        endGame(game, recorder)
+    finally:
+        # A game that raised is kept in the recording, cut short
+        if recorder != None:
+            recorder.close()
+    if recorder != None:
+        print(recorder.getStats())
     
     # Print final statistics
     print(f"\n=== Final Statistics ===")
@@ -133,14 +304,104 @@ def runTagGame(options):
     print(f"Score: {game.state.data.score}")
     who_is_it = "Pacman" if getattr(game.state.data, 'pacman_is_it', True) else "Ghost"
     print(f"Final IT: {who_is_it}")
+    printAgentTimes([game])
+    for agent in [pacmanAgent, ghostAgent]:
+        if hasattr(agent, 'getSearchStats'):
+            print(agent.getSearchStats())
     print(f"========================\n")
     
     return game
 
+def printAgentTimes(games):
+    "Prints each agent's time on its own moves, and pondering during the other's."
+    for index, name in enumerate(['Pacman', 'Ghost']):
+        thinking = sum(game.totalAgentTimes[index] for game in games)
+        pondering = sum(game.totalPonderTimes[index] for game in games)
+        line = f"{name + ' time:':<15}{thinking:.2f}s"
+        if pondering > 0:
+            line += f" (+{pondering:.2f}s pondering)"
+        print(line)
+
+def runTagGames(options):
+    """
+    Plays options.numGames quiet games with the same agents and layout and
+    prints a summary.  Agents (and the shared path cache) persist between
+    games, like the agents of pacman.runGames.
+    """
+    layoutObj = loadLayout(options.layout)
+    pacmanAgent, ghostAgent = createAgents(options)
+    display = createDisplay(options)
+    rules = TagGameRules(timeout=options.timeout, maxTags=options.maxTags, maxMoves=options.maxMoves,
+                         moveTimeout=options.moveTimeout, itSpeed=options.itSpeed, runnerSpeed=options.runnerSpeed)
+    if options.trajectoryDir != None:
+        rules.recorder = trajectoryLog.TrajectoryWriter(options.trajectoryDir, int(options.shardSize * 2**20),
+                                                        layoutName=options.layout)
+
+    recorder = createRecorder(options)
+    skipper = corridors.CorridorSkipper(layoutObj) if options.skipCorridors else None
+    if skipper != None and not all(getattr(agent, 'followsCorridors', False) for agent in [pacmanAgent, ghostAgent]):
+        print('Both agents must follow corridors (corridors=1) for --skipCorridors to skip any plies.')
+
+    games = []
+    startTime = time.time()
+    try:
+        for i in range(options.numGames):
+            game = rules.newGame(layoutObj, pacmanAgent, [ghostAgent], display, quiet=True,
+                                 catchExceptions=options.catchExceptions, fast=options.fastGame or options.skipCorridors)
+            game.muteAgents = True
+            game.skipper = skipper
+            startGame(game, layoutObj, rules, recorder, options, i)
+            game.run()
+            endGame(game, recorder)
+            games.append(game)
+    finally:
+        # A game that raised is kept in the recording, cut short
+        if rules.recorder != None:
+            rules.recorder.close()
+        if recorder != None:
+            recorder.close()
+
+    winners = [getattr(game, 'winner', None) for game in games]
+    tags = [getattr(game.state.data, 'tag_count', 0) for game in games]
+    moves = [getattr(game.state.data, 'move_count', 0) for game in games]
+    print(f"\n=== Batch Statistics ===")
+    print(f"Games:         {len(games)}")
+    print(f"Pacman wins:   {winners.count('PACMAN')}")
+    print(f"Phantom wins:  {winners.count('PHANTOM')}")
+    print(f"No winner:     {winners.count(None)}")
+    crashes = [game.agentCrashed for game in games].count(True)
+    if crashes > 0:
+        print(f"Crashed:       {crashes} (out of time or error)")
+    print(f"Average tags:  {sum(tags) / float(len(games)):.2f}")
+    print(f"Average moves: {sum(moves) / float(len(games)):.2f}")
+    print(f"Plies/sec:     {sum(moves) / (time.time() - startTime):.0f}")
+    printAgentTimes(games)
+    print(pathCache.PATH_CACHE.getStats())
+    if skipper != None:
+        print(skipper.getStats())
+    if rules.recorder != None:
+        print(rules.recorder.getStats())
+    if recorder != None:
+        print(recorder.getStats())
+    for agent in [pacmanAgent, ghostAgent]:
+        if hasattr(agent, 'getSearchStats'):
+            print(agent.getSearchStats())
+    print(f"========================\n")
+    return games
+
 if __name__ == '__main__':
     """
     The main function called when runTag.py is run from the command line.
     """
     options = readCommand(sys.argv[1:])
-    game = runTagGame(options)
+    configurePathCache(options)
+    if options.gameToReplay != None:
+        print('Replaying recorded game %s.' % options.gameToReplay)
+        log = replayFile.loadGameLog(options.gameToReplay, options.replayGame)
+        gameLog.replayLog(log, createDisplay(options), options.replayStart)
+    elif options.numGames > 1:
+        games = runTagGames(options)
+    else:
+        game = runTagGame(options)
+    pathCache.PATH_CACHE.close()
 
@@ -42,6 +42,7 @@ import util
 import time
 import search
 import pacman
+import pathCache
 
 class GoWestAgent(Agent):
     "An agent that goes West until it can't."
@@ -532,11 +533,76 @@ def mazeDistance(point1: Tuple[int, int], point2: Tuple[int, int], gameState: pa
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
     This might be a useful helper function for your ApproximateSearchAgent.
+
+    Paths are shared through pathCache.PATH_CACHE, so repeated queries on the
+    same layout (even from later games) do not search again.
     """
     x1, y1 = point1
     x2, y2 = point2
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
-    prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    def searchPath():
+        prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
+        return search.bfs(prob)
+    path = pathCache.PATH_CACHE.findPath(gameState.data.layout, point1, point2, searchPath)
+    return len(path)
+
+def mazeDistances(pairs: List[Tuple[Tuple[int, int], Tuple[int, int]]], gameState: pacman.GameState, returnPaths: bool = False):
+    """
+    Returns the maze distances for many (point1, point2) pairs at once.
+
+    Pairs are grouped by point1 and a single breadth-first search is run from
+    each distinct source.  The search stops as soon as every target requested
+    for that source has been reached, so asking for ten targets from the same
+    source costs one search instead of ten.
+
+    Returns a dict mapping each (point1, point2) pair to its distance, or None
+    if point2 cannot be reached.  If returnPaths is True, a second dict is
+    returned mapping each pair to the list of actions from point1 to point2.
+
+    Example usage: distances = mazeDistances([((2,4), (5,6)), ((2,4), (1,1))], gameState)
+    """
+    walls = gameState.getWalls()
+    targetsBySource = {}
+    for point1, point2 in pairs:
+        assert not walls[point1[0]][point1[1]], 'point1 is a wall: ' + str(point1)
+        assert not walls[point2[0]][point2[1]], 'point2 is a wall: ' + str(point2)
+        targetsBySource.setdefault(point1, set()).add(point2)
+
+    distances, paths = {}, {}
+    for source, targets in targetsBySource.items():
+        prob = PositionSearchProblem(gameState, start=source, goal=None, warn=False, visualize=False)
+        # parents[state] = (previous state, action taken from it)
+        parents = {source: None}
+        depth = {source: 0}
+        remaining = set(targets)
+        remaining.discard(source)
+        frontier = util.Queue()
+        frontier.push(source)
+        while remaining and not frontier.isEmpty():
+            state = frontier.pop()
+            for successor, action, stepCost in prob.getSuccessors(state):
+                if successor in parents: continue
+                parents[successor] = (state, action)
+                depth[successor] = depth[state] + 1
+                remaining.discard(successor)
+                frontier.push(successor)
+
+        for target in targets:
+            distances[(source, target)] = depth.get(target)
+            if not returnPaths: continue
+            if target not in parents:
+                paths[(source, target)] = None
+                continue
+            actions = []
+            state = target
+            while parents[state] is not None:
+                state, action = parents[state]
+                actions.append(action)
+            actions.reverse()
+            paths[(source, target)] = actions
+
+    if returnPaths:
+        return distances, paths
+    return distances
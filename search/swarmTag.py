@@ -0,0 +1,319 @@
+"""
+Swarm tag: many Pacmen and many ghosts playing tag in one arena.
+
+The rules are those of tagGame.py generalized to teams.  Every agent is
+either IT or not; all the Pacmen start IT.  An IT agent tags an agent of
+the other kind that is not IT when they come within TAG_DISTANCE, and the
+two swap roles and may not tag or be tagged for TAG_COOLDOWN ticks.  Every
+agent that is not IT earns POINTS_PER_TICK per tick.  All agents move at
+once each tick; ghosts may neither stop nor turn back, as in tag.
+
+Agents only look at the opponents within a small sight radius, and both
+those lookups and tag detection go through a uniform-grid spatial hash, so
+a tick costs time proportional to the number of agents rather than to the
+number of pairs.  The game runs headless; --show prints the arena as text.
+
+> python swarmTag.py -p 200 -g 200 --ticks 500
+> python swarmTag.py -p 20 -g 20 --width 40 --height 20 --show 10
+"""
+import random
+import sys
+import time
+from game import Directions
+from tagGame import TAG_DISTANCE, TAG_COOLDOWN, POINTS_PER_TICK
+import layout
+import tagModel
+
+PACMAN, GHOST = 0, 1
+
+def generateArena(width, height, wallDensity=0.15, rng=random):
+    """
+    Returns a random width x height Layout: a walled border and straight
+    wall segments inside, with any pocket cut off from the main open area
+    filled in so every open cell can reach every other.  wallDensity, the
+    share of the inner cells to wall, must be in [0, 1).
+    """
+    if not 0 <= wallDensity < 1:
+        raise Exception('The wall density must be at least 0 and below 1, not %s' % wallDensity)
+    if width < 3 or height < 3:
+        raise Exception('A %d x %d arena has no room inside its border' % (width, height))
+    walls = [[x in (0, width - 1) or y in (0, height - 1) for y in range(height)] for x in range(width)]
+    target = int(wallDensity * (width - 2) * (height - 2))
+    placed = 0
+    while placed < target:
+        x, y = rng.randrange(1, width - 1), rng.randrange(1, height - 1)
+        dx, dy = rng.choice([(1, 0), (0, 1)])
+        for step in range(rng.randint(2, 5)):
+            if x >= width - 1 or y >= height - 1: break
+            if not walls[x][y]:
+                walls[x][y] = True
+                placed += 1
+            x, y = x + dx, y + dy
+
+    # Keep the largest connected open area
+    seen = {}
+    best = []
+    for x in range(width):
+        for y in range(height):
+            if walls[x][y] or (x, y) in seen: continue
+            component = [(x, y)]
+            seen[(x, y)] = True
+            for cx, cy in component:
+                for nx, ny in ((cx + 1, cy), (cx - 1, cy), (cx, cy + 1), (cx, cy - 1)):
+                    if not walls[nx][ny] and (nx, ny) not in seen:
+                        seen[(nx, ny)] = True
+                        component.append((nx, ny))
+            if len(component) > len(best):
+                best = component
+    if len(best) == 0:
+        raise Exception('A wall density of %s leaves no open cells in a %d x %d arena' % (wallDensity, width, height))
+    keep = set(best)
+    text = [''.join('%' if walls[x][y] or (x, y) not in keep else ' ' for x in range(width))
+            for y in range(height - 1, -1, -1)]
+    return layout.Layout(text)
+
+class SpatialHash:
+    """
+    Buckets of bucketSize x bucketSize cells, each holding the items inside
+    it.  A query returns every item in the buckets overlapping a square
+    around a position, in the order the items were inserted.
+    """
+    def __init__(self, bucketSize=4):
+        self.bucketSize = bucketSize
+        self.buckets = {}
+
+    def clear(self):
+        self.buckets = {}
+
+    def insert(self, item, position):
+        key = (position[0] // self.bucketSize, position[1] // self.bucketSize)
+        bucket = self.buckets.get(key)
+        if bucket == None:
+            self.buckets[key] = [item]
+        else:
+            bucket.append(item)
+
+    def rebuild(self, positions):
+        "Indexes item i at positions[i], replacing what was there before."
+        self.buckets = {}
+        for item, position in enumerate(positions):
+            self.insert(item, position)
+
+    def query(self, position, radius):
+        "Items that may lie within radius (in x and in y) of position."
+        x, y = position
+        size = self.bucketSize
+        found = []
+        for bx in range((x - radius) // size, (x + radius) // size + 1):
+            for by in range((y - radius) // size, (y + radius) // size + 1):
+                bucket = self.buckets.get((bx, by))
+                if bucket != None:
+                    found.extend(bucket)
+        return found
+
+class SwarmTagGame:
+    """
+    The state of a swarm tag game and its per-tick update.  Agents are
+    numbered with the Pacmen first; cells are tagModel cell indices.
+    """
+    def __init__(self, layout, numPacmen, numGhosts, seed=None, sightRadius=5,
+                 bucketSize=4, bestProb=0.8, allPairs=False):
+        self.model = tagModel.getModel(layout)
+        self.rng = random.Random(seed)
+        numAgents = numPacmen + numGhosts
+        if numAgents > self.model.numCells:
+            raise Exception('%d agents do not fit in an arena with %d open cells' % (numAgents, self.model.numCells))
+        self.kinds = [PACMAN] * numPacmen + [GHOST] * numGhosts
+        self.cells = self.rng.sample(range(self.model.numCells), numAgents)
+        self.directions = [Directions.STOP] * numAgents
+        self.isIt = [kind == PACMAN for kind in self.kinds]
+        self.cooldowns = [0] * numAgents
+        self.scores = [0.0] * numAgents
+        self.sightRadius = sightRadius
+        self.bestProb = bestProb
+        self.allPairs = allPairs
+        self.index = SpatialHash(bucketSize)
+        self.ticks = 0
+        self.tagCount = 0
+
+    def getPositions(self):
+        positions = self.model.positions
+        return [positions[cell] for cell in self.cells]
+
+    def getLegalActions(self, agent):
+        cell = self.cells[agent]
+        if self.kinds[agent] == GHOST:
+            return self.model.ghostActions[cell][self.directions[agent]]
+        legal = self.model.pacmanActions[cell]
+        if len(legal) > 1:
+            legal = [a for a in legal if a != Directions.STOP]
+        return legal
+
+    def nearestOpponent(self, agent, positions):
+        """
+        The closest agent in sight that agent should chase (when IT) or run
+        from (when not): one of the other kind with the other role.
+        """
+        x, y = positions[agent]
+        kind, isIt = self.kinds[agent], self.isIt[agent]
+        best, bestDistance = None, self.sightRadius + 1
+        for other in self.index.query((x, y), self.sightRadius):
+            if self.kinds[other] == kind or self.isIt[other] == isIt: continue
+            ox, oy = positions[other]
+            distance = abs(x - ox) + abs(y - oy)
+            if distance < bestDistance or (best != None and distance == bestDistance and other < best):
+                best, bestDistance = other, distance
+        return best
+
+    def chooseAction(self, agent, positions):
+        """
+        The greedy policy of TagGhostAgent: with probability bestProb the
+        move that best closes (when IT) or opens the Manhattan distance to
+        the nearest opponent in sight, and otherwise any legal move.
+        """
+        legal = self.getLegalActions(agent)
+        opponent = self.nearestOpponent(agent, positions)
+        if opponent == None or self.rng.random() >= self.bestProb:
+            return legal[int(self.rng.random() * len(legal))]
+        ox, oy = positions[opponent]
+        moves = self.model.moves[self.cells[agent]]
+        sign = 1 if self.isIt[agent] else -1
+        cellPositions = self.model.positions
+        def score(action):
+            x, y = cellPositions[moves[action]]
+            return sign * (abs(x - ox) + abs(y - oy))
+        return min(legal, key=score)
+
+    def detectTags(self, positions):
+        """
+        Returns (tagger, tagged) pairs for this tick.  Each IT agent, in
+        index order, tags the lowest numbered eligible agent next to it;
+        nobody takes part in two tags in one tick.
+        """
+        cooldowns, isIt, kinds = self.cooldowns, self.isIt, self.kinds
+        taken = set()
+        tags = []
+        for agent in range(len(positions)):
+            if not isIt[agent] or cooldowns[agent] > 0 or agent in taken: continue
+            x, y = positions[agent]
+            if self.allPairs:
+                candidates = range(len(positions))
+            else:
+                candidates = self.index.query((x, y), 1)
+            target = None
+            for other in candidates:
+                if kinds[other] == kinds[agent] or isIt[other] or cooldowns[other] > 0 or other in taken: continue
+                ox, oy = positions[other]
+                if abs(x - ox) + abs(y - oy) <= TAG_DISTANCE and (target == None or other < target):
+                    target = other
+            if target != None:
+                taken.add(agent)
+                taken.add(target)
+                tags.append((agent, target))
+        return tags
+
+    def step(self):
+        "Advances the game by one tick and returns the tags that happened."
+        positions = self.getPositions()
+        self.index.rebuild(positions)
+        actions = [self.chooseAction(agent, positions) for agent in range(len(self.cells))]
+        moves = self.model.moves
+        for agent, action in enumerate(actions):
+            self.cells[agent] = moves[self.cells[agent]][action]
+            if action != Directions.STOP:
+                self.directions[agent] = action
+
+        # Tag rules, as in TagGameRules.applyTagRules
+        self.cooldowns = [c - 1 if c > 0 else 0 for c in self.cooldowns]
+        positions = self.getPositions()
+        self.index.rebuild(positions)
+        tags = self.detectTags(positions)
+        for tagger, tagged in tags:
+            self.isIt[tagger], self.isIt[tagged] = False, True
+            self.cooldowns[tagger] = self.cooldowns[tagged] = TAG_COOLDOWN
+        self.tagCount += len(tags)
+        for agent, isIt in enumerate(self.isIt):
+            if not isIt:
+                self.scores[agent] += POINTS_PER_TICK
+        self.ticks += 1
+        return tags
+
+    def getTeamScores(self):
+        "Total points of the Pacmen and of the ghosts."
+        totals = [0.0, 0.0]
+        for kind, score in zip(self.kinds, self.scores):
+            totals[kind] += score
+        return totals
+
+    def render(self):
+        "The arena as text: P/G for agents that are IT, p/g for the others."
+        text = [list(line) for line in self.model.layout.layoutText]
+        top = len(text) - 1
+        for agent, (x, y) in enumerate(self.getPositions()):
+            symbol = 'P' if self.kinds[agent] == PACMAN else 'G'
+            text[top - y][x] = symbol if self.isIt[agent] else symbol.lower()
+        return '\n'.join(''.join(line) for line in text)
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python swarmTag.py <options>')
+    parser.add_option('-p', '--pacmen', dest='pacmen', type='int', default=100,
+                      help='the number of Pacmen [Default: %default]')
+    parser.add_option('-g', '--ghosts', dest='ghosts', type='int', default=100,
+                      help='the number of ghosts [Default: %default]')
+    parser.add_option('-l', '--layout', dest='layout', default=None,
+                      help='play on this LAYOUT instead of a generated arena')
+    parser.add_option('--width', dest='width', type='int', default=80,
+                      help='width of the generated arena [Default: %default]')
+    parser.add_option('--height', dest='height', type='int', default=50,
+                      help='height of the generated arena [Default: %default]')
+    parser.add_option('--wallDensity', dest='wallDensity', type='float', default=0.15,
+                      help='fraction of the generated arena that is wall, from 0 up to (not including) 1 [Default: %default]')
+    parser.add_option('-t', '--ticks', dest='ticks', type='int', default=500,
+                      help='the number of ticks to play [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=None,
+                      help='random seed for the arena and the agents')
+    parser.add_option('--sight', dest='sight', type='int', default=5,
+                      help='how far agents look for opponents [Default: %default]')
+    parser.add_option('--bucketSize', dest='bucketSize', type='int', default=4,
+                      help='side of a spatial hash bucket, in cells [Default: %default]')
+    parser.add_option('--allPairs', dest='allPairs', action='store_true', default=False,
+                      help='detect tags by checking all pairs (for comparison)')
+    parser.add_option('--show', dest='show', type='int', default=0,
+                      help='print the arena every SHOW ticks [Default: headless]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    if not 0 <= options.wallDensity < 1:
+        raise Exception('--wallDensity must be at least 0 and below 1, not %s' % options.wallDensity)
+    return options
+
+def runSwarm(options):
+    rng = random.Random(options.seed)
+    if options.layout != None:
+        arena = layout.getLayout(options.layout)
+        if arena == None: raise Exception("The layout " + options.layout + " cannot be found")
+    else:
+        arena = generateArena(options.width, options.height, options.wallDensity, rng)
+    game = SwarmTagGame(arena, options.pacmen, options.ghosts, rng.getrandbits(32), options.sight,
+                        options.bucketSize, allPairs=options.allPairs)
+    startTime = time.time()
+    for tick in range(options.ticks):
+        game.step()
+        if options.show > 0 and tick % options.show == 0:
+            print(game.render())
+            print('Tick %d: %d tags\n' % (game.ticks, game.tagCount))
+    elapsed = time.time() - startTime
+
+    numAgents = options.pacmen + options.ghosts
+    pacmanPoints, ghostPoints = game.getTeamScores()
+    print('Agents:        %d (%d Pacmen, %d ghosts) on %d open cells' %
+          (numAgents, options.pacmen, options.ghosts, game.model.numCells))
+    print('Ticks:         %d in %.2fs (%.1f ticks/sec, %.1f us per agent per tick)' %
+          (game.ticks, elapsed, game.ticks / max(elapsed, 1e-9), 1e6 * elapsed / max(1, game.ticks * numAgents)))
+    print('Tags:          %d' % game.tagCount)
+    print('Points:        Pacmen %.0f, ghosts %.0f' % (pacmanPoints, ghostPoints))
+    return game
+
+if __name__ == '__main__':
+    runSwarm(readCommand(sys.argv[1:]))
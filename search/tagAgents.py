@@ -3,15 +3,45 @@ from game import Directions
 from game import Actions
 from util import manhattanDistance
 import random
+import time
+import math
+import atexit
+import threading
+import multiprocessing
 import util
 import search
+import searchAgents
+import pathCache
+import tagModel
+import flowField
+from tagGame import TagGameRules, TAG_COOLDOWN, POINTS_PER_TICK
+import tagGame
 from game import Grid
 
 class TagPacmanAgent(Agent):
-    def __init__(self, index=0):
+    """
+    Greedy Pacman: closes the Manhattan distance to the ghost when IT and
+    opens it otherwise.  The choice only depends on the two positions, who
+    is IT and the legal moves, so decisions are memoized in an LRU cache of
+    cacheSize entries that lives as long as the agent (across a batch).
+    With corridors=1 Pacman keeps going down corridors and only decides at
+    junctions, so corridors.CorridorSkipper can skip his corridor moves.
+    """
+    def __init__(self, index=0, cacheSize=10000, corridors=0):
         self.index = index
+        self.decisions = util.LRUCache(int(cacheSize))
+        self.followsCorridors = bool(int(corridors))
+        self.calls = 0
+        self.totalTime = 0.0
         
     def getAction(self, state):
+        startTime = time.perf_counter()
+        action = self.chooseAction(state)
+        self.calls += 1
+        self.totalTime += time.perf_counter() - startTime
+        return action
+
+    def chooseAction(self, state):
         # Get game state information
         legal = state.getLegalActions(self.index)
         if Directions.STOP in legal:
@@ -19,6 +49,13 @@ class TagPacmanAgent(Agent):
         
         if not legal:
             return Directions.STOP
+
+        if self.followsCorridors and len(legal) > 1:
+            # Never turn back where there is another way (the ghost's rule)
+            reverse = Actions.reverseDirection(state.data.agentStates[self.index].configuration.direction)
+            ahead = [action for action in legal if action != reverse]
+            if len(ahead) == 1:
+                return ahead[0]
             
         # Get positions
         pacmanPos = state.getPacmanPosition()
@@ -31,6 +68,11 @@ class TagPacmanAgent(Agent):
         if hasattr(state.data, 'move_count') and state.data.move_count % 50 == 0:
             behavior = "CHASING Ghost" if pacman_is_it else "FLEEING from Ghost"
             print(f"[Pacman] Move {state.data.move_count}: {behavior}, pacman_is_it={pacman_is_it}")
+
+        key = (pacmanPos, ghostPos, pacman_is_it, tuple(legal))
+        bestAction = self.decisions.get(key)
+        if bestAction != None:
+            return bestAction
         
         # Calculate distances for each legal action
         actionDistances = []
@@ -52,20 +94,47 @@ class TagPacmanAgent(Agent):
             # Ghost is IT - Run from the ghost (maximize distance)
             bestAction = max(actionDistances, key=lambda x: x[1])[0]
         
+        self.decisions.put(key, bestAction)
         return bestAction
 
+    def getSearchStats(self):
+        "Returns the call rate and decision cache hit rate over all moves so far."
+        return getDecisionStats(self)
+
 
 class TagGhostAgent(Agent):
-    def __init__(self, index=1):
+    """
+    DirectionalGhost for tag: moves towards Pacman (when IT) or away from
+    him with probability 0.8 and at random otherwise.  The move distribution
+    only depends on the two positions, who is IT and the legal moves, so it
+    is memoized in an LRU cache of cacheSize entries and only sampled on a
+    hit, with the same random draws as building it afresh.  With
+    corridors=1 the ghost plays its only legal move (in a corridor) without
+    a random draw, so corridors.CorridorSkipper can skip those moves.
+    """
+    def __init__(self, index=1, cacheSize=10000, corridors=0):
         self.index = index
         self.prob_attack = 0.8  # Probability of chasing when IT
         self.prob_flee = 0.8    # Probability of fleeing when not IT
+        self.decisions = util.LRUCache(int(cacheSize))
+        self.followsCorridors = bool(int(corridors))
+        self.calls = 0
+        self.totalTime = 0.0
         
     def getAction(self, state):
+        startTime = time.perf_counter()
+        action = self.chooseAction(state)
+        self.calls += 1
+        self.totalTime += time.perf_counter() - startTime
+        return action
+
+    def chooseAction(self, state):
         # Get legal actions
         legal = state.getLegalActions(self.index)
         if not legal:
             return Directions.STOP
+        if self.followsCorridors and len(legal) == 1:
+            return legal[0]
             
         # Get positions
         pacmanPos = state.getPacmanPosition()
@@ -82,6 +151,12 @@ class TagGhostAgent(Agent):
         if hasattr(state.data, 'move_count') and state.data.move_count % 50 == 0:
             behavior = "FLEEING (scared)" if pacman_is_it else "CHASING (aggressive)"
             print(f"[Ghost] Move {state.data.move_count}: {behavior}, ghost_is_it={ghost_is_it}, scaredTimer={ghostState.scaredTimer}")
+
+        key = (ghostPos, pacmanPos, pacman_is_it, tuple(legal))
+        cached = self.decisions.get(key)
+        if cached != None:
+            actions, probabilities = cached
+            return util.sample(probabilities, actions)
         
         # Use DirectionalGhost algorithm
         from game import Actions
@@ -105,7 +180,6 @@ class TagGhostAgent(Agent):
         bestActions = [action for action, distance in zip(legal, distancesToPacman) if distance == bestScore]
         
         # Construct probability distribution (like DirectionalGhost)
-        import util
         dist = util.Counter()
         for a in bestActions:
             dist[a] = bestProb / len(bestActions)
@@ -113,8 +187,22 @@ class TagGhostAgent(Agent):
             dist[a] += (1 - bestProb) / len(legal)
         dist.normalize()
         
-        # Choose action based on distribution
-        return util.chooseFromDistribution(dist)
+        # Choose action based on distribution (util.sample orders it the same way)
+        items = sorted(dist.items())
+        actions, probabilities = tuple(a for a, p in items), tuple(p for a, p in items)
+        self.decisions.put(key, (actions, probabilities))
+        return util.sample(probabilities, actions)
+
+    def getSearchStats(self):
+        "Returns the call rate and decision cache hit rate over all moves so far."
+        return getDecisionStats(self)
+
+
+def getDecisionStats(agent):
+    "Summary line for the agents that memoize their decisions."
+    rate = agent.calls / max(agent.totalTime, 1e-9)
+    return '%s %d: %d calls (%.0f calls/sec), decision cache %d entries, hit rate %.2f' % \
+        (agent.__class__.__name__, agent.index, agent.calls, rate, len(agent.decisions), agent.decisions.hitRate())
 
 
 class ChaseProblem:
@@ -165,11 +253,73 @@ class ChaseProblem:
         return cost
 
 
+class FleePlanner:
+    """
+    Escape planner for whichever player is not IT.
+
+    The two players' breadth-first distance fields split the maze into the
+    cells each of them reaches first (a Voronoi partition).  The planner
+    picks the move that leaves the fleeing player the largest safe region,
+    weighted towards cells far from the chaser, instead of greedily
+    maximizing the one-step distance and running into dead ends the chaser
+    can seal off.
+
+    Distance fields are array-backed and cached per layout by tagModel, so
+    after the first few turns a plan costs one pass over the cells.
+    """
+    REGION_WEIGHT = 5
+
+    def __init__(self, layout):
+        self.model = tagModel.getModel(layout)
+
+    def getSafeCells(self, fleeCell, chaseCell, fleerMovesFirst=True):
+        """
+        Returns the cells the fleeing player can reach at least one step
+        before the chaser can get next to them.
+        """
+        model = self.model
+        fleeDistances = model.getDistances(fleeCell)
+        chaseDistances = model.getDistances(chaseCell)
+        lead = 0 if fleerMovesFirst else 1
+        return [c for c in range(model.numCells)
+                if 0 <= fleeDistances[c] and fleeDistances[c] + lead < chaseDistances[c] - 1]
+
+    def getFleeAction(self, legal, fleePos, chasePos, fleerMovesFirst=True):
+        """
+        Returns the legal action after which the fleeing player owns the
+        largest safe region, counting each step of distance from the chaser
+        as REGION_WEIGHT cells.  Steps next to the chaser are taken last.
+        """
+        model = self.model
+        fleeCell, chaseCell = model.cellOf(fleePos), model.cellOf(chasePos)
+        chaseDistances = model.getDistances(chaseCell)
+
+        def cost(action):
+            nextCell = model.moves[fleeCell][action]
+            # After this move the other player moves first
+            region = self.getSafeCells(nextCell, chaseCell, not fleerMovesFirst)
+            score = len(region) + self.REGION_WEIGHT * chaseDistances[nextCell]
+            return (chaseDistances[nextCell] <= 1, -score, -chaseDistances[nextCell])
+        return min(legal, key=cost)
+
+
 class SmartTagGhostAgent(Agent):
-    def __init__(self, index=1):
+    """
+    Chases along A* paths (shared through the path cache), or with
+    flowField=1 along the shared flow field towards Pacman, and flees with
+    the FleePlanner.
+    """
+    def __init__(self, index=1, flowField=0):
         self.index = index
         self.plannedPath = []  # Store planned path
         self.replanCounter = 0  # Counter to trigger replanning
+        self.planner = None  # FleePlanner for the current layout
+        self.useFlowField = bool(int(flowField))
+
+    def registerInitialState(self, state):
+        # Agents are reused across the games of a batch; drop the old plan
+        self.plannedPath = []
+        self.replanCounter = 0
         
     def getAction(self, state):
         legal = state.getLegalActions(self.index)
@@ -192,13 +342,20 @@ class SmartTagGhostAgent(Agent):
         self.replanCounter += 1
         shouldReplan = (self.replanCounter % 5 == 0) or (len(self.plannedPath) == 0)
         
-        if ghost_is_it:
+        if ghost_is_it and self.useFlowField:
+            # Maze distances to Pacman for every cell, updated once per move
+            field = flowField.getFlowField(state.data.layout)
+            field.setTarget(pacmanPos)
+            return field.getAction(ghostPos, legal)
+        elif ghost_is_it:
             # CHASE PACMAN using A* search
             if shouldReplan or len(self.plannedPath) == 0:
                 # Create search problem to reach Pacman
                 problem = ChaseProblem(state, self.index, pacmanPos, state.getWalls())
-                # Use A* with Manhattan heuristic for fast pathfinding
-                self.plannedPath = search.aStarSearch(problem, search.manhattanHeuristic)
+                # Use A* with Manhattan heuristic for fast pathfinding; paths are
+                # shared with every other game on this layout through the cache
+                self.plannedPath = pathCache.PATH_CACHE.findPath(state.data.layout, ghostPos, pacmanPos,
+                    lambda: search.aStarSearch(problem, search.manhattanHeuristic))
                 
                 # Debug output
                 if hasattr(state.data, 'move_count') and state.data.move_count % 50 == 0:
@@ -214,21 +371,9 @@ class SmartTagGhostAgent(Agent):
                     # Path blocked, replan next turn
                     self.plannedPath = []
         else:
-            # Use greedy approach but look ahead more
-            bestAction = None
-            bestDist = -1
-            
-            for action in legal:
-                # Look two steps ahead if possible
-                successor = self.getSuccessorPosition(ghostPos, action, state.getWalls())
-                if successor:
-                    dist = manhattanDistance(successor, pacmanPos)
-                    if dist > bestDist:
-                        bestDist = dist
-                        bestAction = action
-            
-            if bestAction:
-                return bestAction
+            # Run for the largest region we reach before Pacman does
+            # (Pacman moves right after the ghost)
+            return self.fleePlanner(state).getFleeAction(legal, ghostPos, pacmanPos, fleerMovesFirst=True)
         
         # Fallback: use greedy approach
         actionDistances = []
@@ -246,6 +391,11 @@ class SmartTagGhostAgent(Agent):
         
         return random.choice(legal) if legal else Directions.STOP
     
+    def fleePlanner(self, state):
+        if self.planner == None or self.planner.model.layout.getFingerprint() != state.data.layout.getFingerprint():
+            self.planner = FleePlanner(state.data.layout)
+        return self.planner
+
     def getSuccessorPosition(self, position, action, walls):
         dx, dy = Actions.directionToVector(action)
         nextx, nexty = int(position[0] + dx), int(position[1] + dy)
@@ -254,6 +404,587 @@ class SmartTagGhostAgent(Agent):
         return None
 
 
+class SmartTagPacmanAgent(Agent):
+    """
+    Pacman that chases along shortest maze paths when IT and otherwise runs
+    for safe territory with the FleePlanner.
+    """
+    def __init__(self, index=0):
+        self.index = index
+        self.planner = None
+
+    def fleePlanner(self, state):
+        if self.planner == None or self.planner.model.layout.getFingerprint() != state.data.layout.getFingerprint():
+            self.planner = FleePlanner(state.data.layout)
+        return self.planner
+
+    def getAction(self, state):
+        planner = self.fleePlanner(state)
+        legal = state.getLegalActions(self.index)
+        if Directions.STOP in legal and len(legal) > 1:
+            legal.remove(Directions.STOP)
+        pacmanPos = state.getPacmanPosition()
+        ghostPos = state.getGhostPosition(1)
+        if not state.data.pacman_is_it:
+            return planner.getFleeAction(legal, pacmanPos, ghostPos, fleerMovesFirst=True)
+
+        model = planner.model
+        ghostDistances = model.getDistances(model.cellOf(ghostPos))
+        pacmanCell = model.cellOf(pacmanPos)
+        return min(legal, key=lambda action: ghostDistances[model.moves[pacmanCell][action]])
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget runs out"""
+    pass
+
+
+class AnytimeTagAgent(Agent):
+    """
+    Base class for the search agents, which keep improving their move until
+    time runs out.  A move gets timeLimit seconds, cut short by the game's
+    MoveBudget when Game.run hands one over; with timeLimit=0 the agent
+    spends whatever the budget allows, less BUDGET_RESERVE of it for
+    overhead (and never less than MIN_RESERVE seconds).
+    """
+    BUDGET_RESERVE = 0.1
+    MIN_RESERVE = 0.005
+    DEFAULT_TIME = 1.0  # for timeLimit=0 when no budget is given
+
+    def setMoveBudget(self, budget):
+        self.budget = budget
+
+    def getMoveDeadline(self, startTime):
+        "Returns the time.monotonic() value at which to stop searching."
+        if self.timeLimit > 0:
+            deadline = startTime + self.timeLimit
+        else:
+            deadline = startTime + self.DEFAULT_TIME
+        # A budget only holds for the move it was given for
+        budget, self.budget = getattr(self, 'budget', None), None
+        if budget != None:
+            available = budget.deadline - startTime
+            budgetDeadline = startTime + available - max(available * self.BUDGET_RESERVE, self.MIN_RESERVE)
+            deadline = budgetDeadline if self.timeLimit <= 0 else min(deadline, budgetDeadline)
+        return deadline
+
+
+class AlphaBetaTagAgent(AnytimeTagAgent):
+    """
+    Adversarial search agent for either side of the tag game.
+
+    Runs alpha-beta over TagGameState successors, with the tag rules applied
+    after every move through TagGameRules.applyTagRules so that role swaps
+    and the cooldown are part of the search.  Iterative deepening stops when
+    the move's time (see AnytimeTagAgent) is spent, and a
+    transposition table keyed by Zobrist hashes carries bounds and best
+    moves from one iteration (and one move) to the next.
+
+    Values are the agent's points minus the opponent's points earned along
+    the searched line, plus an estimate at the leaves, so a position's value
+    does not depend on the path that reached it.
+
+    With ponder=1 the agent keeps searching in a background thread during
+    the opponent's turn, deepening the positions each reply leads to (best
+    looking reply first).  When the real reply arrives, the depth reached
+    for it is reused and the time already spent on it is taken off
+    timeLimit, so the move comes back sooner at the same depth.
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+    WIN_VALUE = 1000000
+
+    def __init__(self, index=0, timeLimit=0.1, maxDepth=50, ponder=0):
+        self.index = index
+        self.timeLimit = float(timeLimit)
+        self.maxDepth = int(maxDepth)
+        self.ponder = bool(int(ponder))
+        self.distanceFields = {}
+        self.table = {}
+        self.zobrist = None
+        self.totalNodes = 0
+        self.totalTime = 0.0
+        self.depthsReached = []
+        self.ponderThread = None
+        self.ponderResults = None
+        self.ponderNodes = 0
+        self.ponderTime = 0.0
+        self.ponderHits = 0
+        self.ponderMisses = 0
+
+    def registerInitialState(self, state):
+        walls = state.getWalls()
+        self.cells = walls.asList(False)
+        # Distances are a property of the layout, so keep them across games
+        if getattr(self, 'layoutKey', None) != state.data.layout.getFingerprint():
+            self.layoutKey = state.data.layout.getFingerprint()
+            self.distanceFields = {}
+        self.table = {}
+        rng = random.Random(walls.width * 1000 + walls.height)
+        bits = lambda: rng.getrandbits(64)
+        self.zobrist = {
+            'cells': [[[bits() for y in range(walls.height)] for x in range(walls.width)] for agent in range(2)],
+            'direction': dict((d, bits()) for d in Actions._directions),
+            'pacmanIsIt': bits(),
+            'cooldown': [bits() for c in range(TAG_COOLDOWN + 1)],
+            'toMove': bits(),
+            'pliesToWin': [[bits() for plies in range(self.maxDepth + 2)] for agent in range(2)],
+        }
+
+    def getAction(self, state):
+        if self.zobrist == None:
+            self.registerInitialState(state)
+        if len(self.table) > 500000:
+            # Freeing the table takes a while; do it before the deadline is set
+            self.table = {}
+        startTime = time.monotonic()
+        self.deadline = self.getMoveDeadline(startTime)
+        self.nodes = 0
+
+        legal = state.getLegalActions(self.index)
+        bestAction = self.orderedChildren(state, self.index, None)[0][0]
+        depth, done = 0, False
+        if self.ponderResults != None:
+            result = self.ponderResults.get(self.zobristKey(state, self.index))
+            if result != None:
+                self.ponderHits += 1
+                depth, ponderAction, done, pondered = result
+                if ponderAction != None:
+                    bestAction = ponderAction
+                if self.timeLimit > 0:
+                    self.deadline = min(self.deadline, startTime + max(0.0, self.timeLimit - pondered))
+            else:
+                self.ponderMisses += 1
+            self.ponderResults = None
+        if not done:
+            depth, bestAction, done = self.iterativeDeepening(state, depth, bestAction)
+
+        self.totalNodes += self.nodes
+        self.totalTime += time.monotonic() - startTime
+        self.depthsReached.append(depth)
+        return bestAction if bestAction in legal else random.choice(legal)
+
+    def iterativeDeepening(self, state, depth, bestAction):
+        """
+        Searches state one ply deeper at a time, starting after depth, until
+        maxDepth, a decided game or a SearchTimeout.  Returns the deepest
+        completed depth, its best move and whether the search is finished.
+        """
+        try:
+            while depth < self.maxDepth:
+                value, action = self.searchRoot(state, depth + 1)
+                depth += 1
+                if action != None:
+                    bestAction = action
+                if abs(value) >= self.WIN_VALUE:
+                    return depth, bestAction, True
+        except SearchTimeout:
+            return depth, bestAction, False
+        return depth, bestAction, True
+
+    def startPondering(self, state):
+        "Called by Game.run after our move; searches on until stopPondering."
+        if not self.ponder or self.zobrist == None: return False
+        self.ponderResults = None
+        self.deadline = float('inf')
+        self.nodes = 0
+        self.ponderThread = threading.Thread(target=self.ponderSearch, args=(state,))
+        self.ponderThread.daemon = True
+        self.ponderThread.start()
+        return True
+
+    def stopPondering(self):
+        if self.ponderThread == None: return
+        self.deadline = 0.0
+        self.ponderThread.join()
+        self.ponderThread = None
+        self.ponderNodes += self.nodes
+
+    def ponderSearch(self, state):
+        startTime = time.monotonic()
+        opponent = 1 - self.index
+        entry = self.table.get(self.zobristKey(state, opponent))
+        # Best-looking replies first, so the likeliest one is always the deepest
+        replies = [(self.zobristKey(child, self.index), child) for action, child, reward, winner
+                   in self.orderedChildren(state, opponent, entry[3] if entry else None) if winner == None]
+        results = dict((key, (0, None, False, 0.0)) for key, child in replies)
+        self.ponderResults = results
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                unfinished = False
+                for key, child in replies:
+                    searched, bestAction, done, spent = results[key]
+                    if done: continue
+                    searchStart = time.monotonic()
+                    value, action = self.searchRoot(child, depth)
+                    done = abs(value) >= self.WIN_VALUE or depth >= self.maxDepth
+                    results[key] = (depth, action or bestAction, done, spent + time.monotonic() - searchStart)
+                    unfinished = unfinished or not done
+                if not unfinished: break
+        except SearchTimeout:
+            pass
+        self.ponderTime += time.monotonic() - startTime
+
+    def getSearchStats(self):
+        "Returns a summary of the search speed and depth over all moves so far."
+        if not self.depthsReached: return 'AlphaBetaTagAgent %d: no moves searched' % self.index
+        nodesPerSecond = self.totalNodes / max(self.totalTime, 1e-9)
+        averageDepth = sum(self.depthsReached) / float(len(self.depthsReached))
+        stats = 'AlphaBetaTagAgent %d: %d nodes in %.2fs (%.0f nodes/sec), depth avg %.1f, min %d, max %d' % \
+            (self.index, self.totalNodes, self.totalTime, nodesPerSecond, averageDepth,
+             min(self.depthsReached), max(self.depthsReached))
+        if self.ponder:
+            stats += '; pondered %d nodes in %.2fs, %d hits, %d misses' % \
+                (self.ponderNodes, self.ponderTime, self.ponderHits, self.ponderMisses)
+        return stats
+
+    def searchRoot(self, state, depth):
+        alpha, beta = -float('inf'), float('inf')
+        bestValue, bestAction = -float('inf'), None
+        key = self.zobristKey(state, self.index)
+        entry = self.table.get(key)
+        ttAction = entry[3] if entry else None
+        for action, child, reward, winner in self.orderedChildren(state, self.index, ttAction):
+            value = reward + self.childValue(child, winner, 1 - self.index, depth - 1, alpha - reward, beta - reward)
+            if value > bestValue:
+                bestValue, bestAction = value, action
+            alpha = max(alpha, bestValue)
+        self.table[key] = (depth, bestValue, self.EXACT, bestAction)
+        return bestValue, bestAction
+
+    def alphaBeta(self, state, agentIndex, depth, alpha, beta):
+        self.nodes += 1
+        if time.monotonic() > self.deadline:
+            raise SearchTimeout()
+        if depth == 0:
+            return self.evaluate(state)
+
+        key = self.zobristKey(state, agentIndex)
+        entry = self.table.get(key)
+        ttAction = None
+        if entry:
+            entryDepth, entryValue, entryFlag, ttAction = entry
+            if entryDepth >= depth:
+                if entryFlag == self.EXACT:
+                    return entryValue
+                if entryFlag == self.LOWER:
+                    alpha = max(alpha, entryValue)
+                else:
+                    beta = min(beta, entryValue)
+                if alpha >= beta:
+                    return entryValue
+
+        alphaOrig, betaOrig = alpha, beta
+        maximizing = agentIndex == self.index
+        bestValue = -float('inf') if maximizing else float('inf')
+        bestAction = None
+        for action, child, reward, winner in self.orderedChildren(state, agentIndex, ttAction):
+            value = reward + self.childValue(child, winner, 1 - agentIndex, depth - 1, alpha - reward, beta - reward)
+            if maximizing:
+                if value > bestValue:
+                    bestValue, bestAction = value, action
+                alpha = max(alpha, bestValue)
+            else:
+                if value < bestValue:
+                    bestValue, bestAction = value, action
+                beta = min(beta, bestValue)
+            if alpha >= beta:
+                break
+
+        if bestValue <= alphaOrig:
+            flag = self.UPPER
+        elif bestValue >= betaOrig:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        self.table[key] = (depth, bestValue, flag, bestAction)
+        return bestValue
+
+    def childValue(self, child, winner, agentIndex, depth, alpha, beta):
+        if winner != None:
+            mine = (winner == "PACMAN") == (self.index == 0)
+            return self.WIN_VALUE if mine else -self.WIN_VALUE
+        return self.alphaBeta(child, agentIndex, depth, alpha, beta)
+
+    def orderedChildren(self, state, agentIndex, firstAction):
+        """
+        Returns (action, successor, reward, winner) for every legal move, the
+        transposition table's move first and the rest best-looking first.
+        """
+        children = []
+        before = self.pointsDifference(state.data)
+        for action in state.getLegalActions(agentIndex):
+            child = state.generateSuccessor(agentIndex, action)
+            TagGameRules.applyTagRules(child.data)
+            reward = self.pointsDifference(child.data) - before
+            children.append((action, child, reward, TagGameRules.getWinner(child.data)))
+        sign = -1 if agentIndex == self.index else 1
+        children.sort(key=lambda c: (c[0] != firstAction, sign * (c[2] + self.evaluate(c[1]))))
+        return children
+
+    def pointsDifference(self, data):
+        if self.index == 0:
+            return data.pacman_score - data.phantom_score
+        return data.phantom_score - data.pacman_score
+
+    def evaluate(self, state):
+        """
+        Estimates the points still to come: the player who is not IT will keep
+        scoring for at least as long as it takes the chaser to close the gap
+        (or for the cooldown to run out).
+        """
+        data = state.data
+        distance = self.mazeDistance(state.getPacmanPosition(), state.getGhostPosition(1), state)
+        safeMoves = max(distance, data.tag_cooldown)
+        iAmIt = data.pacman_is_it == (self.index == 0)
+        if iAmIt:
+            return -POINTS_PER_TICK * safeMoves
+        return POINTS_PER_TICK * safeMoves
+
+    def mazeDistance(self, pos1, pos2, state):
+        pos1 = (int(pos1[0]), int(pos1[1]))
+        pos2 = (int(pos2[0]), int(pos2[1]))
+        if pos1 not in self.distanceFields:
+            distances = searchAgents.mazeDistances([(pos1, cell) for cell in self.cells], state)
+            self.distanceFields[pos1] = dict((target, d) for (source, target), d in distances.items())
+        distance = self.distanceFields[pos1].get(pos2)
+        if distance == None:
+            return manhattanDistance(pos1, pos2)
+        return distance
+
+    def pliesToWin(self, points):
+        """
+        How many more scoring moves a player with points needs to win, or
+        maxDepth + 1 for any number a search cannot reach.
+        """
+        plies = int(math.ceil((tagGame.WINNING_POINTS - points) / POINTS_PER_TICK))
+        return max(0, min(plies, self.maxDepth + 1))
+
+    def zobristKey(self, state, agentIndex):
+        """
+        Hashes what a position's value depends on: the cells, the ghost's
+        direction, who is IT, the cooldown, whose move it is and, once a
+        player is within maxDepth scoring moves of WINNING_POINTS, exactly
+        how far (childValue turns a win into WIN_VALUE).  The tag and move
+        counts are left out: searched lines only end at a win, not at the
+        rules' maxTags or maxMoves.
+        """
+        z = self.zobrist
+        data = state.data
+        pacmanX, pacmanY = data.agentStates[0].getPosition()
+        ghostConf = data.agentStates[1].configuration
+        ghostX, ghostY = ghostConf.getPosition()
+        key = z['cells'][0][int(pacmanX)][int(pacmanY)] ^ z['cells'][1][int(ghostX)][int(ghostY)]
+        key ^= z['direction'][ghostConf.getDirection()]
+        key ^= z['cooldown'][data.tag_cooldown]
+        if data.pacman_is_it: key ^= z['pacmanIsIt']
+        if agentIndex == 1: key ^= z['toMove']
+        key ^= z['pliesToWin'][0][self.pliesToWin(data.pacman_score)]
+        key ^= z['pliesToWin'][1][self.pliesToWin(data.phantom_score)]
+        return key
+
+
+def runRootRollouts(model, root, agentIndex, deadline, seed, horizon, exploration):
+    """
+    Flat UCT from one root: picks a root move by UCB1, plays the rest of the
+    game out for horizon moves with the greedy rollout policy, and repeats
+    until deadline (a time.monotonic() value).  Returns (actions, visits, totals, rollouts) where
+    totals are summed rewards in [-1, 1] from agentIndex's point of view.
+    """
+    rng = random.Random(seed)
+    actions = list(model.getLegalActions(root, agentIndex))
+    visits = [0] * len(actions)
+    totals = [0.0] * len(actions)
+    scale = POINTS_PER_TICK * horizon
+    myScore = tagModel.PACMAN_SCORE if agentIndex == 0 else tagModel.PHANTOM_SCORE
+    otherScore = tagModel.PHANTOM_SCORE if agentIndex == 0 else tagModel.PACMAN_SCORE
+    before = root[myScore] - root[otherScore]
+    rollouts = 0
+    while True:
+        if rollouts & 15 == 0 and time.monotonic() >= deadline and rollouts > 0:
+            break
+        if rollouts < len(actions):
+            choice = rollouts
+        else:
+            logTotal = math.log(rollouts)
+            choice = max(range(len(actions)), key=lambda i: totals[i] / visits[i] +
+                         exploration * math.sqrt(logTotal / visits[i]))
+        state = model.step(root, agentIndex, actions[choice])
+        mover = 1 - agentIndex
+        winner = model.getWinner(state)
+        for ply in range(horizon - 1):
+            if winner != None: break
+            state = model.step(state, mover, model.greedyAction(state, mover, rng))
+            mover = 1 - mover
+            winner = model.getWinner(state)
+        if winner != None:
+            reward = 1.0 if (winner == "PACMAN") == (agentIndex == 0) else -1.0
+        else:
+            # Points earned in the playout, plus the points the player who is
+            # not IT can still count on before the chaser closes the gap
+            safeMoves = max(model.getDistances(state[tagModel.PACMAN])[state[tagModel.GHOST]], state[tagModel.COOLDOWN])
+            if state[tagModel.PACMAN_IS_IT] == (agentIndex == 0):
+                safeMoves = -safeMoves
+            points = state[myScore] - state[otherScore] - before + POINTS_PER_TICK * safeMoves
+            reward = max(-1.0, min(1.0, points / scale))
+        visits[choice] += 1
+        totals[choice] += reward
+        rollouts += 1
+    return actions, visits, totals, rollouts
+
+ROLLOUT_WORKER_MODEL = None
+
+def initRolloutWorker(layoutText):
+    global ROLLOUT_WORKER_MODEL
+    import layout
+    ROLLOUT_WORKER_MODEL = tagModel.TagModel(layout.Layout(layoutText))
+
+def rolloutWorker(args):
+    return runRootRollouts(ROLLOUT_WORKER_MODEL, *args)
+
+
+class MCTSTagAgent(AnytimeTagAgent):
+    """
+    Monte Carlo tree search agent for either side of the tag game.
+
+    UCT chooses among the root moves and each playout continues with the
+    cheap greedy policy of TagGhostAgent for both players, on TagModel
+    tuples instead of TagGameState copies.  With workers > 1 the playouts
+    run in a process pool: every worker searches the same root until the
+    move deadline with its own random seed, and the per-move statistics are
+    merged (root parallelization), so more cores mean more playouts per move.
+    Those seeds come from a generator seeded from random at the start of
+    every game, so random.seed before a game (runTag.py -s, compareAgents)
+    seeds the playouts too; how many playouts fit before the deadline still
+    depends on timing.
+    """
+    def __init__(self, index=0, timeLimit=0.1, workers=1, horizon=60, exploration=1.0):
+        self.index = index
+        self.timeLimit = float(timeLimit)
+        self.workers = int(workers)
+        self.horizon = int(horizon)
+        self.exploration = float(exploration)
+        self.pool = None
+        self.poolLayout = None
+        self.rng = random.Random()
+        self.totalRollouts = 0
+        self.totalTime = 0.0
+        self.moves = 0
+
+    def registerInitialState(self, state):
+        self.model = tagModel.getModel(state.data.layout)
+        self.rng = random.Random(random.getrandbits(32))
+        if self.workers > 1 and self.poolLayout != self.model.layout.getFingerprint():
+            self.closePool()
+            self.pool = multiprocessing.Pool(self.workers, initRolloutWorker, (self.model.layout.layoutText,))
+            self.poolLayout = self.model.layout.getFingerprint()
+            atexit.register(self.closePool)
+
+    def closePool(self):
+        if self.pool != None:
+            self.pool.terminate()
+            self.pool = None
+            self.poolLayout = None
+
+    def getAction(self, state):
+        if getattr(self, 'model', None) == None:
+            self.registerInitialState(state)
+        startTime = time.monotonic()
+        deadline = self.getMoveDeadline(startTime)
+        root = self.model.fromGameState(state)
+
+        if self.pool != None:
+            jobs = [(root, self.index, deadline, self.rng.getrandbits(32), self.horizon, self.exploration)
+                    for worker in range(self.workers)]
+            results = self.pool.map(rolloutWorker, jobs)
+        else:
+            results = [runRootRollouts(self.model, root, self.index, deadline, self.rng.getrandbits(32),
+                                       self.horizon, self.exploration)]
+
+        visits, totals = util.Counter(), util.Counter()
+        for actions, actionVisits, actionTotals, rollouts in results:
+            self.totalRollouts += rollouts
+            for action, n, total in zip(actions, actionVisits, actionTotals):
+                visits[action] += n
+                totals[action] += total
+        self.totalTime += time.monotonic() - startTime
+        self.moves += 1
+
+        legal = state.getLegalActions(self.index)
+        best = max(legal, key=lambda a: (visits[a], totals[a]))
+        return best
+
+    def getSearchStats(self):
+        "Returns a summary of the playout rate over all moves so far."
+        rate = self.totalRollouts / max(self.totalTime, 1e-9)
+        return 'MCTSTagAgent %d: %d rollouts in %.2fs over %d moves (%.0f rollouts/sec, %d workers)' % \
+            (self.index, self.totalRollouts, self.totalTime, self.moves, rate, max(1, self.workers))
+
+
+class TableTagAgent(Agent):
+    """
+    Plays one side of tag from the exact solution computed by tagSolver.py,
+    with an O(1) table lookup per move.  tableFile is a file written by
+    tagSolver; without one the layout is solved when the game starts.
+    """
+    def __init__(self, index=0, tableFile=None, discount=0.95):
+        self.index = index
+        self.tableFile = tableFile
+        self.discount = float(discount)
+        self.solution = None
+
+    def registerInitialState(self, state):
+        import tagSolver
+        self.solution = tagSolver.getSolution(state.data.layout, self.tableFile, self.discount)
+
+    def getAction(self, state):
+        if self.solution == None:
+            self.registerInitialState(state)
+        model = self.solution.model
+        action = self.solution.getAction(model.fromGameState(state), self.index)
+        legal = state.getLegalActions(self.index)
+        if action not in legal:
+            return random.choice(legal)
+        return action
+
+
+class TablePacmanAgent(TableTagAgent):
+    "Pacman playing the solved tag policy."
+    def __init__(self, index=0, tableFile=None, discount=0.95):
+        TableTagAgent.__init__(self, index, tableFile, discount)
+
+
+class TableGhostAgent(TableTagAgent):
+    "The ghost playing the solved tag policy."
+    def __init__(self, index=1, tableFile=None, discount=0.95):
+        TableTagAgent.__init__(self, index, tableFile, discount)
+
+
+class QLearningTagAgent(Agent):
+    """
+    Plays either side of tag greedily from the Q tables learned by
+    tagLearning.py (qFile), one table lookup per move.
+    """
+    def __init__(self, index=0, qFile=None):
+        if qFile == None:
+            raise Exception('QLearningTagAgent needs qFile=<tables written by tagLearning.py>')
+        self.index = index
+        self.qFile = qFile
+        self.policy = None
+
+    def registerInitialState(self, state):
+        import tagLearning
+        self.policy = tagLearning.loadPolicy(self.qFile)
+        if self.policy.model.layout.getFingerprint() != state.data.layout.getFingerprint():
+            raise Exception('Q table %s was learned on a different layout' % self.qFile)
+
+    def getAction(self, state):
+        if self.policy == None:
+            self.registerInitialState(state)
+        model = self.policy.model
+        legal = state.getLegalActions(self.index)
+        return self.policy.getAction(model.fromGameState(state), self.index, legal)
+
+
 class KeyboardTagPacmanAgent(Agent):
     """
     Keyboard-controlled Pacman for tag game.
@@ -0,0 +1,246 @@
+"""
+A vectorized, Gym-style environment for the tag game.
+
+VectorTagEnv plays B games of tag in lockstep on one layout, with the whole
+state held in NumPy arrays (one entry per game), so a learner can step
+thousands of games per call instead of one TagGameState at a time.  Each
+call to step takes one action per game for the player whose turn it is and
+applies the same rules as TagGameState.generateSuccessor followed by
+TagGameRules.process: tags within TAG_DISTANCE outside the TAG_COOLDOWN,
+POINTS_PER_TICK for the player who is not IT, first to WINNING_POINTS
+wins, and the maxTags / maxMoves limits.  Finished games start over.
+
+Actions are indices into ACTIONS (North, South, East, West, Stop).  Needs
+NumPy.  To check the environment against the scalar engine:
+
+> python tagEnv.py -l mediumClassic -n 20
+"""
+import random
+import sys
+import time
+from game import Directions
+from tagGame import TAG_COOLDOWN, POINTS_PER_TICK, WINNING_POINTS
+import tagModel
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+# Same order as tagModel (and Actions.getPossibleActions)
+ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+STOP = ACTIONS.index(Directions.STOP)
+NO_WINNER, PACMAN_WINS, PHANTOM_WINS = 0, 1, 2
+
+def requireNumpy():
+    if not _NUMPY_AVAILABLE:
+        raise Exception('VectorTagEnv needs numpy (pip install numpy)')
+
+class VectorTagEnv:
+    """
+    numGames games of tag on layout.  The state of game i is
+
+      pacman[i], ghost[i]     cell indices into model.positions
+      direction[i]            index in ACTIONS of the ghost's heading
+      pacmanIsIt[i]           who is IT
+      cooldown[i]             moves left before a tag counts again
+      pacmanScore[i], phantomScore[i], moves[i], tags[i]
+      toMove[i]               0 when Pacman moves next, 1 for the ghost
+    """
+    def __init__(self, layout, numGames, maxTags=10, maxMoves=1000):
+        requireNumpy()
+        self.model = model = tagModel.getModel(layout)
+        self.numGames = numGames
+        self.maxTags = maxTags
+        self.maxMoves = maxMoves
+
+        n = model.numCells
+        self.moveTable = np.zeros((n, len(ACTIONS)), dtype=np.int32)
+        self.pacmanMask = np.zeros((n, len(ACTIONS)), dtype=bool)
+        self.ghostMask = np.zeros((n, len(ACTIONS), len(ACTIONS)), dtype=bool)
+        for cell in range(n):
+            for a, action in enumerate(ACTIONS):
+                self.moveTable[cell, a] = model.moves[cell].get(action, cell)
+                self.pacmanMask[cell, a] = action in model.moves[cell]
+                for d, heading in enumerate(ACTIONS):
+                    self.ghostMask[cell, d, a] = action in model.ghostActions[cell][heading]
+        xs = np.array([x for x, y in model.positions])
+        ys = np.array([y for x, y in model.positions])
+        self.cellX, self.cellY = xs, ys
+        # Integer cells: within TAG_DISTANCE means the same or a neighbouring cell
+        self.tagTable = (np.abs(xs[:, None] - xs[None, :]) + np.abs(ys[:, None] - ys[None, :])) <= 1
+
+        ghostStarts = [pos for isPacman, pos in layout.agentPositions if not isPacman]
+        pacmanStarts = [pos for isPacman, pos in layout.agentPositions if isPacman]
+        if not ghostStarts or not pacmanStarts:
+            raise Exception('Tag needs a layout with Pacman and at least one ghost')
+        self.startPacman = model.cellOf(pacmanStarts[0])
+        self.startGhost = model.cellOf(ghostStarts[0])
+
+        self.pacman = np.zeros(numGames, dtype=np.int32)
+        self.ghost = np.zeros(numGames, dtype=np.int32)
+        self.direction = np.zeros(numGames, dtype=np.int8)
+        self.pacmanIsIt = np.zeros(numGames, dtype=bool)
+        self.cooldown = np.zeros(numGames, dtype=np.int32)
+        self.pacmanScore = np.zeros(numGames, dtype=np.float64)
+        self.phantomScore = np.zeros(numGames, dtype=np.float64)
+        self.moves = np.zeros(numGames, dtype=np.int32)
+        self.tags = np.zeros(numGames, dtype=np.int32)
+        self.toMove = np.zeros(numGames, dtype=np.int8)
+        self.gamesFinished = 0
+        self.stepsTaken = 0
+        self.reset()
+
+    def reset(self, games=None):
+        "Starts the given games (a boolean mask; default all) over and returns the observations."
+        if games is None:
+            games = np.ones(self.numGames, dtype=bool)
+        self.pacman[games] = self.startPacman
+        self.ghost[games] = self.startGhost
+        self.direction[games] = STOP
+        self.pacmanIsIt[games] = True
+        self.cooldown[games] = 0
+        self.pacmanScore[games] = 0
+        self.phantomScore[games] = 0
+        self.moves[games] = 0
+        self.tags[games] = 0
+        self.toMove[games] = 0
+        return self.getObservations()
+
+    def getObservations(self):
+        """
+        Returns an int32 array with one row per game: pacman x, pacman y,
+        ghost x, ghost y, ghost heading, pacmanIsIt, cooldown, toMove.
+        """
+        return np.stack([self.cellX[self.pacman], self.cellY[self.pacman],
+                         self.cellX[self.ghost], self.cellY[self.ghost],
+                         self.direction, self.pacmanIsIt, self.cooldown, self.toMove], axis=1).astype(np.int32)
+
+    def getActionMasks(self):
+        "Returns a (numGames, len(ACTIONS)) boolean array of legal actions for the player to move."
+        pacmanLegal = self.pacmanMask[self.pacman]
+        ghostLegal = self.ghostMask[self.ghost, self.direction]
+        return np.where((self.toMove == 0)[:, None], pacmanLegal, ghostLegal)
+
+    def step(self, actions):
+        """
+        Applies actions (one index into ACTIONS per game) for the player to
+        move in each game.  Returns (observations, rewards, dones, infos):
+        rewards[i] is the change in Pacman's points minus the Phantom's, and
+        for the games that just ended (dones[i]), which are already reset in
+        the observations, infos holds their final 'winner' (PACMAN_WINS,
+        PHANTOM_WINS or NO_WINNER), 'pacmanScore', 'phantomScore', 'tags'
+        and 'moves'.
+        """
+        actions = np.asarray(actions)
+        masks = self.getActionMasks()
+        if not masks[np.arange(self.numGames), actions].all():
+            raise Exception('Illegal action in VectorTagEnv.step')
+
+        pacmanMoves = self.toMove == 0
+        ghostMoves = ~pacmanMoves
+        self.pacman = np.where(pacmanMoves, self.moveTable[self.pacman, actions], self.pacman)
+        self.ghost = np.where(ghostMoves, self.moveTable[self.ghost, actions], self.ghost)
+        self.direction = np.where(ghostMoves & (actions != STOP), actions, self.direction).astype(np.int8)
+        self.moves += 1
+
+        # TagGameRules.applyTagRules
+        self.cooldown = np.maximum(self.cooldown - 1, 0)
+        tagged = self.tagTable[self.pacman, self.ghost] & (self.cooldown == 0)
+        self.pacmanIsIt ^= tagged
+        self.tags += tagged
+        self.cooldown[tagged] = TAG_COOLDOWN
+        self.phantomScore[self.pacmanIsIt] += POINTS_PER_TICK
+        self.pacmanScore[~self.pacmanIsIt] += POINTS_PER_TICK
+        rewards = np.where(self.pacmanIsIt, -POINTS_PER_TICK, POINTS_PER_TICK)
+
+        # TagGameRules.getWinner and the end conditions of process
+        winners = np.where(self.pacmanScore >= WINNING_POINTS, PACMAN_WINS,
+                           np.where(self.phantomScore >= WINNING_POINTS, PHANTOM_WINS, NO_WINNER))
+        dones = (winners != NO_WINNER) | (self.tags >= self.maxTags) | (self.moves >= self.maxMoves)
+        infos = {'winner': winners, 'pacmanScore': self.pacmanScore.copy(),
+                 'phantomScore': self.phantomScore.copy(), 'tags': self.tags.copy(), 'moves': self.moves.copy()}
+        self.toMove = 1 - self.toMove
+        self.stepsTaken += self.numGames
+        if dones.any():
+            self.gamesFinished += int(dones.sum())
+            self.reset(dones)
+        return self.getObservations(), rewards, dones, infos
+
+    def getState(self, game):
+        "Game i as a tagModel state tuple."
+        return (int(self.pacman[game]), int(self.ghost[game]), ACTIONS[self.direction[game]],
+                bool(self.pacmanIsIt[game]), int(self.cooldown[game]),
+                float(self.pacmanScore[game]), float(self.phantomScore[game]))
+
+def checkAgainstEngine(layoutObj, numGames=10, maxTags=10, maxMoves=1000, seed=0):
+    """
+    Plays numGames seeded TagPacmanAgent vs TagGhostAgent games with the
+    scalar engine, replays their moves side by side in one VectorTagEnv and
+    returns the number of games whose outcome (scores, tags, moves, winner)
+    differs.
+    """
+    import tagGame, tagAgents, textDisplay
+    histories, results = [], []
+    for i in range(numGames):
+        random.seed(seed + i)
+        rules = tagGame.TagGameRules(maxTags=maxTags, maxMoves=maxMoves)
+        game = rules.newGame(layoutObj, tagAgents.TagPacmanAgent(0), [tagAgents.TagGhostAgent(1)],
+                             textDisplay.NullGraphics(), quiet=True)
+        game.muteAgents = True
+        game.run()
+        data = game.state.data
+        winner = {None: NO_WINNER, 'PACMAN': PACMAN_WINS, 'PHANTOM': PHANTOM_WINS}[getattr(game, 'winner', None)]
+        histories.append([ACTIONS.index(action) for agent, action in game.moveHistory])
+        results.append((winner, data.pacman_score, data.phantom_score, data.tag_count, data.move_count))
+
+    env = VectorTagEnv(layoutObj, numGames, maxTags, maxMoves)
+    finals = [None] * numGames
+    for ply in range(max(len(history) for history in histories)):
+        # Games that are over keep playing any legal move until the longest ends
+        masks = env.getActionMasks()
+        actions = np.array([history[ply] if ply < len(history) else -1 for history in histories])
+        actions = np.where(actions >= 0, actions, masks.argmax(axis=1))
+        observations, rewards, dones, infos = env.step(actions)
+        for i in np.nonzero(dones)[0]:
+            if finals[i] == None:
+                finals[i] = (int(infos['winner'][i]), float(infos['pacmanScore'][i]),
+                             float(infos['phantomScore'][i]), int(infos['tags'][i]), int(infos['moves'][i]))
+    return sum(1 for final, result in zip(finals, results) if final != result)
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python tagEnv.py <options>')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the LAYOUT to play on [Default: %default]')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=20,
+                      help='games to check against the scalar engine [Default: %default]')
+    parser.add_option('-b', '--batch', dest='batch', type='int', default=1024,
+                      help='games stepped together in the speed test [Default: %default]')
+    parser.add_option('--steps', dest='steps', type='int', default=1000,
+                      help='batched steps in the speed test [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import layout
+    options = readCommand(sys.argv[1:])
+    layoutObj = layout.getLayout(options.layout)
+    if layoutObj == None: raise Exception("The layout " + options.layout + " cannot be found")
+    mismatches = checkAgainstEngine(layoutObj, options.numGames)
+    print('%d of %d games differ from the scalar engine' % (mismatches, options.numGames))
+
+    env = VectorTagEnv(layoutObj, options.batch)
+    rng = np.random.default_rng(0)
+    startTime = time.time()
+    for step in range(options.steps):
+        # Uniformly random legal actions
+        masks = env.getActionMasks()
+        actions = (rng.random(masks.shape) * masks).argmax(axis=1)
+        env.step(actions)
+    elapsed = time.time() - startTime
+    print('%d steps in %.2fs (%.0f steps/sec, %d games finished)' %
+          (env.stepsTaken, elapsed, env.stepsTaken / elapsed, env.gamesFinished))
@@ -1,4 +1,4 @@
-from game import GameStateData, Game, Directions, Actions
+from game import GameStateData, Game, FastGame, SpeedScheduler, Directions, Actions
 from pacman import GameState, PacmanRules, GhostRules, COLLISION_TOLERANCE, TIME_PENALTY
 from util import manhattanDistance, nearestPoint
 import util
@@ -9,6 +9,16 @@ import time
 import random
 import os
 
+TAG_DISTANCE = 1.5      # How close Pacman and the ghost must be for a tag
+TAG_COOLDOWN = 20       # Moves after a tag during which no new tag counts
+TAG_BONUS = 100         # Score change awarded for a successful tag
+POINTS_PER_TICK = 3.33  # Points the player who is NOT it earns every move
+WINNING_POINTS = 1000   # First player to reach this many points wins
+
+# Events returned by TagGameRules.applyTagRules
+TAG = 'tag'
+TAG_IGNORED = 'ignored'
+
 class TagGameStateData(GameStateData):
     def __init__(self, prevState=None):
         # Call parent init first
@@ -59,13 +69,23 @@ class TagGameStateData(GameStateData):
         return state
 
 class TagGameRules:
-    def __init__(self, timeout=30, maxTags=10, maxMoves=1000):
+    """
+    itSpeed and runnerSpeed are the speeds of the player who is IT and of the
+    one running away, in moves per time unit.  When they differ, a
+    SpeedScheduler lets the faster role move more often (both still move
+    whole cells); moves, points and the move limit still count plies.
+    """
+    def __init__(self, timeout=30, maxTags=10, maxMoves=1000, moveTimeout=None, itSpeed=1.0, runnerSpeed=1.0):
         self.timeout = timeout
+        self.moveTimeout = timeout if moveTimeout == None else moveTimeout  # Seconds per move (a float)
         self.maxTags = maxTags  # Game ends after this many tags
         self.maxMoves = maxMoves  # Game ends after this many moves
         self.last_status_move = 0  # Track when we last showed status
+        self.recorder = None  # e.g. a trajectoryLog.TrajectoryWriter, told about every ply
+        self.itSpeed = itSpeed
+        self.runnerSpeed = runnerSpeed
         
-    def newGame(self, layout, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False):
+    def newGame(self, layout, pacmanAgent, ghostAgents, display, quiet=False, catchExceptions=False, fast=False):
         # Ensure we have exactly one ghost
         if len(ghostAgents) == 0:
             raise Exception("Tag game requires at least one ghost agent")
@@ -80,10 +100,14 @@ class TagGameRules:
         else:
             # Use the ghosts from the layout, but limit to 1
             initState.initialize(layout, 1)
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = (FastGame if fast else Game)(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
+        if self.itSpeed != self.runnerSpeed:
+            game.scheduler = SpeedScheduler(self.getAgentSpeed)
         self.initialState = initState.deepCopy()
         self.quiet = quiet
+        if self.recorder != None:
+            self.recorder.startGame(initState)
         return game
         
     def process(self, state, game):
@@ -105,38 +129,16 @@ class TagGameRules:
         if not hasattr(state.data, 'phantom_score'):
             state.data.phantom_score = 0
             
-        # Decrement cooldown timer
-        if state.data.tag_cooldown > 0:
-            state.data.tag_cooldown -= 1
-        
-        # UPDATE GHOST STATE BASED ON WHO IS IT
-        ghostState = state.data.agentStates[1]  # Ghost is always index 1
-        if state.data.pacman_is_it:
-            # Pacman is IT - Ghost should be scared (blue)
-            ghostState.scaredTimer = 999
-        else:
-            # Ghost is IT - Ghost should be normal (red)
-            ghostState.scaredTimer = 0
-            
-        # Check for tag (collision)
         pacmanPos = state.getPacmanPosition()
         ghostPos = state.getGhostPosition(1)
         distance = manhattanDistance(pacmanPos, ghostPos)
-        
-        if self.checkTag(pacmanPos, ghostPos):
-            self.handleTag(state, game)
-            # Update ghost appearance immediately after tag
-            if state.data.pacman_is_it:
-                state.data.agentStates[1].scaredTimer = 999
-            else:
-                state.data.agentStates[1].scaredTimer = 0
-        
-        if state.data.pacman_is_it:
-            # Pacman is IT (chasing), so Phantom gets points for being chased
-            state.data.phantom_score += 3.33
-        else:
-            # Phantom is IT (chasing), so Pacman gets points for being chased
-            state.data.pacman_score += 3.33
+
+        old_state = state.data.pacman_is_it
+        event = self.applyTagRules(state.data)
+        if event == TAG:
+            self.announceTag(state, old_state)
+        elif event == TAG_IGNORED and not self.quiet and state.data.tag_cooldown % 3 == 0:
+            print(f"[Tag ignored - cooldown: {state.data.tag_cooldown}]")
         
         if not self.quiet and state.data.move_count - self.last_status_move >= 20:
             self.last_status_move = state.data.move_count
@@ -145,46 +147,98 @@ class TagGameRules:
             print(f"[Move {state.data.move_count}] IT: {who_is_it} | Tags: {state.data.tag_count} | Distance: {distance:.1f} | Pacman: {int(state.data.pacman_score)} | Phantom: {int(state.data.phantom_score)}")
             
         # Check win condition - first to 1000 points wins
-        if state.data.pacman_score >= 1000:
-            self.winGame(state, game, "PACMAN")
-            return
-        if state.data.phantom_score >= 1000:
-            self.winGame(state, game, "PHANTOM")
-            return
-            
-        # Check other end conditions for tag game
-        if hasattr(state.data, 'tag_count') and state.data.tag_count >= self.maxTags:
-            self.endGame(state, game)
-        
-        if hasattr(state.data, 'move_count') and state.data.move_count >= self.maxMoves:
-            self.endGame(state, game)
+        winner = self.getWinner(state.data)
+        if winner != None:
+            self.winGame(state, game, winner)
+        else:
+            # Check other end conditions for tag game
+            if hasattr(state.data, 'tag_count') and state.data.tag_count >= self.maxTags:
+                self.endGame(state, game)
+
+            if hasattr(state.data, 'move_count') and state.data.move_count >= self.maxMoves:
+                self.endGame(state, game)
+
+        if self.recorder != None:
+            self.recorder.recordPly(state, game)
             
-    def checkTag(self, pacmanPos, ghostPos):
+    @staticmethod
+    def checkTag(pacmanPos, ghostPos):
         # Increased tolerance from 0.7 to 1.5 to make tags easier
-        return manhattanDistance(pacmanPos, ghostPos) <= 1.5
-        
-    def handleTag(self, state, game):
-        # Initialize tag tracking attributes
-        if not hasattr(state.data, 'pacman_is_it'):
-            state.data.pacman_is_it = True
-        if not hasattr(state.data, 'tag_cooldown'):
-            state.data.tag_cooldown = 0
-        if not hasattr(state.data, 'tag_count'):
-            state.data.tag_count = 0
-            
-        # Cooldown mechanism: prevent multiple tags in quick succession
-        if state.data.tag_cooldown > 0:
-            # Still in cooldown, ignore this tag
-            if not self.quiet and state.data.tag_cooldown % 3 == 0:
-                print(f"[Tag ignored - cooldown: {state.data.tag_cooldown}]")
-            return
-            
-        # We have a new tag!
-        old_state = state.data.pacman_is_it
-        state.data.pacman_is_it = not state.data.pacman_is_it
-        state.data.tag_count += 1
-        state.data.tag_cooldown = 20  
-        
+        return manhattanDistance(pacmanPos, ghostPos) <= TAG_DISTANCE
+
+    @staticmethod
+    def tagStep(pacmanPos, ghostPos, pacmanIsIt, cooldown, pacmanScore, phantomScore):
+        """
+        The tag rules for one move, on plain values: the cooldown ticks down,
+        a tag outside the cooldown swaps who is IT, and the player who is not
+        IT scores.  Returns (event, pacmanIsIt, cooldown, pacmanScore,
+        phantomScore), where event is TAG, TAG_IGNORED or None.
+        applyTagRules applies it to states, and corridors.CorridorSkipper to
+        the plies it plays without them.
+        """
+        # Decrement cooldown timer
+        if cooldown > 0:
+            cooldown -= 1
+
+        event = None
+        if TagGameRules.checkTag(pacmanPos, ghostPos):
+            if cooldown > 0:
+                # Still in cooldown, ignore this tag
+                event = TAG_IGNORED
+            else:
+                pacmanIsIt = not pacmanIsIt
+                cooldown = TAG_COOLDOWN
+                event = TAG
+
+        if pacmanIsIt:
+            # Pacman is IT (chasing), so Phantom gets points for being chased
+            phantomScore += POINTS_PER_TICK
+        else:
+            # Phantom is IT (chasing), so Pacman gets points for being chased
+            pacmanScore += POINTS_PER_TICK
+        return event, pacmanIsIt, cooldown, pacmanScore, phantomScore
+
+    @staticmethod
+    def applyTagRules(data):
+        """
+        Applies the tag rules for one move (tagStep) to a TagGameStateData,
+        in place, and returns TAG, TAG_IGNORED or None.  Agents that search
+        ahead call this after generateSuccessor to see the same game
+        process() plays.
+        """
+        event, data.pacman_is_it, data.tag_cooldown, data.pacman_score, data.phantom_score = TagGameRules.tagStep(
+            data.agentStates[0].getPosition(), data.agentStates[1].getPosition(), data.pacman_is_it,
+            data.tag_cooldown, data.pacman_score, data.phantom_score)
+        if event == TAG:
+            data.tag_count += 1
+            # Add points for successful tag
+            data.scoreChange += TAG_BONUS
+
+        # Pacman is IT - Ghost should be scared (blue); otherwise normal (red)
+        data.agentStates[1].scaredTimer = TagGameRules.getScaredTimer(data.pacman_is_it)
+        return event
+
+    @staticmethod
+    def getScaredTimer(pacmanIsIt):
+        return 999 if pacmanIsIt else 0
+
+    @staticmethod
+    def getWinner(data):
+        """
+        Returns "PACMAN" or "PHANTOM" once a player has reached the winning
+        score, and None while the game is still on.
+        """
+        return TagGameRules.getScoreWinner(data.pacman_score, data.phantom_score)
+
+    @staticmethod
+    def getScoreWinner(pacmanScore, phantomScore):
+        if pacmanScore >= WINNING_POINTS:
+            return "PACMAN"
+        if phantomScore >= WINNING_POINTS:
+            return "PHANTOM"
+        return None
+
+    def announceTag(self, state, old_state):
         # Display tag message with visual flair
         if not self.quiet:
             who_is_it = "Pacman" if state.data.pacman_is_it else "Ghost"
@@ -198,12 +252,9 @@ class TagGameRules:
             print(f"    {chasing_who} will now RUN AWAY!")
             print(f"    Ghost color: {ghost_color}")
             print(f"    Tag Count: {state.data.tag_count}")
-            print(f"    Cooldown set to: 20 moves")
+            print(f"    Cooldown set to: {TAG_COOLDOWN} moves")
             print("="*60 + "\n")
             
-        # Add points for successful tag
-        state.data.scoreChange += 100
-            
     def winGame(self, state, game, winner):
         if not self.quiet:
             tag_count = getattr(state.data, 'tag_count', 0)
@@ -268,6 +319,12 @@ class TagGameRules:
         else:
             print("Ghost crashed")
             
+    def getAgentSpeed(self, state, agentIndex):
+        "The speed of agentIndex's role in state (for the SpeedScheduler)."
+        if state.data.pacman_is_it == (agentIndex == 0):
+            return self.itSpeed
+        return self.runnerSpeed
+
     def getMaxTotalTime(self, agentIndex):
         return self.timeout
         
@@ -275,10 +332,10 @@ class TagGameRules:
         return self.timeout
         
     def getMoveWarningTime(self, agentIndex):
-        return self.timeout
+        return self.moveTimeout
         
     def getMoveTimeout(self, agentIndex):
-        return self.timeout
+        return self.moveTimeout
         
     def getMaxTimeWarnings(self, agentIndex):
         return 0
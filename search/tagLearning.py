@@ -0,0 +1,281 @@
+"""
+Tabular Q-learning for tag, trained headlessly by self-play.
+
+Both players learn at once, each with a Q table over
+
+    (pacman cell, ghost cell, who is IT, cooldown bucket) x action
+
+held in a NumPy array.  Actor processes play batches of episodes in a
+VectorTagEnv with an epsilon-greedy policy from the latest tables and send
+back their transitions; the learner folds every batch into the tables with
+one averaged Q-learning update per visited (state, action).  An episode is
+episodeLength moves from random positions (or until somebody wins), and
+rewards are the points the moving player gains on the Phantom or Pacman
+until its next turn, in units of POINTS_PER_TICK.
+
+Training writes a compact .npz file that QLearningTagAgent in tagAgents.py
+plays from:
+
+> python tagLearning.py -l mediumClassic -e 1000000 -w 4 -o mediumClassic.q.npz
+> python runTag.py -l mediumClassic -g QLearningTagAgent --ghostArgs qFile=mediumClassic.q.npz
+"""
+import multiprocessing
+import random
+import sys
+import time
+from tagGame import TAG_COOLDOWN, POINTS_PER_TICK
+import tagModel
+import tagEnv
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+NUM_BUCKETS = 4      # cooldown 0, then TAG_COOLDOWN split in three
+ILLEGAL = -1e4       # Q value of moves into walls (fits float16)
+
+def requireNumpy():
+    if not _NUMPY_AVAILABLE:
+        raise Exception('Tag Q-learning needs numpy (pip install numpy)')
+
+def cooldownBucket(cooldown):
+    "0 when a tag would count, otherwise 1 to NUM_BUCKETS - 1 by time left (works on arrays)."
+    return (cooldown > 0) * (1 + (cooldown - 1) * (NUM_BUCKETS - 1) // TAG_COOLDOWN)
+
+def stateIndex(numCells, pacman, ghost, pacmanIsIt, cooldown):
+    "Row of the Q tables for a position (works on arrays)."
+    return ((pacman * numCells + ghost) * 2 + pacmanIsIt) * NUM_BUCKETS + cooldownBucket(cooldown)
+
+class QTables:
+    """
+    Pacman's and the ghost's Q values for one layout, as float32 arrays of
+    shape (states, len(tagEnv.ACTIONS)).
+    """
+    def __init__(self, model, tables=None):
+        self.model = model
+        if tables == None:
+            tables = self.initialTables()
+        self.tables = tables
+
+    def initialTables(self):
+        "Zero for every move, except moves into walls (and a ghost stopping)."
+        n = self.model.numCells
+        states = n * n * 2 * NUM_BUCKETS
+        legal = np.zeros((n, len(tagEnv.ACTIONS)), dtype=bool)
+        for cell in range(n):
+            for a, action in enumerate(tagEnv.ACTIONS):
+                legal[cell, a] = action in self.model.moves[cell]
+        ghostLegal = legal.copy()
+        ghostLegal[:, tagEnv.STOP] = False
+        cells = np.arange(states) // (2 * NUM_BUCKETS)
+        pacmanCells, ghostCells = cells // n, cells % n
+        return [np.where(legal[pacmanCells], 0.0, ILLEGAL).astype(np.float32),
+                np.where(ghostLegal[ghostCells], 0.0, ILLEGAL).astype(np.float32)]
+
+    def getAction(self, state, agentIndex, legal):
+        "The legal action with the highest Q value in a tagModel state tuple."
+        pacman, ghost, direction, pacmanIsIt, cooldown = state[:5]
+        row = self.tables[agentIndex][stateIndex(self.model.numCells, pacman, ghost, int(pacmanIsIt), cooldown)]
+        return max(legal, key=lambda action: row[tagEnv.ACTIONS.index(action)])
+
+    def save(self, filename):
+        "Writes the tables as float16 with the layout they were learned on."
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, layoutText=np.array(self.model.layout.layoutText),
+                                fingerprint=np.array(self.model.layout.getFingerprint()),
+                                pacmanQ=self.tables[0].astype(np.float16),
+                                ghostQ=self.tables[1].astype(np.float16))
+
+_POLICIES = {}
+
+def loadPolicy(filename):
+    "Reads (once per process) the QTables written by QTables.save."
+    requireNumpy()
+    if filename not in _POLICIES:
+        import layout
+        archive = np.load(filename)
+        model = tagModel.getModel(layout.Layout([str(line) for line in archive['layoutText']]))
+        if model.layout.getFingerprint() != str(archive['fingerprint']):
+            raise Exception('Q table %s does not match its layout' % filename)
+        _POLICIES[filename] = QTables(model, [archive['pacmanQ'].astype(np.float32),
+                                              archive['ghostQ'].astype(np.float32)])
+    return _POLICIES[filename]
+
+def randomizeStarts(env, games, rng):
+    "Puts the given games at random positions with a random player IT."
+    count = int(games.sum())
+    env.pacman[games] = rng.integers(env.model.numCells, size=count)
+    env.ghost[games] = rng.integers(env.model.numCells, size=count)
+    env.pacmanIsIt[games] = rng.random(count) < 0.5
+
+def runActor(layoutText, tables, epsilon, numGames, episodeLength, seed):
+    """
+    Plays numGames episodes side by side with an epsilon-greedy policy and
+    returns their transitions as arrays: agent, state, action, reward,
+    nextState and terminal, plus the number of episodes and moves played.
+    """
+    import layout
+    rng = np.random.default_rng(seed)
+    env = tagEnv.VectorTagEnv(layout.Layout(layoutText), numGames, maxTags=sys.maxsize, maxMoves=episodeLength)
+    randomizeStarts(env, np.ones(numGames, dtype=bool), rng)
+    numCells = env.model.numCells
+    games = np.arange(numGames)
+
+    # The move each player made last and the reward it has gathered since
+    pendingState = [np.zeros(numGames, dtype=np.int64) for agent in range(2)]
+    pendingAction = [np.zeros(numGames, dtype=np.int64) for agent in range(2)]
+    pendingReward = [np.zeros(numGames, dtype=np.float32) for agent in range(2)]
+    pending = [np.zeros(numGames, dtype=bool) for agent in range(2)]
+    out = dict((key, []) for key in ['agent', 'state', 'action', 'reward', 'nextState', 'terminal'])
+
+    def emit(agent, selected, nextState, terminal):
+        count = int(selected.sum())
+        if count == 0: return
+        out['agent'].append(np.full(count, agent, dtype=np.int8))
+        out['state'].append(pendingState[agent][selected])
+        out['action'].append(pendingAction[agent][selected])
+        out['reward'].append(pendingReward[agent][selected])
+        out['nextState'].append(nextState[selected])
+        out['terminal'].append(np.full(count, terminal, dtype=bool))
+
+    episodes = 0
+    for ply in range(episodeLength):
+        states = stateIndex(numCells, env.pacman.astype(np.int64), env.ghost.astype(np.int64),
+                            env.pacmanIsIt.astype(np.int64), env.cooldown.astype(np.int64))
+        masks = env.getActionMasks()
+        movers = env.toMove
+        values = np.where((movers == 0)[:, None], tables[0][states], tables[1][states])
+        greedy = np.where(masks, values, -np.inf).argmax(axis=1)
+        explore = (rng.random(masks.shape) * masks).argmax(axis=1)
+        actions = np.where(rng.random(numGames) < epsilon, explore, greedy)
+
+        for agent in range(2):
+            moving = movers == agent
+            emit(agent, moving & pending[agent], states, False)
+            pendingState[agent][moving] = states[moving]
+            pendingAction[agent][moving] = actions[moving]
+            pendingReward[agent][moving] = 0
+            pending[agent] |= moving
+
+        observations, rewards, dones, infos = env.step(actions)
+        rewards = (rewards / POINTS_PER_TICK).astype(np.float32)
+        pendingReward[0] += np.where(pending[0], rewards, 0)
+        pendingReward[1] -= np.where(pending[1], rewards, 0)
+        if dones.any():
+            # A win ends the game; running out of moves only ends the episode
+            won = dones & (infos['winner'] != tagEnv.NO_WINNER)
+            for agent in range(2):
+                emit(agent, won & pending[agent], games, True)
+                pending[agent] &= ~dones
+            episodes += int(dones.sum())
+            randomizeStarts(env, dones, rng)
+
+    result = dict((key, np.concatenate(arrays) if arrays else np.zeros(0)) for key, arrays in out.items())
+    result['episodes'] = episodes
+    result['moves'] = numGames * episodeLength
+    return result
+
+def runActorTask(args):
+    return runActor(*args)
+
+def learn(tables, batch, alpha, discount):
+    """
+    One Q-learning step for every (state, action) in batch, averaging the
+    errors of repeated pairs so that a large batch is not over-applied.
+    """
+    numActions = len(tagEnv.ACTIONS)
+    for agent in range(2):
+        selected = batch['agent'] == agent
+        if not selected.any(): continue
+        table = tables[agent]
+        states, actions = batch['state'][selected], batch['action'][selected]
+        nextValues = table[batch['nextState'][selected]].max(axis=1)
+        targets = batch['reward'][selected] + discount * np.where(batch['terminal'][selected], 0, nextValues)
+        errors = targets - table[states, actions]
+        keys = states * numActions + actions
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=errors)
+        counts = np.bincount(inverse)
+        flat = table.reshape(-1)
+        flat[unique] += (alpha * sums / counts).astype(np.float32)
+
+def train(layout, episodes, workers=1, gamesPerTask=256, episodeLength=200, alpha=0.2, discount=0.95,
+          epsilon=0.3, finalEpsilon=0.05, seed=None, verbose=False):
+    """
+    Learns QTables for layout from about `episodes` self-play episodes and
+    returns (tables, episodesPerSecond).  Every round each of the workers
+    actor processes plays gamesPerTask episodes from the current tables;
+    epsilon decays linearly to finalEpsilon over the run.
+    """
+    requireNumpy()
+    model = tagModel.getModel(layout)
+    qTables = QTables(model)
+    rng = random.Random(seed)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+    startTime = time.time()
+    played = moves = 0
+    try:
+        while played < episodes:
+            progress = played / float(episodes)
+            explore = epsilon + (finalEpsilon - epsilon) * progress
+            tasks = [(layout.layoutText, qTables.tables, explore, gamesPerTask, episodeLength, rng.getrandbits(32))
+                     for worker in range(max(1, workers))]
+            if pool != None:
+                results = pool.map(runActorTask, tasks)
+            else:
+                results = [runActorTask(task) for task in tasks]
+            for result in results:
+                learn(qTables.tables, result, alpha, discount)
+                played += result['episodes']
+                moves += result['moves']
+            if verbose:
+                elapsed = time.time() - startTime
+                print('%d episodes, %d moves in %.1fs (%.0f episodes/sec), epsilon %.2f' %
+                      (played, moves, elapsed, played / elapsed, explore))
+    finally:
+        if pool != None:
+            pool.terminate()
+    return qTables, played / max(time.time() - startTime, 1e-9)
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python tagLearning.py -l LAYOUT -e EPISODES -o OUTPUT_FILE')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the LAYOUT to learn [Default: %default]')
+    parser.add_option('-e', '--episodes', dest='episodes', type='int', default=100000,
+                      help='self-play episodes to learn from [Default: %default]')
+    parser.add_option('-w', '--workers', dest='workers', type='int', default=1,
+                      help='actor processes [Default: %default]')
+    parser.add_option('-b', '--batch', dest='batch', type='int', default=256,
+                      help='episodes each actor plays per round [Default: %default]')
+    parser.add_option('--episodeLength', dest='episodeLength', type='int', default=200,
+                      help='moves per episode [Default: %default]')
+    parser.add_option('-a', '--alpha', dest='alpha', type='float', default=0.2,
+                      help='learning rate [Default: %default]')
+    parser.add_option('-d', '--discount', dest='discount', type='float', default=0.95,
+                      help='discount per move [Default: %default]')
+    parser.add_option('--epsilon', dest='epsilon', type='float', default=0.3,
+                      help='exploration rate at the start [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=None,
+                      help='random seed')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='where to write the Q tables [Default: LAYOUT.q.npz]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import layout
+    options = readCommand(sys.argv[1:])
+    layoutObj = layout.getLayout(options.layout)
+    if layoutObj == None: raise Exception("The layout " + options.layout + " cannot be found")
+    qTables, rate = train(layoutObj, options.episodes, options.workers, options.batch, options.episodeLength,
+                          options.alpha, options.discount, options.epsilon, seed=options.seed, verbose=True)
+    output = options.output or options.layout + '.q.npz'
+    qTables.save(output)
+    print('Trained at %.0f episodes/sec; wrote %s' % (rate, output))
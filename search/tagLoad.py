@@ -0,0 +1,264 @@
+"""
+A load generator for tagServer: keeps many tag games going at once over a
+few connections and reports how many games the server ran concurrently and
+how many plies a second it played.
+
+Each game is two seats, Pacman on one connection and the ghost on the next,
+so most plies cross connections like games between separate clients do.
+By default the seats play random legal moves, which keeps the cost of the
+clients low; -p and --ghost play real agents from tagAgents instead.  Without
+--address, a server is started in a child process on a temporary Unix
+socket (both share this machine's CPUs, so their plies/sec are a lower
+bound for the server alone).
+
+> python tagLoad.py -g 200 -n 2000 -l mediumClassic
+> python tagLoad.py --address 127.0.0.1:7470 -g 500 -n 5000 -p TagPacmanAgent --ghost TagGhostAgent
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from tagEnv import ACTIONS
+from tagGame import TagGameState
+import agentHost
+import layout
+import runTag
+import tagServer
+import util
+
+class LoadSeat:
+    def __init__(self, client, role, layoutName, agent):
+        self.client = client
+        self.role = role
+        self.layoutName = layoutName
+        self.agent = agent
+        self.template = None
+
+class LoadClient:
+    "One connection to the server, holding seats of many games."
+    def __init__(self, generator, reader, writer):
+        self.generator = generator
+        self.reader = reader
+        self.writer = writer
+        self.outbox = []
+        self.seats = {}
+        self.templates = {}
+
+    def send(self, message):
+        self.outbox.append(message)
+
+    def writeOut(self):
+        if len(self.outbox) > 0:
+            self.writer.write(b''.join(self.outbox))
+            self.outbox = []
+
+    def join(self, seatId, seat):
+        self.seats[seatId] = seat
+        self.send(tagServer.frame(tagServer.JOIN, tagServer._SEAT.pack(seatId, seat.role) + seat.layoutName.encode()))
+
+    def handle(self, message):
+        kind, body = message[:1], message[1:]
+        if kind == tagServer.PLY:
+            seatId, = tagServer._TICKET.unpack_from(body)
+            seat = self.seats[seatId]
+            state, budget = agentHost.unpackPly(seat.template, body[tagServer._TICKET.size:])
+            self.send(tagServer.frame(tagServer.MOVE, tagServer._SEAT.pack(seatId, ACTIONS.index(self.choose(seat, state, budget)))))
+        elif kind == tagServer.START:
+            seatId, role = tagServer._SEAT.unpack_from(body)
+            seat = self.seats[seatId]
+            seat.template = self.templates[seat.layoutName]
+            if hasattr(seat.agent, 'registerInitialState'):
+                seat.agent.registerInitialState(seat.template.deepCopy())
+        elif kind == tagServer.END:
+            seatId, winner, reason, moves, pacmanPoints, phantomPoints = tagServer._END.unpack(body)
+            del self.seats[seatId]
+            self.generator.endSeat(seatId, winner, reason, moves)
+        elif kind == tagServer.LAYOUT:
+            name, text = body.decode().split('\n', 1)
+            template = TagGameState()
+            template.initialize(layout.Layout(text.split('\n')), 1)
+            self.templates[name] = template
+        elif kind == tagServer.STATS:
+            self.generator.serverStats = json.loads(body.decode())
+        elif kind == tagServer.ERROR:
+            raise Exception('The server refused a request: ' + body.decode())
+
+    def choose(self, seat, state, budget):
+        if seat.agent == None:
+            return self.generator.random.choice(state.getLegalActions(seat.role))
+        if budget != None and hasattr(seat.agent, 'setMoveBudget'):
+            seat.agent.setMoveBudget(budget)
+        return seat.agent.getAction(state)
+
+    async def run(self):
+        buffer = b''
+        while not self.generator.done.is_set():
+            data = await self.reader.read(65536)
+            if len(data) == 0:
+                break
+            messages, buffer = tagServer.splitFrames(buffer + data)
+            for message in messages:
+                self.handle(message)
+            await self.generator.flush()
+
+class LoadGenerator:
+    """
+    Keeps concurrentGames games going on the server at address until
+    numGames have finished.  pacman and ghost are agent types from tagAgents
+    (None for random legal moves).
+    """
+    def __init__(self, address, layoutName, connections=4, concurrentGames=200, numGames=1000,
+                 pacman=None, ghost=None, pacmanArgs=None, ghostArgs=None, seed=0):
+        self.address = address
+        self.layoutName = layoutName
+        self.connections = connections
+        self.concurrentGames = concurrentGames
+        self.numGames = numGames
+        self.agentTypes = [(pacman, pacmanArgs), (ghost, ghostArgs)]
+        self.random = random.Random(seed)
+        self.clients = []
+        self.nextSeat = 0
+        self.gamesStarted = 0
+        self.gamesFinished = 0
+        self.running = 0
+        self.peakRunning = 0
+        self.plies = 0
+        self.results = [0] * len(tagServer.REASONS)
+        self.winners = [0, 0, 0]  # Pacman, the phantom, none (winner -1)
+        self.serverStats = None
+
+    def startGame(self):
+        client = self.clients[self.gamesStarted % len(self.clients)]
+        opponentClient = self.clients[(self.gamesStarted + 1) % len(self.clients)]
+        self.gamesStarted += 1
+        self.running += 1
+        self.peakRunning = max(self.peakRunning, self.running)
+        for role, seatClient in enumerate([client, opponentClient]):
+            agentType, agentArgs = self.agentTypes[role]
+            agent = runTag.loadTagAgent(agentType, role, agentArgs) if agentType != None else None
+            seatClient.join(self.nextSeat, LoadSeat(seatClient, role, self.layoutName, agent))
+            self.nextSeat += 1
+
+    def endSeat(self, seatId, winner, reason, moves):
+        # Both seats of a game get an END; count the game at Pacman's
+        if seatId % 2 != 0:
+            return
+        self.running -= 1
+        self.gamesFinished += 1
+        self.plies += moves
+        self.results[reason] += 1
+        self.winners[winner] += 1
+        if self.gamesStarted < self.numGames:
+            self.startGame()
+        elif self.gamesFinished == self.numGames:
+            self.clients[0].send(tagServer.frame(tagServer.STATS))
+
+    async def flush(self):
+        for client in self.clients:
+            client.writeOut()
+        for client in self.clients:
+            await client.writer.drain()
+        if self.serverStats != None:
+            self.done.set()
+
+    async def run(self):
+        "Plays the games and returns the seconds they took."
+        self.done = asyncio.Event()
+        for i in range(self.connections):
+            reader, writer = await connectWithRetries(self.address)
+            self.clients.append(LoadClient(self, reader, writer))
+        startTime = time.time()
+        for i in range(min(self.concurrentGames, self.numGames)):
+            self.startGame()
+        await self.flush()
+        readers = [asyncio.ensure_future(client.run()) for client in self.clients]
+        done = asyncio.ensure_future(self.done.wait())
+        await asyncio.wait(readers + [done], return_when=asyncio.FIRST_COMPLETED)
+        seconds = time.time() - startTime
+        for task in readers + [done]:
+            task.cancel()
+        for client in self.clients:
+            client.writer.close()
+        for task in readers:
+            if task.done() and not task.cancelled() and task.exception() != None:
+                raise task.exception()
+        return seconds
+
+async def connectWithRetries(address, attempts=50):
+    "Connects to address, waiting for a server that is still starting."
+    for attempt in range(attempts):
+        try:
+            return await tagServer.openConnection(address)
+        except (ConnectionError, FileNotFoundError):
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.1)
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python tagLoad.py [options]')
+    parser.add_option('-a', '--address', dest='address', default=None,
+                      help='HOST:PORT or Unix socket path of the server [Default: start one]')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the LAYOUT to play on [Default: %default]')
+    parser.add_option('-c', '--connections', dest='connections', type='int', default=4,
+                      help='connections to open [Default: %default]')
+    parser.add_option('-g', '--games', dest='games', type='int', default=200,
+                      help='games kept going at once [Default: %default]')
+    parser.add_option('-n', '--numGames', dest='numGames', type='int', default=1000,
+                      help='games to play in all [Default: %default]')
+    parser.add_option('-p', '--pacman', dest='pacman', default=None,
+                      help='the agent TYPE playing Pacman [Default: random legal moves]')
+    parser.add_option('--ghost', dest='ghost', default=None,
+                      help='the agent TYPE playing the ghost [Default: random legal moves]')
+    parser.add_option('--pacmanArgs', dest='pacmanArgs', help='comma separated arguments for Pacman')
+    parser.add_option('--ghostArgs', dest='ghostArgs', help='comma separated arguments for the ghost')
+    parser.add_option('--moveTimeout', dest='moveTimeout', type='float', default=1.0,
+                      help='seconds per move for a server started here [Default: %default]')
+    parser.add_option('--maxMoves', dest='maxMoves', type='int', default=1000,
+                      help='maximum moves per game for a server started here [Default: %default]')
+    parser.add_option('-s', '--seed', dest='seed', type='int', default=0,
+                      help='seed of the random moves [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+def startServer(options):
+    "Starts a server in a child process; returns (process, address)."
+    address = os.path.join(tempfile.mkdtemp(), 'tag.sock')
+    serverOptions = tagServer.readCommand(['-a', address, '-g', str(options.games), '--moveTimeout',
+                                           str(options.moveTimeout), '--maxMoves', str(options.maxMoves),
+                                           '--report', '0'])
+    process = multiprocessing.Process(target=tagServer.runServer, args=(serverOptions,), daemon=True)
+    process.start()
+    return process, address
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    server, address = None, options.address
+    if address == None:
+        server, address = startServer(options)
+    generator = LoadGenerator(address, options.layout, options.connections, options.games, options.numGames,
+                              options.pacman, options.ghost, options.pacmanArgs, options.ghostArgs, options.seed)
+    util.mutePrint()
+    try:
+        seconds = asyncio.run(generator.run())
+    finally:
+        util.unmutePrint()
+        if server != None:
+            server.terminate()
+    print('\n=== Load test ===')
+    print('Games:      %d finished in %.1fs (%.1f/sec), %d at once at the peak' %
+          (generator.gamesFinished, seconds, generator.gamesFinished / max(seconds, 1e-9), generator.peakRunning))
+    print('Plies:      %d (%.0f/sec)' % (generator.plies, generator.plies / max(seconds, 1e-9)))
+    print('Results:    ' + ', '.join('%s %d' % (reason, count) for reason, count in zip(tagServer.REASONS, generator.results)))
+    print('Winners:    Pacman %d, phantom %d, none %d' % tuple(generator.winners))
+    if generator.serverStats != None:
+        stats = generator.serverStats
+        print('Server:     %d games started, peak %d running, %d plies in %.1fs of uptime' %
+              (stats['started'], stats['peakGames'], stats['plies'], stats['seconds']))
@@ -0,0 +1,209 @@
+"""
+A lightweight model of the tag game for agents that simulate many moves.
+
+TagGameState copies agent states, layouts and food grids on every move, which
+is fine for playing a game but far too slow for rollouts.  TagModel holds the
+per-layout move tables once, and a game position is a plain tuple
+
+    (pacmanCell, ghostCell, ghostDirection, pacmanIsIt, cooldown,
+     pacmanScore, phantomScore)
+
+where cells are indices into model.positions.  model.step follows the same
+rules as TagGameState.generateSuccessor followed by TagGameRules.process.
+"""
+import random
+from game import Directions, Actions
+from tagGame import TAG_DISTANCE, TAG_COOLDOWN, POINTS_PER_TICK, WINNING_POINTS
+
+PACMAN, GHOST, GHOST_DIRECTION, PACMAN_IS_IT, COOLDOWN, PACMAN_SCORE, PHANTOM_SCORE = range(7)
+
+class TagModel:
+    """
+    Move tables for one layout: open cells, the cell reached by each action,
+    and the legal actions of Pacman and of the ghost (which can neither stop
+    nor turn back, except in a dead end).  Corridor lengths are worked out
+    as they are needed.
+    """
+    def __init__(self, layout):
+        walls = layout.walls
+        self.layout = layout
+        self.positions = walls.asList(False)
+        self.cellIndex = dict((pos, i) for i, pos in enumerate(self.positions))
+        self.numCells = len(self.positions)
+
+        # Same action order as Actions.getPossibleActions
+        self.actions = [direction for direction, vector in Actions._directionsAsList]
+        self.moves = []
+        self.pacmanActions = []
+        for x, y in self.positions:
+            moves = {}
+            for direction, (dx, dy) in Actions._directionsAsList:
+                if not walls[x + dx][y + dy]:
+                    moves[direction] = self.cellIndex[(x + dx, y + dy)]
+            self.moves.append(moves)
+            self.pacmanActions.append([a for a in self.actions if a in moves])
+
+        self.neighbors = [[moves[a] for a in self.pacmanActions[cell] if a != Directions.STOP]
+                          for cell, moves in enumerate(self.moves)]
+        self.distanceFields = {}
+
+        # Ghost legal actions depend on the direction the ghost is travelling
+        self.ghostActions = []
+        for cell in range(self.numCells):
+            byDirection = {}
+            for direction in self.actions:
+                legal = [a for a in self.pacmanActions[cell] if a != Directions.STOP]
+                reverse = Actions.reverseDirection(direction)
+                if reverse in legal and len(legal) > 1:
+                    legal.remove(reverse)
+                byDirection[direction] = legal
+            self.ghostActions.append(byDirection)
+        self.corridorLengths = {}
+
+    def getDistances(self, cell):
+        """
+        Returns a list with the maze distance from cell to every cell, built
+        by breadth-first search the first time it is asked for.
+        """
+        distances = self.distanceFields.get(cell)
+        if distances == None:
+            distances = [-1] * self.numCells
+            distances[cell] = 0
+            frontier = [cell]
+            for current in frontier:
+                nextDistance = distances[current] + 1
+                for neighbor in self.neighbors[current]:
+                    if distances[neighbor] < 0:
+                        distances[neighbor] = nextDistance
+                        frontier.append(neighbor)
+            self.distanceFields[cell] = distances
+        return distances
+
+    def getForcedMove(self, cell, direction):
+        """
+        The only move of a player at cell heading in direction that neither
+        stops nor turns back unless it must (the ghost's rules), or None at a
+        junction, where it has a choice.
+        """
+        legal = self.ghostActions[cell][direction]
+        return legal[0] if len(legal) == 1 else None
+
+    def getCorridorLength(self, cell, direction):
+        """
+        How many forced moves (see getForcedMove) a player at cell heading in
+        direction makes before it reaches a junction, capped at numCells for
+        corridors that loop without one.  Lengths are filled in for the whole
+        corridor the first time any part of it is asked for.
+        """
+        key = (cell, direction)
+        length = self.corridorLengths.get(key)
+        if length != None:
+            return length
+        path, seen = [], set()
+        while key not in self.corridorLengths:
+            move = self.getForcedMove(*key)
+            if move == None:
+                self.corridorLengths[key] = 0
+                break
+            if key in seen:
+                for loopKey in path:
+                    self.corridorLengths[loopKey] = self.numCells
+                return self.numCells
+            path.append(key)
+            seen.add(key)
+            key = (self.moves[key[0]][move], move)
+        length = self.corridorLengths[key]
+        for pathKey in reversed(path):
+            length = min(length + 1, self.numCells)
+            self.corridorLengths[pathKey] = length
+        return self.corridorLengths[(cell, direction)]
+
+    def cellOf(self, position):
+        x, y = position
+        return self.cellIndex[(int(x + 0.5), int(y + 0.5))]
+
+    def fromGameState(self, gameState):
+        "Returns the model tuple for a TagGameState."
+        data = gameState.data
+        ghostConf = data.agentStates[1].configuration
+        return (self.cellOf(data.agentStates[0].getPosition()), self.cellOf(ghostConf.getPosition()),
+                ghostConf.getDirection(), data.pacman_is_it, data.tag_cooldown,
+                data.pacman_score, data.phantom_score)
+
+    def getLegalActions(self, state, agentIndex):
+        if agentIndex == 0:
+            return self.pacmanActions[state[PACMAN]]
+        return self.ghostActions[state[GHOST]][state[GHOST_DIRECTION]]
+
+    def isTag(self, pacmanCell, ghostCell):
+        (px, py), (gx, gy) = self.positions[pacmanCell], self.positions[ghostCell]
+        return abs(px - gx) + abs(py - gy) <= TAG_DISTANCE
+
+    def step(self, state, agentIndex, action):
+        """
+        Returns the state after agentIndex takes action and the tag rules
+        for that move have been applied.
+        """
+        pacman, ghost, ghostDirection, pacmanIsIt, cooldown, pacmanScore, phantomScore = state
+        if agentIndex == 0:
+            pacman = self.moves[pacman][action]
+        else:
+            ghost = self.moves[ghost][action]
+            if action != Directions.STOP:
+                ghostDirection = action
+
+        if cooldown > 0:
+            cooldown -= 1
+        if cooldown == 0 and self.isTag(pacman, ghost):
+            pacmanIsIt = not pacmanIsIt
+            cooldown = TAG_COOLDOWN
+        if pacmanIsIt:
+            phantomScore += POINTS_PER_TICK
+        else:
+            pacmanScore += POINTS_PER_TICK
+        return (pacman, ghost, ghostDirection, pacmanIsIt, cooldown, pacmanScore, phantomScore)
+
+    def getWinner(self, state):
+        "Same as TagGameRules.getWinner, for model tuples."
+        if state[PACMAN_SCORE] >= WINNING_POINTS:
+            return "PACMAN"
+        if state[PHANTOM_SCORE] >= WINNING_POINTS:
+            return "PHANTOM"
+        return None
+
+    def greedyAction(self, state, agentIndex, rng=random, bestProb=0.8):
+        """
+        Samples the cheap rollout policy of TagGhostAgent for either player:
+        with probability bestProb a move that best closes (when IT) or opens
+        (when fleeing) the Manhattan distance to the opponent, and otherwise
+        any legal move.  Pacman does not stop.
+        """
+        legal = self.getLegalActions(state, agentIndex)
+        if agentIndex == 0 and len(legal) > 1:
+            legal = [a for a in legal if a != Directions.STOP]
+        if rng.random() >= bestProb:
+            return legal[int(rng.random() * len(legal))]
+
+        mover = state[agentIndex]
+        ox, oy = self.positions[state[1 - agentIndex]]
+        moves = self.moves[mover]
+        chasing = state[PACMAN_IS_IT] == (agentIndex == 0)
+        best, bestScore = [], None
+        for action in legal:
+            x, y = self.positions[moves[action]]
+            score = abs(x - ox) + abs(y - oy)
+            if not chasing: score = -score
+            if bestScore == None or score < bestScore:
+                best, bestScore = [action], score
+            elif score == bestScore:
+                best.append(action)
+        return best[int(rng.random() * len(best))]
+
+_MODELS = {}
+
+def getModel(layout):
+    "Returns the TagModel for layout, shared by every game on the same map."
+    key = layout.getFingerprint()
+    if key not in _MODELS:
+        _MODELS[key] = TagModel(layout)
+    return _MODELS[key]
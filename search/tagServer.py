@@ -0,0 +1,399 @@
+"""
+A server that plays many tag games at once in one asyncio event loop, with
+the agents connected as clients over local TCP or Unix sockets.
+
+A client asks for a seat (Pacman or the ghost) on a layout; the server pairs
+waiting seats on the same layout into a match and drives it the way
+Game.run does, with TagGameState.generateSuccessor and
+TagGameRules.process.  The layout is sent once per connection.  After that,
+each ply sends the mover only the fields of the state that change (the
+struct agentHost uses, with the move's deadline), and the mover answers
+with one action byte.  Every message is a 4-byte length and a kind byte:
+
+  client -> server   JOIN seat, role, layout name | MOVE seat, action | STATS
+  server -> client   LAYOUT name, text | START seat, role, layout name |
+                     PLY seat, state | END seat, result | STATS json | ERROR text
+
+A tick task checks the running matches every tickTime seconds and ends any
+whose mover has missed its deadline, like a timeout under Game.run with
+catchExceptions; a move arriving after its deadline counts as a timeout
+too.  Backpressure comes from two places: at most maxGames matches run at
+once (pairs beyond that wait for a free slot), and after each batch of
+messages the server waits until every client it wrote to has drained its
+socket buffer, so a client that stops reading slows down the clients
+feeding it instead of growing the server's memory.
+
+> python tagServer.py --address /tmp/tag.sock
+> python tagLoad.py --address /tmp/tag.sock -g 200 -n 2000 -l mediumClassic
+"""
+import asyncio
+import json
+import struct
+import sys
+import time
+from collections import deque
+from game import MoveBudget
+from tagEnv import ACTIONS
+from tagGame import TagGameRules, TagGameState
+import agentHost
+import layout
+
+# Messages from clients
+JOIN, MOVE, STATS = b'J', b'M', b'T'
+# Messages from the server (STATS is answered with a STATS message)
+LAYOUT, START, PLY, END, ERROR = b'L', b'S', b'P', b'E', b'X'
+
+# Why a match ended, in END messages
+FINISHED, TIMED_OUT, ILLEGAL_MOVE, DISCONNECTED = 0, 1, 2, 3
+REASONS = ['finished', 'timed out', 'illegal move', 'disconnected']
+WINNERS = ['PACMAN', 'PHANTOM']
+
+_LENGTH = struct.Struct('<I')
+# The client's id for a seat, then the role (JOIN and START) or action (MOVE)
+_SEAT = struct.Struct('<Ib')
+_TICKET = struct.Struct('<I')
+# Seat, winner (an index into WINNERS, -1 for none), reason, moves, and
+# Pacman's and the phantom's points
+_END = struct.Struct('<Ibbi2d')
+
+def frame(kind, body=b''):
+    return _LENGTH.pack(len(body) + 1) + kind + body
+
+def splitFrames(buffer):
+    """
+    Returns (messages, rest): the complete messages at the start of buffer
+    and the bytes of the incomplete one after them.
+    """
+    messages, start = [], 0
+    while len(buffer) - start >= _LENGTH.size:
+        end = start + _LENGTH.size + _LENGTH.unpack_from(buffer, start)[0]
+        if end > len(buffer):
+            break
+        messages.append(buffer[start + _LENGTH.size:end])
+        start = end
+    return messages, buffer[start:]
+
+def parseAddress(address):
+    "A 'host:port' address is a TCP one; anything else is a Unix socket path."
+    host, colon, port = address.rpartition(':')
+    if colon and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return address
+
+async def openConnection(address):
+    "Returns the (reader, writer) streams of a connection to a server."
+    address = parseAddress(address)
+    if isinstance(address, tuple):
+        return await asyncio.open_connection(*address)
+    return await asyncio.open_unix_connection(address)
+
+class Connection:
+    "A connected client, the seats it holds and the layouts it has been sent."
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.outbox = []
+        self.seats = {}
+        self.layouts = set()
+        self.closed = False
+
+    def send(self, message):
+        "Queues a framed message; the server writes it out after the current batch."
+        if not self.closed:
+            self.outbox.append(message)
+            self.server.dirty.add(self)
+
+    def error(self, text):
+        self.send(frame(ERROR, text.encode()))
+
+    def writeOut(self):
+        if len(self.outbox) > 0:
+            self.writer.write(b''.join(self.outbox))
+            self.outbox = []
+
+class Seat:
+    def __init__(self, connection, seatId, role, layoutName):
+        self.connection = connection
+        self.seatId = seatId
+        self.role = role
+        self.layoutName = layoutName
+        self.match = None
+
+class Match:
+    """
+    One game between two seats.  It stands in for the Game that
+    TagGameRules.process expects (state, gameOver, winner, moveHistory) and
+    keeps each agent's total time like Game.run.
+    """
+    def __init__(self, server, layoutObj, seats):
+        self.server = server
+        self.rules = server.rules
+        self.seats = seats
+        self.state = TagGameState()
+        self.state.initialize(layoutObj, 1)
+        self.moveHistory = []
+        self.gameOver = False
+        self.winner = None
+        self.agentIndex = 0
+        self.deadline = float('inf')
+        self.askTime = 0.0
+        self.totalAgentTimes = [0.0, 0.0]
+        for seat in seats:
+            seat.match = self
+
+    def start(self):
+        name = self.seats[0].layoutName
+        for seat in self.seats:
+            if name not in seat.connection.layouts:
+                seat.connection.layouts.add(name)
+                seat.connection.send(self.server.layoutFrames[name])
+            seat.connection.send(frame(START, _SEAT.pack(seat.seatId, seat.role) + name.encode()))
+        self.ask()
+
+    def ask(self):
+        "Sends the state to the agent to move, with the deadline of its move."
+        index, seat = self.agentIndex, self.seats[self.agentIndex]
+        self.askTime = time.monotonic()
+        budget = MoveBudget(self.rules.getMoveTimeout(index),
+                            self.rules.getMaxTotalTime(index) - self.totalAgentTimes[index], self.askTime)
+        self.deadline = budget.deadline
+        seat.connection.send(frame(PLY, _TICKET.pack(seat.seatId) + agentHost.packPly(self.state, budget)[1:]))
+
+    def play(self, actionIndex):
+        index = self.agentIndex
+        now = time.monotonic()
+        self.totalAgentTimes[index] += now - self.askTime
+        if now > self.deadline:
+            return self.end(TIMED_OUT, index)
+        if not 0 <= actionIndex < len(ACTIONS) or ACTIONS[actionIndex] not in self.state.getLegalActions(index):
+            return self.end(ILLEGAL_MOVE, index)
+        action = ACTIONS[actionIndex]
+        self.state = self.state.generateSuccessor(index, action)
+        self.moveHistory.append((index, action))
+        self.server.plies += 1
+        self.rules.process(self.state, self)
+        if self.gameOver:
+            return self.end(FINISHED)
+        self.agentIndex = (index + 1) % len(self.seats)
+        self.ask()
+
+    def end(self, reason, crashedIndex=None):
+        "Tells both seats the result and frees them; crashedIndex is the agent at fault."
+        self.gameOver = True
+        self.deadline = float('inf')
+        self.reason, self.crashedIndex = reason, crashedIndex
+        data = self.state.data
+        winner = WINNERS.index(self.winner) if self.winner != None else -1
+        for seat in self.seats:
+            seat.connection.send(frame(END, _END.pack(seat.seatId, winner, reason, data.move_count,
+                                                      data.pacman_score, data.phantom_score)))
+            seat.connection.seats.pop(seat.seatId, None)
+            seat.match = None
+        self.server.endMatch(self)
+
+class TagServer:
+    """
+    Plays the matches of every connected client.  The rules (maxTags,
+    maxMoves, the per-move and per-game timeouts) are the same for all.
+    """
+    def __init__(self, maxGames=1000, moveTimeout=1.0, timeout=30, maxTags=10, maxMoves=1000, tickTime=0.01):
+        self.rules = TagGameRules(timeout=timeout, maxTags=maxTags, maxMoves=maxMoves, moveTimeout=moveTimeout)
+        self.rules.quiet = True
+        self.maxGames = maxGames
+        self.tickTime = tickTime
+        self.layouts = {}
+        self.layoutFrames = {}
+        self.waiting = {}  # (layout name, role) -> seats waiting for an opponent
+        self.pending = deque()  # Pairs of seats waiting for a free match slot
+        self.matches = set()
+        self.dirty = set()
+        self.startTime = time.time()
+        self.plies = 0
+        self.peakGames = 0
+        self.gamesStarted = 0
+        self.results = [0] * len(REASONS)
+
+    def getLayout(self, name):
+        if name not in self.layouts:
+            layoutObj = layout.getLayout(name)
+            if layoutObj == None:
+                return None
+            self.layouts[name] = layoutObj
+            self.layoutFrames[name] = frame(LAYOUT, name.encode() + b'\n' + '\n'.join(layoutObj.layoutText).encode())
+        return self.layouts[name]
+
+    def handle(self, connection, message):
+        kind, body = message[:1], message[1:]
+        if kind == MOVE:
+            seatId, action = _SEAT.unpack(body)
+            seat = connection.seats.get(seatId)
+            # Moves for seats whose match has just ended are dropped
+            if seat != None and seat.match != None:
+                if seat.match.agentIndex != seat.role:
+                    connection.error('Seat %d moved out of turn' % seatId)
+                else:
+                    seat.match.play(action)
+        elif kind == JOIN:
+            seatId, role = _SEAT.unpack_from(body)
+            self.join(connection, seatId, role, body[_SEAT.size:].decode())
+        elif kind == STATS:
+            connection.send(frame(STATS, json.dumps(self.getStats()).encode()))
+        else:
+            connection.error('Unknown message %r' % kind)
+
+    def join(self, connection, seatId, role, layoutName):
+        if role not in (0, 1) or seatId in connection.seats:
+            return connection.error('Seat %d cannot join as role %d' % (seatId, role))
+        if self.getLayout(layoutName) == None:
+            return connection.error('Layout %s not found' % layoutName)
+        seat = Seat(connection, seatId, role, layoutName)
+        connection.seats[seatId] = seat
+        opponents = self.waiting.get((layoutName, 1 - role))
+        if opponents:
+            opponent = opponents.popleft()
+            self.pending.append([seat, opponent] if role == 0 else [opponent, seat])
+            self.startMatches()
+        else:
+            self.waiting.setdefault((layoutName, role), deque()).append(seat)
+
+    def startMatches(self):
+        while len(self.pending) > 0 and len(self.matches) < self.maxGames:
+            seats = self.pending.popleft()
+            if any(seat.connection.closed for seat in seats):
+                # Put the seat whose client is still there back in line
+                for seat in seats:
+                    if not seat.connection.closed:
+                        self.waiting.setdefault((seat.layoutName, seat.role), deque()).appendleft(seat)
+                continue
+            match = Match(self, self.layouts[seats[0].layoutName], seats)
+            self.matches.add(match)
+            self.gamesStarted += 1
+            self.peakGames = max(self.peakGames, len(self.matches))
+            match.start()
+
+    def endMatch(self, match):
+        self.matches.discard(match)
+        self.results[match.reason] += 1
+        self.startMatches()
+
+    def disconnect(self, connection):
+        "Ends the matches of a client that has gone away."
+        connection.closed = True
+        connection.outbox = []
+        self.dirty.discard(connection)
+        for seat in list(connection.seats.values()):
+            if seat.match != None:
+                seat.match.end(DISCONNECTED, seat.role)
+            else:
+                queue = self.waiting.get((seat.layoutName, seat.role))
+                if queue != None and seat in queue:
+                    queue.remove(seat)
+        connection.seats.clear()
+
+    async def flush(self):
+        "Writes out every queued message, then waits for the slow readers."
+        dirty, self.dirty = self.dirty, set()
+        for connection in dirty:
+            connection.writeOut()
+        for connection in dirty:
+            try:
+                await connection.writer.drain()
+            except ConnectionError:
+                pass
+
+    async def serveClient(self, reader, writer):
+        connection = Connection(self, writer)
+        buffer = b''
+        try:
+            while True:
+                data = await reader.read(65536)
+                if len(data) == 0:
+                    break
+                messages, buffer = splitFrames(buffer + data)
+                for message in messages:
+                    self.handle(connection, message)
+                await self.flush()
+        except (ConnectionError, struct.error):
+            pass
+        finally:
+            self.disconnect(connection)
+            await self.flush()
+            writer.close()
+
+    async def tick(self, reportEvery):
+        "Ends the matches whose mover missed its deadline, every tickTime seconds."
+        nextReport = time.monotonic() + reportEvery
+        while True:
+            await asyncio.sleep(self.tickTime)
+            now = time.monotonic()
+            for match in [match for match in self.matches if match.deadline < now]:
+                match.end(TIMED_OUT, match.agentIndex)
+            await self.flush()
+            if reportEvery > 0 and now >= nextReport:
+                nextReport = now + reportEvery
+                print(self.getStatsLine())
+                sys.stdout.flush()
+
+    async def serve(self, address, reportEvery=0):
+        "Serves clients on address ('host:port' or a Unix socket path) until cancelled."
+        address = parseAddress(address)
+        if isinstance(address, tuple):
+            server = await asyncio.start_server(self.serveClient, *address)
+        else:
+            server = await asyncio.start_unix_server(self.serveClient, address)
+        ticker = asyncio.ensure_future(self.tick(reportEvery))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            ticker.cancel()
+
+    def getStats(self):
+        seconds = time.time() - self.startTime
+        return {'games': len(self.matches), 'peakGames': self.peakGames, 'started': self.gamesStarted,
+                'results': dict(zip(REASONS, self.results)), 'plies': self.plies, 'seconds': seconds,
+                'pliesPerSecond': self.plies / max(seconds, 1e-9),
+                'waiting': sum(len(queue) for queue in self.waiting.values()), 'pending': len(self.pending)}
+
+    def getStatsLine(self):
+        stats = self.getStats()
+        return '%(games)d games running (peak %(peakGames)d), %(started)d started, %(plies)d plies ' \
+               '(%(pliesPerSecond).0f/sec), %(waiting)d seats waiting, %(pending)d pairs pending' % stats
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python tagServer.py [options]')
+    parser.add_option('-a', '--address', dest='address', default='127.0.0.1:7470',
+                      help='HOST:PORT or Unix socket path to listen on [Default: %default]')
+    parser.add_option('-g', '--maxGames', dest='maxGames', type='int', default=1000,
+                      help='matches played at once; further pairs wait [Default: %default]')
+    parser.add_option('--moveTimeout', dest='moveTimeout', type='float', default=1.0,
+                      help='seconds an agent has for a move [Default: %default]')
+    parser.add_option('--timeout', dest='timeout', type='float', default=30,
+                      help='seconds an agent has for a whole game [Default: %default]')
+    parser.add_option('--maxTags', dest='maxTags', type='int', default=10,
+                      help='maximum tags per game [Default: %default]')
+    parser.add_option('--maxMoves', dest='maxMoves', type='int', default=1000,
+                      help='maximum moves per game [Default: %default]')
+    parser.add_option('--tick', dest='tick', type='float', default=0.01,
+                      help='seconds between deadline checks [Default: %default]')
+    parser.add_option('--report', dest='report', type='float', default=10,
+                      help='print the server stats every REPORT seconds (0 for never) [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+def runServer(options):
+    server = TagServer(options.maxGames, options.moveTimeout, options.timeout, options.maxTags,
+                       options.maxMoves, options.tick)
+    print('Serving tag games on %s' % options.address)
+    sys.stdout.flush()
+    try:
+        asyncio.run(server.serve(options.address, options.report))
+    except KeyboardInterrupt:
+        pass
+    print(server.getStatsLine())
+
+if __name__ == '__main__':
+    runServer(readCommand(sys.argv[1:]))
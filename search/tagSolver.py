@@ -0,0 +1,218 @@
+"""
+Offline solver for one-ghost tag on a fixed layout.
+
+A tag position is fully described by (pacman cell, ghost cell, ghost heading,
+who is IT, cooldown) plus whose move it is; the heading matters because the
+ghost may not turn back.  On the classic layouts that is a few million
+positions, small enough to solve the whole game at once with value iteration
+over NumPy arrays.
+
+The value of a position is Pacman's points minus the Phantom's points over the
+rest of the game, discounted by `discount` per move (the race to 1000 points
+is ignored, which makes the game stationary).  Pacman maximizes it and the
+ghost minimizes it.  The solved policies are stored as one byte per position
+and answered by TablePacmanAgent / TableGhostAgent in tagAgents.py.
+
+To solve a layout from the command line:
+
+> python tagSolver.py -l mediumClassic -o mediumClassic.tag.npz
+"""
+import sys
+import time
+from tagGame import TAG_COOLDOWN, POINTS_PER_TICK
+import tagModel
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+NUM_DIRECTIONS = 5
+NUM_COOLDOWNS = TAG_COOLDOWN + 1
+NO_ACTION = -1
+
+class TagSolution:
+    """
+    Solved values and policies for one layout.  values[turn] and
+    policies[turn] are flat arrays over every position, where turn 0 means
+    Pacman moves next and turn 1 means the ghost moves next; a policy entry
+    is an index into model.actions.
+    """
+    def __init__(self, model, values, policies, discount):
+        self.model = model
+        self.values = values
+        self.policies = policies
+        self.discount = discount
+
+    def getIndex(self, state):
+        "Flat array index of a tagModel state tuple."
+        pacman, ghost, direction, pacmanIsIt, cooldown = state[:5]
+        n = self.model.numCells
+        d = self.model.actions.index(direction)
+        return (((pacman * n + ghost) * NUM_DIRECTIONS + d) * 2 + int(pacmanIsIt)) * NUM_COOLDOWNS + cooldown
+
+    def getAction(self, state, agentIndex):
+        "Optimal action for agentIndex in a tagModel state tuple."
+        actionIndex = self.policies[agentIndex][self.getIndex(state)]
+        if actionIndex == NO_ACTION: return None
+        return self.model.actions[actionIndex]
+
+    def getValue(self, state, agentIndex):
+        "Discounted points difference for Pacman when agentIndex moves next."
+        return float(self.values[agentIndex][self.getIndex(state)])
+
+    def save(self, filename):
+        "Writes the policies (and values, as float32) to a compressed .npz file."
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f, layoutText=np.array(self.model.layout.layoutText),
+                                fingerprint=np.array(self.model.layout.getFingerprint()),
+                                discount=np.array(self.discount),
+                                pacmanPolicy=self.policies[0], ghostPolicy=self.policies[1],
+                                pacmanValues=self.values[0], ghostValues=self.values[1])
+
+def loadSolution(filename):
+    "Reads a TagSolution written by TagSolution.save."
+    requireNumpy()
+    import layout
+    archive = np.load(filename)
+    model = tagModel.getModel(layout.Layout([str(line) for line in archive['layoutText']]))
+    if model.layout.getFingerprint() != str(archive['fingerprint']):
+        raise Exception('Tag table %s does not match its layout' % filename)
+    return TagSolution(model, [archive['pacmanValues'], archive['ghostValues']],
+                       [archive['pacmanPolicy'], archive['ghostPolicy']], float(archive['discount']))
+
+def requireNumpy():
+    if not _NUMPY_AVAILABLE:
+        raise Exception('The tag solver needs numpy (pip install numpy)')
+
+def buildTransitions(model):
+    """
+    Returns, for each turn, arrays over (action, position) with the successor
+    position, the reward to Pacman for the move and whether it is legal.
+    """
+    n = model.numCells
+    shape = (n, n, NUM_DIRECTIONS, 2, NUM_COOLDOWNS)
+    pacman, ghost, direction, pacmanIsIt, cooldown = [a.ravel() for a in np.indices(shape)]
+
+    moveTable = np.full((n, NUM_DIRECTIONS), NO_ACTION, dtype=np.int64)
+    for cell, moves in enumerate(model.moves):
+        for action, target in moves.items():
+            moveTable[cell, model.actions.index(action)] = target
+    ghostLegal = np.zeros((n, NUM_DIRECTIONS, NUM_DIRECTIONS), dtype=bool)
+    for cell in range(n):
+        for d, heading in enumerate(model.actions):
+            for action in model.ghostActions[cell][heading]:
+                ghostLegal[cell, d, model.actions.index(action)] = True
+    tagTable = np.array([[model.isTag(p, g) for g in range(n)] for p in range(n)], dtype=bool)
+
+    nextCooldown = np.maximum(cooldown - 1, 0)
+    transitions = []
+    for turn in range(2):
+        successors = np.zeros((NUM_DIRECTIONS, pacman.size), dtype=np.int32)
+        rewards = np.zeros((NUM_DIRECTIONS, pacman.size), dtype=np.float32)
+        legal = np.zeros((NUM_DIRECTIONS, pacman.size), dtype=bool)
+        for a in range(NUM_DIRECTIONS):
+            if turn == 0:
+                newPacman, newGhost, newDirection = moveTable[pacman, a], ghost, direction
+                legal[a] = newPacman != NO_ACTION
+            else:
+                newPacman, newGhost = pacman, moveTable[ghost, a]
+                newDirection = np.full_like(direction, a)
+                legal[a] = ghostLegal[ghost, direction, a]
+            newPacman = np.where(legal[a], newPacman, 0)
+            newGhost = np.where(legal[a], newGhost, 0)
+            tagged = (nextCooldown == 0) & tagTable[newPacman, newGhost]
+            newIt = np.where(tagged, 1 - pacmanIsIt, pacmanIsIt)
+            newCooldown = np.where(tagged, TAG_COOLDOWN, nextCooldown)
+            successors[a] = np.ravel_multi_index((newPacman, newGhost, newDirection, newIt, newCooldown), shape)
+            rewards[a] = np.where(newIt == 1, -POINTS_PER_TICK, POINTS_PER_TICK)
+        transitions.append((successors, rewards, legal))
+    return transitions
+
+def solveLayout(layout, discount=0.95, tolerance=0.01, maxIterations=2000, verbose=False):
+    """
+    Solves tag on layout by value iteration and returns a TagSolution.
+    Iterates until no value changes by more than tolerance.
+    """
+    requireNumpy()
+    model = tagModel.getModel(layout)
+    transitions = buildTransitions(model)
+    size = transitions[0][0].shape[1]
+    values = [np.zeros(size, dtype=np.float64), np.zeros(size, dtype=np.float64)]
+    startTime = time.time()
+    for iteration in range(maxIterations):
+        change = 0.0
+        for turn in range(2):
+            successors, rewards, legal = transitions[turn]
+            q = rewards + discount * values[1 - turn][successors]
+            if turn == 0:
+                newValues = np.where(legal, q, -np.inf).max(axis=0)
+            else:
+                newValues = np.where(legal, q, np.inf).min(axis=0)
+            change = max(change, float(np.abs(newValues - values[turn]).max()))
+            values[turn] = newValues
+        if verbose and iteration % 25 == 0:
+            print('Iteration %d: largest change %.4f (%.1fs)' % (iteration, change, time.time() - startTime))
+        if change < tolerance:
+            break
+
+    policies = []
+    for turn in range(2):
+        successors, rewards, legal = transitions[turn]
+        q = rewards + discount * values[1 - turn][successors]
+        if turn == 0:
+            q = np.where(legal, q, -np.inf)
+            policy = q.argmax(axis=0)
+        else:
+            q = np.where(legal, q, np.inf)
+            policy = q.argmin(axis=0)
+        policy = np.where(legal.any(axis=0), policy, NO_ACTION).astype(np.int8)
+        policies.append(policy)
+    if verbose:
+        print('Solved %d positions in %d iterations (%.1fs)' % (2 * size, iteration + 1, time.time() - startTime))
+    return TagSolution(model, [v.astype(np.float32) for v in values], policies, discount)
+
+_SOLUTIONS = {}
+
+def getSolution(layout, tableFile=None, discount=0.95):
+    """
+    Returns the solution for layout, loading it from tableFile if given and
+    otherwise solving the layout once per process.
+    """
+    key = (layout.getFingerprint(), tableFile, discount)
+    if key not in _SOLUTIONS:
+        if tableFile != None:
+            solution = loadSolution(tableFile)
+            if solution.model.layout.getFingerprint() != layout.getFingerprint():
+                raise Exception('Tag table %s was solved for a different layout' % tableFile)
+        else:
+            solution = solveLayout(layout, discount)
+        _SOLUTIONS[key] = solution
+    return _SOLUTIONS[key]
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python tagSolver.py -l LAYOUT -o OUTPUT_FILE')
+    parser.add_option('-l', '--layout', dest='layout', default='mediumClassic',
+                      help='the LAYOUT to solve [Default: %default]')
+    parser.add_option('-o', '--output', dest='output', default=None,
+                      help='where to write the solved tables [Default: LAYOUT.tag.npz]')
+    parser.add_option('-d', '--discount', dest='discount', type='float', default=0.95,
+                      help='discount per move [Default: %default]')
+    parser.add_option('--tolerance', dest='tolerance', type='float', default=0.01,
+                      help='stop when no value changes by more than this [Default: %default]')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+if __name__ == '__main__':
+    import layout
+    options = readCommand(sys.argv[1:])
+    layoutObj = layout.getLayout(options.layout)
+    if layoutObj == None: raise Exception("The layout " + options.layout + " cannot be found")
+    solution = solveLayout(layoutObj, options.discount, options.tolerance, verbose=True)
+    output = options.output or options.layout + '.tag.npz'
+    solution.save(output)
+    print('Wrote %s' % output)
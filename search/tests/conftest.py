@@ -0,0 +1,17 @@
+"""
+The modules of this directory are imported flat and load layouts from
+layouts/, so tests run with it on sys.path and as the working directory:
+
+> python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+SEARCH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SEARCH_DIR)
+
+@pytest.fixture(autouse=True)
+def searchDir(monkeypatch):
+    monkeypatch.chdir(SEARCH_DIR)
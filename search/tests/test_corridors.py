@@ -0,0 +1,71 @@
+"""
+Corridor skipping must not change a game: the move histories and final
+states of seeded games are compared with and without a CorridorSkipper.
+"""
+import random
+
+import pytest
+
+import corridors
+import layout
+import tagGame
+import textDisplay
+from tagAgents import TagPacmanAgent, TagGhostAgent
+
+def playGames(layoutName, numGames, skip, maxMoves=1000):
+    "Plays seeded games of corridor-following agents; returns (games, skipper)."
+    layoutObj = layout.getLayout(layoutName)
+    rules = tagGame.TagGameRules(maxMoves=maxMoves)
+    pacman, ghost = TagPacmanAgent(0, corridors=1), TagGhostAgent(1, corridors=1)
+    skipper = corridors.CorridorSkipper(layoutObj) if skip else None
+    games = []
+    for number in range(numGames):
+        random.seed(number)
+        game = rules.newGame(layoutObj, pacman, [ghost], textDisplay.NullGraphics(), quiet=True, fast=True)
+        game.muteAgents = True
+        game.skipper = skipper
+        game.run()
+        games.append(game)
+    return games, skipper
+
+def getFinalState(game):
+    "Every field of the final TagGameStateData that a skipped ply could get wrong."
+    data = game.state.data
+    fields = dict((name, value) for name, value in vars(data).items()
+                  if name not in ('agentStates', 'food', 'layout'))
+    fields['agentStates'] = [(agentState.configuration.pos, agentState.configuration.direction,
+                              agentState.scaredTimer) for agentState in data.agentStates]
+    fields['winner'] = getattr(game, 'winner', None)
+    fields['gameOver'] = game.gameOver
+    return fields
+
+def assertSameGames(layoutName, numGames, **kwargs):
+    plain = playGames(layoutName, numGames, False, **kwargs)[0]
+    skipped, skipper = playGames(layoutName, numGames, True, **kwargs)
+    assert skipper.plies > 0
+    for plainGame, skippedGame in zip(plain, skipped):
+        assert list(skippedGame.moveHistory) == list(plainGame.moveHistory)
+        assert getFinalState(skippedGame) == getFinalState(plainGame)
+
+@pytest.mark.parametrize('layoutName', ['mediumClassic', 'originalClassic', 'smallClassic', 'trickyClassic'])
+def test_skippedGamesMatchPlyByPly(layoutName):
+    assertSameGames(layoutName, 10)
+
+def test_skippedGamesStopAtTheMoveLimit():
+    assertSameGames('originalClassic', 5, maxMoves=101)
+
+def test_skippedGamesStopAtTheWinningScore(monkeypatch):
+    # Games end on points long before the move limit
+    monkeypatch.setattr(tagGame, 'WINNING_POINTS', 150)
+    assertSameGames('originalClassic', 5)
+
+def test_corridorLengths():
+    model = corridors.CorridorSkipper(layout.getLayout('originalClassic')).model
+    for cell in range(model.numCells):
+        for direction in model.actions:
+            length = model.getCorridorLength(cell, direction)
+            move = model.getForcedMove(cell, direction)
+            if move == None:
+                assert length == 0
+            elif length < model.numCells:
+                assert length == 1 + model.getCorridorLength(model.moves[cell][move], move)
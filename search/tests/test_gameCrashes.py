@@ -0,0 +1,80 @@
+"""
+An agent that raises from any of the methods Game calls on it crashes the
+game when catchExceptions is set, and its muted output never stays
+redirected.  FastGame discards everything a muted agent prints.
+"""
+import sys
+
+import pytest
+
+import layout
+import tagGame
+import textDisplay
+from tagAgents import TagPacmanAgent, TagGhostAgent
+
+class RaisingAgent(TagGhostAgent):
+    "A ghost that prints, then raises, from the method named by failIn."
+    def __init__(self, index, failIn):
+        TagGhostAgent.__init__(self, index)
+        self.failIn = failIn
+
+    def fail(self, method):
+        print('%s is about to fail' % method)
+        if method == self.failIn:
+            raise ValueError('%s failed' % method)
+
+    def setMoveBudget(self, budget):
+        self.fail('setMoveBudget')
+
+def playGame(ghost, catchExceptions):
+    rules = tagGame.TagGameRules(maxMoves=50)
+    game = rules.newGame(layout.getLayout('smallClassic'), TagPacmanAgent(0), [ghost], textDisplay.NullGraphics(),
+                         quiet=True, catchExceptions=catchExceptions)
+    game.muteAgents = True
+    game.run()
+    return game
+
+def test_setMoveBudgetCrashes():
+    stdout, stderr = sys.stdout, sys.stderr
+    game = playGame(RaisingAgent(1, 'setMoveBudget'), catchExceptions=True)
+    assert game.agentCrashed
+    assert sys.stdout is stdout and sys.stderr is stderr
+    assert 'setMoveBudget failed' in game.agentOutput[1].getvalue()
+
+def test_setMoveBudgetRaises():
+    stdout, stderr = sys.stdout, sys.stderr
+    with pytest.raises(ValueError):
+        playGame(RaisingAgent(1, 'setMoveBudget'), catchExceptions=False)
+    assert sys.stdout is stdout and sys.stderr is stderr
+
+class PonderingAgent(RaisingAgent):
+    def startPondering(self, state):
+        self.fail('startPondering')
+        return True
+
+    def stopPondering(self):
+        self.fail('stopPondering')
+
+@pytest.mark.parametrize('failIn', ['startPondering', 'stopPondering'])
+def test_ponderingCrashes(failIn):
+    stdout, stderr = sys.stdout, sys.stderr
+    game = playGame(PonderingAgent(1, failIn), catchExceptions=True)
+    assert game.agentCrashed
+    assert sys.stdout is stdout and sys.stderr is stderr
+    assert '%s failed' % failIn in game.agentOutput[1].getvalue()
+    assert game.ponderStartTimes == [None, None]
+
+@pytest.mark.parametrize('failIn', ['startPondering', 'stopPondering'])
+def test_ponderingRaises(failIn):
+    stdout, stderr = sys.stdout, sys.stderr
+    with pytest.raises(ValueError):
+        playGame(PonderingAgent(1, failIn), catchExceptions=False)
+    assert sys.stdout is stdout and sys.stderr is stderr
+
+def test_fastGameMutesSetMoveBudget(capsys):
+    rules = tagGame.TagGameRules(maxMoves=50)
+    game = rules.newGame(layout.getLayout('smallClassic'), TagPacmanAgent(0), [RaisingAgent(1, None)],
+                         textDisplay.NullGraphics(), quiet=True, fast=True)
+    game.muteAgents = True
+    game.run()
+    assert 'setMoveBudget is about to fail' not in capsys.readouterr().out
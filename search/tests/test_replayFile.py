@@ -0,0 +1,193 @@
+"""
+The replay format must give back what was written: packed action blocks,
+whole games, games cut short, files from later versions with records this
+reader does not know, and old pickled recordings converted to it.
+"""
+import pickle
+import random
+
+import pytest
+
+import layout
+import replayFile
+import tagGame
+import textDisplay
+from gameLog import ACTIONS
+from ghostAgents import RandomGhost
+from pacman import ClassicGameRules
+from pacmanAgents import LeftTurnAgent
+from tagAgents import TagPacmanAgent, TagGhostAgent
+
+def randomActions(count, seed=0):
+    generator = random.Random(seed)
+    return [generator.randrange(len(ACTIONS)) for i in range(count)]
+
+@pytest.mark.parametrize('count', [0, 1, 7, 8, 9, 1001, replayFile.BLOCK_ACTIONS])
+def test_packActions(count):
+    actions = randomActions(count)
+    packed = replayFile.packActions(actions)
+    assert len(packed) == 3 * ((count + 7) // 8)
+    assert replayFile.unpackActions(packed, count) == actions
+
+def playTagGames(numGames, maxMoves=300):
+    layoutObj = layout.getLayout('smallClassic')
+    rules = tagGame.TagGameRules(maxMoves=maxMoves)
+    games = []
+    for number in range(numGames):
+        random.seed(number)
+        game = rules.newGame(layoutObj, TagPacmanAgent(0), [TagGhostAgent(1)], textDisplay.NullGraphics(),
+                             quiet=True, fast=True)
+        game.muteAgents = True
+        game.run()
+        games.append(game)
+    return layoutObj, games
+
+def randomHistory(count, seed=0):
+    "A moveHistory of count plies of two agents taking turns; the format does not check the moves are legal."
+    return [(ply % 2, ACTIONS[action]) for ply, action in enumerate(randomActions(count, seed))]
+
+def writeGames(path, layoutObj, games, histories=None, endLast=True):
+    histories = histories or [game.moveHistory for game in games]
+    writer = replayFile.ReplayWriter(path)
+    for number, (game, history) in enumerate(zip(games, histories)):
+        writer.startGame('tag', layoutObj, len(game.agents), seed=number)
+        for agentIndex, action in history:
+            writer.record(agentIndex, action)
+        if endLast or number < len(games) - 1:
+            writer.endGame(game.state)
+    writer.close()
+    return writer
+
+def test_roundTrip(tmp_path):
+    layoutObj, games = playTagGames(4)
+    # Whole blocks, a block and a bit, and a count that is not a multiple of 8
+    histories = [games[0].moveHistory, randomHistory(replayFile.BLOCK_ACTIONS, 1),
+                 randomHistory(2 * replayFile.BLOCK_ACTIONS + 13, 2), randomHistory(8 * 5 + 3, 3)]
+    path = str(tmp_path / 'games.rpl')
+    writer = writeGames(path, layoutObj, games, histories)
+    assert writer.games == 4
+    recorded = list(replayFile.readGames(path))
+    assert [r.getMoveHistory() for r in recorded] == [list(history) for history in histories]
+    assert [r.header['seed'] for r in recorded] == [0, 1, 2, 3]
+    assert [r.results['plies'] for r in recorded] == [len(history) for history in histories]
+    assert recorded[0].results['winner'] == tagGame.TagGameRules.getWinner(games[0].state.data)
+    assert recorded[0].layoutText == '\n'.join(layoutObj.layoutText)
+
+def test_gameNeverEnded(tmp_path):
+    "A writer closed in the middle of a game (say, after a crash) keeps its plies."
+    layoutObj, games = playTagGames(2)
+    histories = [games[0].moveHistory, randomHistory(replayFile.BLOCK_ACTIONS + 5)]
+    path = str(tmp_path / 'crashed.rpl')
+    writeGames(path, layoutObj, games, histories, endLast=False)
+    recorded = list(replayFile.readGames(path))
+    assert len(recorded) == 2
+    assert recorded[0].results != None
+    assert recorded[1].results == None
+    assert recorded[1].getMoveHistory() == histories[1]
+
+def test_truncatedFile(tmp_path):
+    layoutObj, games = playTagGames(2)
+    history = randomHistory(2 * replayFile.BLOCK_ACTIONS + 1000)
+    path = str(tmp_path / 'truncated.rpl')
+    writer = replayFile.ReplayWriter(path)
+    writer.startGame('tag', layoutObj, 2)
+    for agentIndex, action in games[0].moveHistory:
+        writer.record(agentIndex, action)
+    writer.endGame(games[0].state)
+    writer.startGame('tag', layoutObj, 2)
+    for agentIndex, action in history:
+        writer.record(agentIndex, action)
+    writer.writeActions()
+    actionsEnd = writer.file.tell()
+    writer.endGame(games[1].state)
+    writer.close()
+    f = open(path, 'rb')
+    data = f.read()
+    f.close()
+    # Cut into the second game's result, and into its last block of actions
+    for end, plies in [(len(data) - 3, len(history)), (actionsEnd - 10, 2 * replayFile.BLOCK_ACTIONS)]:
+        f = open(path, 'wb')
+        f.write(data[:end])
+        f.close()
+        recorded = list(replayFile.readGames(path))
+        assert len(recorded) == 2
+        assert recorded[0].getMoveHistory() == list(games[0].moveHistory)
+        assert recorded[0].results != None
+        assert recorded[1].results == None
+        assert recorded[1].getMoveHistory() == history[:plies]
+
+def test_unknownRecordKind(tmp_path):
+    layoutObj, games = playTagGames(2)
+    path = str(tmp_path / 'later.rpl')
+    writer = replayFile.ReplayWriter(path)
+    for number, game in enumerate(games):
+        writer.writeRecord(b'X', b'a record of a later version')
+        writer.startGame('tag', layoutObj, len(game.agents), seed=number)
+        for agentIndex, action in game.moveHistory:
+            writer.record(agentIndex, action)
+            if len(writer.actions) == 50:
+                writer.writeActions()
+                writer.writeRecord(b'Z', b'')
+        writer.endGame(game.state)
+    writer.close()
+    recorded = list(replayFile.readGames(path))
+    assert [r.getMoveHistory() for r in recorded] == [list(game.moveHistory) for game in games]
+    assert all(r.results != None for r in recorded)
+
+def test_newerVersion(tmp_path):
+    path = str(tmp_path / 'newer.rpl')
+    f = open(path, 'wb')
+    f.write(replayFile.MAGIC + bytes([replayFile.VERSION + 1]))
+    f.close()
+    with pytest.raises(Exception, match='version'):
+        list(replayFile.readGames(path))
+
+def test_convertOldPickle(tmp_path):
+    "pacman.py used to pickle {'layout': Layout, 'actions': moveHistory} for every game."
+    layoutObj = layout.getLayout('smallClassic')
+    random.seed(0)
+    game = ClassicGameRules().newGame(layoutObj, LeftTurnAgent(), [RandomGhost(1), RandomGhost(2)],
+                                      textDisplay.NullGraphics(), quiet=True)
+    game.run()
+    path = str(tmp_path / 'recorded-game')
+    f = open(path, 'wb')
+    pickle.dump({'layout': layoutObj, 'actions': game.moveHistory}, f)
+    f.close()
+
+    recorded = replayFile.convertPickle(path)
+    assert recorded.header['kind'] == 'classic'
+    assert recorded.header['numAgents'] == 3
+    assert recorded.getMoveHistory() == list(game.moveHistory)
+    assert recorded.results['score'] == game.state.getScore()
+    assert recorded.results['win'] == game.state.isWin()
+
+    converted = str(tmp_path / 'converted.rpl')
+    writer = replayFile.ReplayWriter(converted)
+    replayFile.writeRecordedGame(writer, recorded)
+    writer.close()
+    replayed, = replayFile.readGames(converted)
+    assert replayed.getMoveHistory() == list(game.moveHistory)
+    assert replayed.results == recorded.results
+    assert replayFile.loadGameLog(converted).seek(len(game.moveHistory)).getScore() == game.state.getScore()
+
+def test_convertGameLogPickle(tmp_path):
+    layoutObj, games = playTagGames(1)
+    rules, state = replayFile.RecordedGame({'layout': layoutObj.getFingerprint(), 'kind': 'tag', 'numAgents': 2,
+                                            'rules': {'maxMoves': 300}}, '\n'.join(layoutObj.layoutText),
+                                           [], None).getRulesAndState()
+    path = str(tmp_path / 'game.log')
+    replayFile.GameLog.fromHistory(rules, state, games[0].moveHistory).save(path)
+    recorded = replayFile.convertPickle(path)
+    assert recorded.header['kind'] == 'tag'
+    assert recorded.getMoveHistory() == list(games[0].moveHistory)
+    assert recorded.results['winner'] == tagGame.TagGameRules.getWinner(games[0].state.data)
+
+def test_getLayout(tmp_path):
+    "Every call gives a Layout of its own, so changing one cannot reach other games."
+    layoutObj, games = playTagGames(2)
+    path = str(tmp_path / 'games.rpl')
+    writeGames(path, layoutObj, games)
+    first, second = replayFile.readGames(path)
+    assert first.getLayout() is not first.getLayout()
+    assert first.getLayout() is not second.getLayout()
+    assert first.getLayout().layoutText == layoutObj.layoutText
@@ -0,0 +1,69 @@
+"""
+A SpeedScheduler with equal speeds must play the same games as the round
+robin, and slower agents must still move whole cells.
+"""
+import random
+
+import pytest
+
+import layout
+import tagGame
+import textDisplay
+from game import SpeedScheduler
+from tagAgents import TagPacmanAgent, TagGhostAgent
+
+class PositionDisplay(textDisplay.NullGraphics):
+    "Keeps every agent position the game shows."
+    def __init__(self):
+        self.positions = []
+
+    def update(self, state):
+        self.positions.extend(agentState.configuration.pos for agentState in state.agentStates)
+
+def playGames(rules, numGames, fast, getScheduler=None, display=None):
+    layoutObj = layout.getLayout('smallClassic')
+    games = []
+    for number in range(numGames):
+        random.seed(number)
+        game = rules.newGame(layoutObj, TagPacmanAgent(0), [TagGhostAgent(1)], display or textDisplay.NullGraphics(),
+                             quiet=True, fast=fast)
+        game.muteAgents = True
+        if getScheduler != None:
+            game.scheduler = getScheduler()
+        game.run()
+        games.append(game)
+    return games
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_equalSpeedsTakeTurns(fast):
+    rules = tagGame.TagGameRules(maxMoves=400)
+    plain = playGames(rules, 5, fast)
+    scheduled = playGames(rules, 5, fast, lambda: SpeedScheduler(lambda state, agentIndex: 1.0))
+    for game, other in zip(plain, scheduled):
+        assert list(other.moveHistory) == list(game.moveHistory)
+        assert other.state.data.score == game.state.data.score
+        assert tagGame.TagGameRules.getWinner(other.state.data) == tagGame.TagGameRules.getWinner(game.state.data)
+
+def test_schedulerOrder():
+    "Speeds 1 and 0.5: the faster agent moves twice for each move of the slower one, ties in turn order."
+    scheduler = SpeedScheduler(lambda state, agentIndex: [1.0, 0.5][agentIndex])
+    order = [scheduler.start(None, 2)]
+    for ply in range(8):
+        order.append(scheduler.next(None, order[-1]))
+    assert order == [0, 1, 0, 0, 1, 0, 0, 1, 0]
+
+@pytest.mark.parametrize('fast', [False, True])
+def test_halfSpeedStaysOnCells(fast):
+    rules = tagGame.TagGameRules(maxMoves=400, itSpeed=1.0, runnerSpeed=0.5)
+    display = PositionDisplay()
+    games = playGames(rules, 3, fast, display=display)
+    assert all(game.scheduler != None for game in games)
+    # The runner moves half as often, so some agent moves twice in a row
+    assert any(game.moveHistory[ply][0] == game.moveHistory[ply + 1][0]
+               for game in games for ply in range(len(game.moveHistory) - 1))
+    assert len(display.positions) > 0
+    assert all(x == int(x) and y == int(y) for x, y in display.positions)
+    for game in games:
+        for agentState in game.state.data.agentStates:
+            x, y = agentState.configuration.pos
+            assert x == int(x) and y == int(y)
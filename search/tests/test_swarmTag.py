@@ -0,0 +1,22 @@
+"""
+Generated swarm arenas: any wall density in [0, 1) gives a connected open
+area, and other densities are rejected instead of hanging.
+"""
+import random
+
+import pytest
+
+import swarmTag
+
+@pytest.mark.parametrize('wallDensity', [0.0, 0.15, 0.5, 0.99])
+def test_generateArena(wallDensity):
+    arena = swarmTag.generateArena(20, 12, wallDensity, random.Random(1))
+    assert arena.width == 20 and arena.height == 12
+    assert len(arena.walls.asList(False)) > 0
+
+@pytest.mark.parametrize('wallDensity', [-0.1, 1.0, 1.5])
+def test_badWallDensity(wallDensity):
+    with pytest.raises(Exception, match='density'):
+        swarmTag.generateArena(20, 12, wallDensity, random.Random(1))
+    with pytest.raises(Exception, match='wallDensity'):
+        swarmTag.readCommand(['--wallDensity', str(wallDensity)])
@@ -0,0 +1,56 @@
+"""
+AlphaBetaTagAgent's transposition table must not carry a value between
+positions that differ in how close a player is to winning, and
+MCTSTagAgent's playouts follow random.seed.
+"""
+import random
+
+import layout
+import tagGame
+from tagAgents import AlphaBetaTagAgent, MCTSTagAgent
+from tagGame import POINTS_PER_TICK
+
+def getState(pacmanScore=0.0, phantomScore=0.0):
+    state = tagGame.TagGameState()
+    state.initialize(layout.getLayout('smallClassic'), 1)
+    state.data.pacman_score, state.data.phantom_score = pacmanScore, phantomScore
+    return state
+
+def getAgent(index, state, maxDepth=6):
+    agent = AlphaBetaTagAgent(index, maxDepth=maxDepth)
+    agent.registerInitialState(state)
+    agent.deadline, agent.nodes = float('inf'), 0
+    return agent
+
+def test_keyCountsPliesToWin():
+    agent = getAgent(0, getState())
+    far = [agent.zobristKey(getState(points, 0.0), 0) for points in [0.0, 500.0, 900.0]]
+    assert len(set(far)) == 1
+    near = [agent.zobristKey(getState(tagGame.WINNING_POINTS - plies * POINTS_PER_TICK + 0.1, 0.0), 0)
+            for plies in range(1, agent.maxDepth + 1)]
+    assert len(set(near)) == len(near)
+    assert far[0] not in near
+    assert agent.zobristKey(getState(0.0, 990.0), 0) != agent.zobristKey(getState(990.0, 0.0), 0)
+
+def test_tableNearAWin():
+    "Searching a position close to a win gives the same value after the table was filled far from one."
+    for index in range(2):
+        for plies in range(1, 5):
+            points = tagGame.WINNING_POINTS - plies * POINTS_PER_TICK + 0.1
+            near = getState(points, points)
+            fresh = getAgent(index, near)
+            expected = fresh.searchRoot(near, 5)
+            warm = getAgent(index, near)
+            warm.searchRoot(getState(), 5)
+            assert warm.searchRoot(near, 5) == expected
+
+def test_mctsSeededFromRandom():
+    "random.seed before a game seeds MCTSTagAgent's playouts, so compareAgents' pairs share them."
+    draws = []
+    for game in range(3):
+        random.seed(7 if game < 2 else 8)
+        agent = MCTSTagAgent(1)
+        agent.registerInitialState(getState())
+        draws.append([agent.rng.getrandbits(32) for i in range(5)])
+    assert draws[0] == draws[1]
+    assert draws[0] != draws[2]
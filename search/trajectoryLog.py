@@ -0,0 +1,222 @@
+"""
+Trajectory logs: every ply of a batch of tag games, stored column by column
+so they can be mined later without re-simulating anything.
+
+A TrajectoryWriter is attached to TagGameRules (rules.recorder) and gets one
+row per ply: the state the mover saw (positions, directions, who is IT, the
+tag cooldown), the action it took and the points each player earned.  Rows
+are buffered in fixed-width arrays of CHUNK_ROWS entries; full chunks go
+through a bounded queue to a background thread that appends them to shard
+files, starting a new shard once the current one reaches maxShardBytes.
+
+A shard is a small JSON header followed by chunks.  Each chunk is a row
+count and then every column's raw array, so a reader only ever holds one
+chunk in memory:
+
+> python runTag.py -q -n 100 -l mediumClassic --trajectoryDir trajectories
+> python trajectoryLog.py trajectories
+"""
+import array
+import glob
+import json
+import os
+import queue
+import struct
+import sys
+import threading
+from tagEnv import ACTIONS
+
+MAGIC = b'TAGTRAJ1'
+CHUNK_ROWS = 4096
+QUEUE_CHUNKS = 8
+
+# (name, array typecode); directions and actions are indices into ACTIONS.
+COLUMNS = [('game', 'i'), ('ply', 'i'), ('agent', 'b'),
+           ('pacmanX', 'f'), ('pacmanY', 'f'), ('ghostX', 'f'), ('ghostY', 'f'),
+           ('pacmanDirection', 'b'), ('ghostDirection', 'b'),
+           ('pacmanIsIt', 'b'), ('cooldown', 'h'), ('action', 'b'),
+           ('pacmanReward', 'f'), ('ghostReward', 'f'), ('done', 'b')]
+COLUMN_NAMES = [name for name, typecode in COLUMNS]
+_CHUNK_HEADER = struct.Struct('<I')
+
+def observe(state):
+    "The state columns of a row, as seen before the next move."
+    data = state.data
+    (pacmanX, pacmanY), (ghostX, ghostY) = state.getPacmanPosition(), state.getGhostPosition(1)
+    return (pacmanX, pacmanY, ghostX, ghostY,
+            ACTIONS.index(data.agentStates[0].configuration.direction),
+            ACTIONS.index(data.agentStates[1].configuration.direction),
+            int(data.pacman_is_it), data.tag_cooldown), (data.pacman_score, data.phantom_score)
+
+class TrajectoryWriter:
+    """
+    Streams plies into shard files named prefix-00000.traj, ... in
+    directory.  Simulation threads only append to in-memory arrays; the
+    files are written by a background thread.  Call close() when done.
+    """
+    def __init__(self, directory, maxShardBytes=64 * 2**20, prefix='tag', layoutName=None):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.maxShardBytes = maxShardBytes
+        self.prefix = prefix
+        self.layoutName = layoutName
+        self.games = -1
+        self.rows = 0
+        self.shards = []
+        self.bytesWritten = 0
+        self.error = None
+        self.newBuffers()
+        self.chunks = queue.Queue(QUEUE_CHUNKS)
+        self.thread = threading.Thread(target=self.writeChunks, daemon=True)
+        self.thread.start()
+
+    def newBuffers(self):
+        self.buffers = [array.array(typecode) for name, typecode in COLUMNS]
+
+    def startGame(self, state):
+        "Called by TagGameRules.newGame with the initial state."
+        self.games += 1
+        self.ply = 0
+        self.previous, self.scores = observe(state)
+
+    def recordPly(self, state, game):
+        "Called by TagGameRules.process after every move."
+        agent, action = game.moveHistory[-1]
+        current, scores = observe(state)
+        row = (self.games, self.ply, agent) + self.previous + (ACTIONS.index(action),
+               scores[0] - self.scores[0], scores[1] - self.scores[1], int(game.gameOver))
+        for buffer, value in zip(self.buffers, row):
+            buffer.append(value)
+        self.previous, self.scores = current, scores
+        self.ply += 1
+        self.rows += 1
+        if len(self.buffers[0]) >= CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        "Hands the buffered rows to the writer thread."
+        if self.error != None:
+            raise self.error
+        if len(self.buffers[0]) > 0:
+            self.chunks.put(self.buffers)
+            self.newBuffers()
+
+    def close(self):
+        "Writes out everything still buffered and waits for the writer thread."
+        self.flush()
+        self.chunks.put(None)
+        self.thread.join()
+        if self.error != None:
+            raise self.error
+
+    def writeChunks(self):
+        shard = None
+        try:
+            while True:
+                buffers = self.chunks.get()
+                if buffers == None:
+                    break
+                if shard == None or shard.tell() >= self.maxShardBytes:
+                    if shard != None:
+                        shard.close()
+                    shard = self.openShard()
+                start = shard.tell()
+                shard.write(_CHUNK_HEADER.pack(len(buffers[0])))
+                for buffer in buffers:
+                    if sys.byteorder != 'little':
+                        buffer.byteswap()
+                    buffer.tofile(shard)
+                self.bytesWritten += shard.tell() - start
+        except Exception as e:
+            self.error = e
+            # Keep draining so the simulation never blocks on a full queue
+            while self.chunks.get() != None:
+                pass
+        finally:
+            if shard != None:
+                shard.close()
+
+    def openShard(self):
+        path = os.path.join(self.directory, '%s-%05d.traj' % (self.prefix, len(self.shards)))
+        header = json.dumps({'columns': COLUMNS, 'actions': ACTIONS, 'layout': self.layoutName,
+                             'itemsizes': [array.array(typecode).itemsize for name, typecode in COLUMNS]}).encode()
+        shard = open(path, 'wb')
+        shard.write(MAGIC + _CHUNK_HEADER.pack(len(header)) + header)
+        self.shards.append(path)
+        self.bytesWritten += shard.tell()
+        return shard
+
+    def getStats(self):
+        return 'Trajectories: %d plies of %d games in %d shards (%.1f MB) under %s' % \
+            (self.rows, self.games + 1, len(self.shards), self.bytesWritten / 2.0**20, self.directory)
+
+def listShards(path):
+    "The shard files at path: a single shard, or every shard in a directory."
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*.traj')))
+    return [path]
+
+def readHeader(shard):
+    if shard.read(len(MAGIC)) != MAGIC:
+        raise Exception('%s is not a trajectory shard' % shard.name)
+    length, = _CHUNK_HEADER.unpack(shard.read(_CHUNK_HEADER.size))
+    header = json.loads(shard.read(length).decode())
+    for (name, typecode), itemsize in zip(header['columns'], header['itemsizes']):
+        if array.array(typecode).itemsize != itemsize:
+            raise Exception('Column %s of %s has %d-byte items; this platform uses %d' %
+                            (name, shard.name, itemsize, array.array(typecode).itemsize))
+    return header
+
+def iterChunks(path, columns=None):
+    """
+    Yields one dict per chunk from the shards at path, mapping column names
+    (all of them, or just columns) to arrays.  Only one chunk is in memory
+    at a time; skipped columns are never read.
+    """
+    for shardPath in listShards(path):
+        with open(shardPath, 'rb') as shard:
+            header = readHeader(shard)
+            while True:
+                count = shard.read(_CHUNK_HEADER.size)
+                if len(count) < _CHUNK_HEADER.size:
+                    break
+                rows, = _CHUNK_HEADER.unpack(count)
+                chunk = {}
+                for name, typecode in header['columns']:
+                    if columns != None and name not in columns:
+                        shard.seek(rows * array.array(typecode).itemsize, os.SEEK_CUR)
+                        continue
+                    values = array.array(typecode)
+                    values.fromfile(shard, rows)
+                    if sys.byteorder != 'little':
+                        values.byteswap()
+                    chunk[name] = values
+                yield chunk
+
+def iterPlies(path, columns=None):
+    "Yields one tuple per ply, in the order of columns (default COLUMN_NAMES)."
+    columns = columns or COLUMN_NAMES
+    for chunk in iterChunks(path, columns):
+        for row in zip(*[chunk[name] for name in columns]):
+            yield row
+
+def readCommand(argv):
+    from optparse import OptionParser
+    parser = OptionParser('USAGE: python trajectoryLog.py TRAJECTORY_DIR_OR_SHARD')
+    options, paths = parser.parse_args(argv)
+    if len(paths) != 1:
+        raise Exception('Give one trajectory directory or shard: ' + str(paths))
+    return paths[0]
+
+if __name__ == '__main__':
+    path = readCommand(sys.argv[1:])
+    plies, games, pacmanPoints, ghostPoints = 0, 0, 0.0, 0.0
+    for chunk in iterChunks(path, ['done', 'pacmanReward', 'ghostReward']):
+        plies += len(chunk['done'])
+        games += sum(chunk['done'])
+        pacmanPoints += sum(chunk['pacmanReward'])
+        ghostPoints += sum(chunk['ghostReward'])
+    print('%d shards, %d plies, %d finished games' % (len(listShards(path)), plies, games))
+    if plies > 0:
+        print('Points per ply: Pacman %.3f, ghost %.3f' % (pacmanPoints / plies, ghostPoints / plies))
@@ -29,6 +29,7 @@
 import sys
 import inspect
 import heapq, random
+import collections
 
 
 class FixedRandom:
@@ -221,6 +222,58 @@ class PriorityQueueWithFunction(PriorityQueue):
         "Adds an item to the queue with priority from the priority function"
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
+class LRUCache:
+    """
+      A dictionary-like cache holding at most maxSize entries.  When full,
+      the least recently used entry is evicted.  Lookups are counted so the
+      hit rate of the cache can be reported.
+    """
+    def __init__(self, maxSize=10000, onEvict=None):
+        "onEvict (key, value) is called for every entry pushed out of the cache"
+        self.maxSize = maxSize
+        self.onEvict = onEvict
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        "Returns the value stored for key and marks it as recently used"
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        "Stores value under key, evicting the least recently used entry if needed"
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxSize:
+            oldKey, oldValue = self.entries.popitem(last=False)
+            if self.onEvict != None:
+                self.onEvict(oldKey, oldValue)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        "Drops all entries and resets the hit and miss counters"
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hitRate(self):
+        "Fraction of lookups that were served from the cache"
+        lookups = self.hits + self.misses
+        if lookups == 0: return 0.0
+        return self.hits / float(lookups)
+
 
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
@@ -600,45 +653,91 @@ def pause():
 
 # code to handle timeouts
 #
-# FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# Every thread keeps a stack of the deadlines of the TimeoutFunctions it is
+# running, on the monotonic clock.  A nested call never runs past the
+# deadline of the call around it, and when it returns the timer is re-armed
+# for the enclosing deadline, so timeouts can nest.  On the main thread of a
+# process with SIGALRM, an interval timer (which takes fractions of a
+# second) interrupts the function when its time is up.  Other threads
+# cannot be interrupted: there the function may call checkTimeout() to stop
+# itself, and a call that returns late raises TimeoutFunctionException.
 #
 import signal
+import threading
 import time
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
+_TIMEOUTS = threading.local()
+
+def _getDeadlines():
+    if not hasattr(_TIMEOUTS, 'deadlines'):
+        _TIMEOUTS.deadlines = []
+    return _TIMEOUTS.deadlines
+
+def timeLeft():
+    """
+    Seconds left before the innermost TimeoutFunction running on this
+    thread times out (infinity if there is none).
+    """
+    deadlines = _getDeadlines()
+    if len(deadlines) == 0:
+        return float('inf')
+    return deadlines[-1] - time.monotonic()
+
+def checkTimeout():
+    """
+    Raises TimeoutFunctionException if the innermost TimeoutFunction on
+    this thread is out of time.  Long computations that may run off the
+    main thread should call it now and then.
+    """
+    if timeLeft() <= 0:
+        raise TimeoutFunctionException()
 
 class TimeoutFunction:
+    """
+    Wraps function so that calling it raises TimeoutFunctionException once
+    timeout seconds (a float) have passed.
+    """
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
 
     def handle_timeout(self, signum, frame):
+        remaining = timeLeft()
+        if remaining > 0:
+            # The alarm was set for a deadline that has since been popped
+            signal.setitimer(signal.ITIMER_REAL, remaining)
+            return
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
-            old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
+        deadlines = _getDeadlines()
+        deadline = time.monotonic() + self.timeout
+        if len(deadlines) > 0:
+            deadline = min(deadline, deadlines[-1])
+        interrupt = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        if interrupt and len(deadlines) == 0:
+            _TIMEOUTS.handler = signal.signal(signal.SIGALRM, self.handle_timeout) or signal.SIG_DFL
+        deadlines.append(deadline)
+        try:
             try:
+                if interrupt:
+                    signal.setitimer(signal.ITIMER_REAL, max(deadline - time.monotonic(), 1e-6))
                 result = self.function(*args, **keyArgs)
             finally:
-                signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
-        else:
-            startTime = time.time()
-            result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
-                self.handle_timeout(None, None)
+                if interrupt:
+                    signal.setitimer(signal.ITIMER_REAL, 0)
+        finally:
+            deadlines.pop()
+            if interrupt:
+                if len(deadlines) > 0:
+                    signal.setitimer(signal.ITIMER_REAL, max(timeLeft(), 1e-6))
+                else:
+                    signal.signal(signal.SIGALRM, _TIMEOUTS.handler)
+        if time.monotonic() >= deadline:
+            raise TimeoutFunctionException()
         return result
 
 
@@ -651,6 +750,35 @@ class WritableNull:
     def write(self, string):
         pass
 
+    def flush(self):
+        pass
+
+class RingBufferOutput:
+    """
+    A file-like object that keeps only the last maxChars characters written
+    to it, so muted agents cannot fill memory in very long games.
+    """
+    def __init__(self, maxChars=65536):
+        self.maxChars = maxChars
+        self.chunks = []
+        self.size = 0
+        self.dropped = 0  # Characters thrown away so far
+
+    def write(self, string):
+        self.chunks.append(string)
+        self.size += len(string)
+        # Trim only once the buffer has doubled, so writes stay cheap
+        if self.size > 2 * self.maxChars:
+            text = ''.join(self.chunks)[-self.maxChars:]
+            self.dropped += self.size - len(text)
+            self.chunks, self.size = [text], len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.chunks)[-self.maxChars:]
+
 def mutePrint():
     global _ORIGINAL_STDOUT, _ORIGINAL_STDERR, _MUTED
     if _MUTED: